@@ -0,0 +1,19 @@
+"""Benchmarks of CSD construction, including docval type and shape validation."""
+from .common import LAYOUTS, NUM_TIMES, data_shape, make_arrays, make_csd
+
+
+class Construct:
+    params = [NUM_TIMES, list(LAYOUTS)]
+    param_names = ['num_times', 'layout']
+
+    def setup(self, num_times, layout):
+        self.arrays = make_arrays(data_shape(num_times, layout))
+
+    def time_construct(self, num_times, layout):
+        make_csd(self.arrays)
+
+    def time_construct_with_profile(self, num_times, layout):
+        make_csd(self.arrays, write_profile='time-slice')
+
+    def peakmem_construct(self, num_times, layout):
+        make_csd(self.arrays)
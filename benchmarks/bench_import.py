@@ -0,0 +1,30 @@
+"""Benchmarks of the time to import ndx_csd in a new process, which is dominated by loading the namespace."""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+class Import:
+    params = ['uncached', 'cached']
+    param_names = ['namespace_cache']
+
+    def setup(self, namespace_cache):
+        self.tmpdir = tempfile.mkdtemp(prefix='ndx_csd_bench_')
+        if namespace_cache == 'uncached':
+            os.environ['NDX_CSD_NO_CACHE_DIR'] = '1'
+        else:
+            os.environ.pop('NDX_CSD_NO_CACHE_DIR', None)
+            os.environ['NDX_CSD_CACHE_DIR'] = self.tmpdir
+            # fill the cache from a new process, as in the timed runs
+            subprocess.run([sys.executable, '-c', 'import ndx_csd'], check=True)
+
+    def teardown(self, namespace_cache):
+        os.environ.pop('NDX_CSD_NO_CACHE_DIR', None)
+        os.environ.pop('NDX_CSD_CACHE_DIR', None)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def timeraw_import(self, namespace_cache):
+        # pynwb is imported in the setup code, so only the import of ndx_csd is timed
+        return 'import ndx_csd', 'import pynwb'
@@ -0,0 +1,121 @@
+"""Benchmarks of writing, reading and slicing CSD data in NWB files."""
+import numpy as np
+from pynwb import NWBHDF5IO
+
+from .common import LAYOUTS, NUM_TIMES, TemporaryDirectory, data_shape, make_arrays, make_csd, make_nwbfile, \
+    write_nwbfile
+
+
+class Write(TemporaryDirectory):
+    params = [NUM_TIMES, list(LAYOUTS), [None, 'time-slice', 'archive']]
+    param_names = ['num_times', 'layout', 'write_profile']
+    timeout = 300
+
+    def setup(self, num_times, layout, write_profile):
+        self.arrays = make_arrays(data_shape(num_times, layout))
+        self.setup_tmpdir()
+
+    def time_write(self, num_times, layout, write_profile):
+        write_nwbfile(self.path('write.nwb'), self.arrays, write_profile=write_profile)
+
+    def peakmem_write(self, num_times, layout, write_profile):
+        write_nwbfile(self.path('write.nwb'), self.arrays, write_profile=write_profile)
+
+
+class WriteZarr(TemporaryDirectory):
+    params = [NUM_TIMES, list(LAYOUTS), [1, 4]]
+    param_names = ['num_times', 'layout', 'number_of_jobs']
+    timeout = 300
+
+    def setup(self, num_times, layout, number_of_jobs):
+        try:
+            from hdmf_zarr import NWBZarrIO
+        except ImportError:
+            raise NotImplementedError('hdmf-zarr is not installed')
+        self.io_class = NWBZarrIO
+        self.arrays = make_arrays(data_shape(num_times, layout))
+        self.setup_tmpdir()
+
+    def time_write(self, num_times, layout, number_of_jobs):
+        nwbfile = make_nwbfile(make_csd(self.arrays, write_profile='time-slice', write_backend='zarr'))
+        with self.io_class(self.path('write.nwb.zarr'), mode='w') as io:
+            io.write(nwbfile, number_of_jobs=number_of_jobs)
+
+
+class Read(TemporaryDirectory):
+    """Reading all of data. A cold read opens the file each time, a warm read reuses an open file."""
+
+    params = [NUM_TIMES, list(LAYOUTS), [None, 'time-slice']]
+    param_names = ['num_times', 'layout', 'write_profile']
+    timeout = 300
+
+    def setup(self, num_times, layout, write_profile):
+        self.setup_tmpdir()
+        write_nwbfile(self.path('read.nwb'), make_arrays(data_shape(num_times, layout)), write_profile=write_profile)
+        self.io = NWBHDF5IO(self.path('read.nwb'), mode='r')
+        self.csd = self.io.read().processing['ecephys']['csd']
+        self.csd.data[:]
+
+    def teardown(self, *params):
+        self.io.close()
+        super().teardown(*params)
+
+    def time_read_cold(self, num_times, layout, write_profile):
+        with NWBHDF5IO(self.path('read.nwb'), mode='r') as io:
+            io.read().processing['ecephys']['csd'].data[:]
+
+    def time_read_warm(self, num_times, layout, write_profile):
+        self.csd.data[:]
+
+    def peakmem_read(self, num_times, layout, write_profile):
+        with NWBHDF5IO(self.path('read.nwb'), mode='r') as io:
+            io.read().processing['ecephys']['csd'].data[:]
+
+
+class Slice(TemporaryDirectory):
+    """Slicing data of a CSD read from a file, along time and along the electrodes."""
+
+    params = [NUM_TIMES, list(LAYOUTS), [None, 'time-slice', 'channel-trace']]
+    param_names = ['num_times', 'layout', 'write_profile']
+    timeout = 300
+
+    def setup(self, num_times, layout, write_profile):
+        self.setup_tmpdir()
+        write_nwbfile(self.path('slice.nwb'), make_arrays(data_shape(num_times, layout)),
+                      write_profile=write_profile)
+        self.io = NWBHDF5IO(self.path('slice.nwb'), mode='r')
+        self.csd = self.io.read().processing['ecephys']['csd']
+        self.num_times = num_times
+
+    def teardown(self, *params):
+        self.io.close()
+        super().teardown(*params)
+
+    def time_frame(self, num_times, layout, write_profile):
+        self.csd.data[num_times // 2]
+
+    def time_window(self, num_times, layout, write_profile):
+        self.csd.data[num_times // 4:num_times // 4 + min(num_times // 2, 1000)]
+
+    def time_trace(self, num_times, layout, write_profile):
+        self.csd.data[(slice(None), ) + (0, ) * len(LAYOUTS[layout])]
+
+    def time_sel(self, num_times, layout, write_profile):
+        self.csd.sel(time=slice(-0.01, 0.01))
+
+
+class WriteFloat64(TemporaryDirectory):
+    """Writing float64 data with each dtype conversion. With None, hdmf writes it as float64."""
+
+    params = [NUM_TIMES, list(LAYOUTS), [None, 'inplace', 'stream']]
+    param_names = ['num_times', 'layout', 'dtype_conversion']
+    timeout = 300
+
+    def setup(self, num_times, layout, dtype_conversion):
+        self.shape = data_shape(num_times, layout)
+        self.setup_tmpdir()
+
+    def peakmem_write(self, num_times, layout, dtype_conversion):
+        arrays = make_arrays(self.shape)
+        arrays['data'] = arrays['data'].astype(np.float64)
+        write_nwbfile(self.path('write.nwb'), arrays, dtype_conversion=dtype_conversion)
@@ -0,0 +1,81 @@
+"""Shapes and helpers shared by the benchmarks.
+
+Each benchmark is parametrized over the number of time samples and an electrode layout. Combinations whose data
+would not fit in the memory budget are skipped by raising NotImplementedError in setup, as asv expects.
+"""
+import datetime
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from pynwb import NWBHDF5IO, NWBFile
+
+from ndx_csd import CSD
+
+NUM_TIMES = [100, 10 ** 4, 10 ** 6]
+
+LAYOUTS = {
+    'probe': (32, ),
+    'array': (16, 16),
+    'volume': (16, 16, 16),
+}
+
+# the largest data, in bytes, that a benchmark allocates
+MAX_BYTES = 2 ** 28
+
+
+def data_shape(num_times, layout):
+    """Return the shape of the CSD data for ``num_times`` and ``layout``, or skip the benchmark if it is too large."""
+    shape = (num_times, ) + LAYOUTS[layout]
+    if int(np.prod(shape)) * 4 > MAX_BYTES:
+        raise NotImplementedError('data of shape %s is larger than the memory budget' % (shape, ))
+    return shape
+
+
+def make_arrays(shape):
+    """Return the arrays of a CSD of ``shape``, in float32 as in the spec."""
+    rng = np.random.default_rng(0)
+    arrays = {
+        'data': rng.standard_normal(shape, dtype=np.float32),
+        'time_from_event': np.linspace(-1, 1, num=shape[0], dtype=np.float32),
+    }
+    for name, n in zip(['rel_electrode_locations_x', 'rel_electrode_locations_y', 'rel_electrode_locations_z'],
+                       shape[1:]):
+        arrays[name] = np.linspace(0, 0.002, num=n, dtype=np.float32)
+    return arrays
+
+
+def make_csd(arrays, **kwargs):
+    return CSD(name='csd',
+               description='benchmark CSD',
+               num_trials=np.uint(50),
+               event_description='Stimulus onset',
+               electrodes_reference_frame='0 is the first electrode',
+               **arrays,
+               **kwargs)
+
+
+def make_nwbfile(csd):
+    nwbfile = NWBFile(session_description='benchmark', identifier='benchmark',
+                      session_start_time=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+    nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(csd)
+    return nwbfile
+
+
+def write_nwbfile(path, arrays, **kwargs):
+    with NWBHDF5IO(path, mode='w') as io:
+        io.write(make_nwbfile(make_csd(arrays, **kwargs)))
+
+
+class TemporaryDirectory:
+    """Mixin that gives each benchmark a scratch directory, removed in teardown."""
+
+    def setup_tmpdir(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='ndx_csd_bench_')
+
+    def teardown(self, *params):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
@@ -22,7 +22,7 @@ except Exception:
 
 setup_args = {
     'name': 'ndx-csd',
-    'version': '0.1.0',
+    'version': '0.2.0',
     'description': 'An NWB extension to add support for storing current source density analysis results',
     'long_description': readme,
     'long_description_content_type': readme_type,
@@ -31,8 +31,16 @@ setup_args = {
     'url': '',
     'license': 'BSD 3-Clause',
     'install_requires': [
-        'pynwb>=1.3.0'
+        'pynwb>=2.0.0',
+        'scipy'
     ],
+    'extras_require': {
+        'dask': ['dask[array]'],
+        'zarr': ['hdmf-zarr'],
+    },
+    'entry_points': {
+        'console_scripts': ['ndx-csd=ndx_csd.cli:main'],
+    },
     'packages': find_packages('src/pynwb'),
     'package_dir': {'': 'src/pynwb'},
     'package_data': {'ndx_csd': [
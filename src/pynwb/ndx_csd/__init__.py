@@ -1,26 +1,11 @@
-import os
-from pynwb import load_namespaces, get_class
+from pynwb import get_class  # noqa: F401
 
-# Set path of the namespace.yaml file to the expected install location
-ndx_csd_specpath = os.path.join(
-    os.path.dirname(__file__),
-    'spec',
-    'ndx-csd.namespace.yaml'
-)
-
-# If the extension has not been installed yet but we are running directly from
-# the git repo
-if not os.path.exists(ndx_csd_specpath):
-    ndx_csd_specpath = os.path.abspath(os.path.join(
-        os.path.dirname(__file__),
-        '..', '..', '..',
-        'spec',
-        'ndx-csd.namespace.yaml'
-    ))
-
-# Load the namespace
-load_namespaces(ndx_csd_specpath)
+# Load the namespace, from the cache of parsed spec files if possible. See ndx_csd.namespace.
+from .namespace import NAMESPACE_PATH as ndx_csd_specpath, load_namespace  # noqa: F401
+load_namespace()
 
 from .csd import CSD  # noqa: E402,F401
 # CSD = get_class('CSD', 'ndx-csd')
 from .io import csd as __csd   # noqa: E402,F401
+from .csd_set import CSDSet  # noqa: E402,F401
+from .accumulator import CSDAccumulator  # noqa: E402,F401
@@ -0,0 +1,275 @@
+import warnings
+
+import numpy as np
+from hdmf.utils import docval, getargs, popargs
+
+from . import compute
+from .csd import CSD
+from .moments import Moments
+
+
+class CSDAccumulator:
+    """Running average of event-aligned epochs from which a finished CSD can be emitted at any time.
+
+    Epochs are merged into a float64 running mean one batch at a time, so memory use does not grow with the number of
+    trials. Epochs can be added directly, or extracted from consecutive chunks of raw LFP together with event times.
+
+    With variance=True, the CSD of each epoch is also merged into per-cell moments in the same pass, from which the
+    CSD gets data_variance and, if the number of trials differs between cells, n_per_cell. Its data is then the mean of
+    the same moments, which skip NaN values, so that n_per_cell counts the trials averaged in data. An estimator is
+    then fitted to the first batch of epochs, e.g., a kCSD selects its regularization on it, and applied unchanged to
+    later batches. Accumulators that were fed disjoint epochs, e.g., in different worker processes, can be combined with
+    merge; pass them an estimator fitted beforehand, so that they share its parameters.
+    """
+
+    @docval(
+        {'doc': 'Timestamps representing time from event onset, in seconds, of each sample of an epoch.',
+         'name': 'time_from_event',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Distance between adjacent channels of a linear probe, in meters. If given, the epochs are LFP and '
+                'the CSD is computed as the negative second spatial derivative of their average. If neither spacing '
+                'nor an estimator is given, the epochs are already CSD.',
+         'name': 'spacing',
+         'type': (int, float)},
+        {'default': None,
+         'doc': 'Estimator to compute the CSD from the average of LFP epochs with, e.g., a StepiCSD, instead of the '
+                'standard second spatial derivative.',
+         'name': 'estimator',
+         'type': compute.CSDEstimator},
+        {'default': None,
+         'doc': 'Sampling rate of the raw LFP passed to add_lfp, in Hz.',
+         'name': 'rate',
+         'type': (int, float)},
+        {'default': 0.,
+         'doc': 'Time of the first sample passed to add_lfp, in seconds.',
+         'name': 'starting_time',
+         'type': (int, float)},
+        {'default': None,
+         'doc': 'Indices of the columns of the raw LFP passed to add_lfp to use, ordered along the probe. '
+                'Defaults to all columns.',
+         'name': 'channels',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': False,
+         'doc': 'Whether to also accumulate the variance of the CSD of the epochs in each cell. See ndx_csd.moments.',
+         'name': 'variance',
+         'type': bool})
+    def __init__(self, **kwargs):
+        time_from_event, spacing, estimator, rate = getargs('time_from_event', 'spacing', 'estimator', 'rate', kwargs)
+        starting_time, channels, variance = getargs('starting_time', 'channels', 'variance', kwargs)
+        self.time_from_event = np.asarray(time_from_event, dtype=np.float32)
+        self.spacing = spacing
+        self.estimator = estimator
+        self.rate = rate
+        self.starting_time = starting_time
+        self.channels = None if channels is None else np.asarray(channels)
+        self.num_trials = 0
+        self.__mean = None
+        self.__moments = Moments() if variance else None
+        self.__offsets = None if rate is None else np.round(self.time_from_event * rate).astype(np.int64)
+        self.__pending = np.empty(0, dtype=np.int64)
+        self.__carry = None
+        self.__next_sample = 0
+
+    @property
+    def mean(self):
+        """The running float64 mean of all epochs added so far, or None if no epochs have been added."""
+        return self.__mean
+
+    @property
+    def moments(self):
+        """The per-cell moments of the CSD of the epochs added so far, or None if variance is not accumulated."""
+        return self.__moments
+
+    def _epoch_csd(self, epochs):
+        """Return the CSD of each of ``epochs``."""
+        if self.estimator is not None:
+            lfp = epochs.reshape((-1, ) + epochs.shape[2:])
+            # parameters chosen from the data, e.g., a kCSD regularization, are chosen on the first batch and then kept,
+            # since a fitted estimator fits as itself, so that the moments pool CSDs of one operator
+            self.estimator = self.estimator.fit(lfp)
+            csd = self.estimator.estimate(lfp)
+            return csd.reshape(epochs.shape[:2] + csd.shape[1:])
+        if self.spacing is not None:
+            return compute.second_spatial_derivative(epochs, self.spacing, axis=2)
+        return epochs
+
+    @docval({'doc': 'A single epoch, with time along the first axis.',
+             'name': 'epoch',
+             'type': ('data', 'array_data')})
+    def add_epoch(self, **kwargs):
+        """Merge a single epoch into the running mean."""
+        epoch = getargs('epoch', kwargs)
+        self.add_epochs(np.asarray(epoch)[np.newaxis])
+
+    @docval({'doc': 'A batch of epochs, with trials along the first axis and time along the second axis.',
+             'name': 'epochs',
+             'type': ('data', 'array_data')})
+    def add_epochs(self, **kwargs):
+        """Merge a batch of epochs into the running mean, using the batch mean and count."""
+        epochs = np.asarray(getargs('epochs', kwargs))
+        if epochs.ndim < 2 or epochs.shape[1] != len(self.time_from_event):
+            raise ValueError("epochs must have shape (num_epochs, %d, ...), got %s"
+                             % (len(self.time_from_event), epochs.shape))
+        if len(epochs) == 0:
+            return
+        if self.__mean is not None and epochs.shape[1:] != self.__mean.shape:
+            raise ValueError("epochs of shape %s do not match previously added epochs of shape %s"
+                             % (epochs.shape[1:], self.__mean.shape))
+        self._merge_mean(len(epochs), epochs.mean(axis=0, dtype=np.float64))
+        if self.__moments is not None:
+            self.__moments.add(self._epoch_csd(epochs))
+
+    def _merge_mean(self, count, mean):
+        if self.__mean is None:
+            self.__mean = mean
+        else:
+            self.__mean += (mean - self.__mean) * (count / (self.num_trials + count))
+        self.num_trials += count
+
+    @docval({'doc': 'An accumulator with the same settings that was fed different epochs, e.g., in another process.',
+             'name': 'other',
+             'type': 'CSDAccumulator'})
+    def merge(self, **kwargs):
+        """Merge the mean, and the moments if variance is accumulated, of the epochs added to ``other``.
+
+        Events that ``other`` is still waiting for LFP of are not merged.
+        """
+        other = getargs('other', kwargs)
+        if (self.__moments is None) != (other.moments is None):
+            raise ValueError("cannot merge CSDAccumulators that differ in whether they accumulate variance")
+        if other.num_trials == 0:
+            return
+        if self.__mean is not None and other.mean.shape != self.__mean.shape:
+            raise ValueError("epochs of shape %s do not match previously added epochs of shape %s"
+                             % (other.mean.shape, self.__mean.shape))
+        self._merge_mean(other.num_trials, other.mean.copy())
+        if self.__moments is not None:
+            self.__moments.merge(other.moments)
+
+    @docval({'doc': 'The next chunk of raw LFP, with time along the first axis and channels along the second axis. '
+                    'Chunks must be passed in order and without gaps.',
+             'name': 'data',
+             'type': ('data', 'array_data')},
+            {'default': None,
+             'doc': 'Times of events, in seconds, to align to. Events may fall in this or any later chunk, as long as '
+                    'their window does not start before the data retained from the previous chunk.',
+             'name': 'event_times',
+             'shape': [None],
+             'type': ('data', 'array_data')})
+    def add_lfp(self, **kwargs):
+        """Add the epochs around events that are complete once this chunk of raw LFP is appended.
+
+        Only the samples still needed by pending events are retained between calls, so memory is bounded by the
+        chunk size plus one window.
+        """
+        data, event_times = popargs('data', 'event_times', kwargs)
+        if self.__offsets is None:
+            raise ValueError("the rate of the LFP must be given to the CSDAccumulator to use add_lfp")
+        offsets = self.__offsets
+        if event_times is not None:
+            onsets = compute.event_onsets(event_times, rate=self.rate, starting_time=self.starting_time)
+            self.__pending = np.sort(np.concatenate([self.__pending, onsets]))
+
+        data = np.asarray(data)
+        buffer = data if self.__carry is None else np.concatenate([self.__carry, data])
+        buffer_start = self.__next_sample - (0 if self.__carry is None else len(self.__carry))
+        self.__next_sample += len(data)
+
+        late = self.__pending + offsets[0] < buffer_start
+        if late.any():
+            warnings.warn("%d events were dropped because their epoch starts before the retained LFP"
+                          % np.count_nonzero(late))
+            self.__pending = self.__pending[~late]
+        ready = self.__pending + offsets[-1] < self.__next_sample
+        if ready.any():
+            self.add_epochs(compute.read_epochs(buffer, self.__pending[ready] - buffer_start, offsets, self.channels))
+            self.__pending = self.__pending[~ready]
+
+        # keep enough samples for pending events and for events passed with the next chunk that start in this one
+        keep_from = self.__next_sample - (offsets[-1] - offsets[0])
+        if len(self.__pending):
+            keep_from = min(keep_from, self.__pending[0] + offsets[0])
+        self.__carry = buffer[max(keep_from - buffer_start, 0):]
+
+    @docval(
+        {'doc': 'Description of what a time value of 0 represents, i.e., '
+                'what event is the CSD aligned to.',
+         'name': 'event_description',
+         'type': str},
+        {'default': 'CSD',
+         'doc': 'The name of the CSD object.',
+         'name': 'name',
+         'type': str},
+        {'default': None,
+         'doc': 'Description of the current source density analysis. Defaults to a description of how it was computed.',
+         'name': 'description',
+         'type': str},
+        {'default': '0 is the first channel used, +x points toward the last channel',
+         'doc': 'Description of what a value of 0 represents and what a positive value represents.',
+         'name': 'electrodes_reference_frame',
+         'type': str},
+        {'default': None,
+         'doc': "X-axis coordinates of CSD epochs, in meters. Ignored if spacing or an estimator was given.",
+         'name': 'rel_electrode_locations_x',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': "Y-axis coordinates of CSD epochs, in meters.",
+         'name': 'rel_electrode_locations_y',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': "Z-axis coordinates of CSD epochs, in meters.",
+         'name': 'rel_electrode_locations_z',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': False,
+         'doc': 'Whether the electrode locations of CSD epochs correspond to actual electrode locations. '
+                'Ignored if spacing or an estimator was given.',
+         'name': 'actual_electrodes',
+         'type': bool},
+        {'default': None,
+         'doc': "Write profile of the CSD: 'time-slice', 'channel-trace' or 'archive'. See ndx_csd.profiles.",
+         'name': 'write_profile',
+         'type': str},
+        {'default': False,
+         'doc': 'Whether data and time_from_event can grow along the time axis when written. See ndx_csd.append.',
+         'name': 'resizable',
+         'type': bool})
+    def to_csd(self, **kwargs):
+        """Create a CSD from the epochs added so far. The accumulator can keep accepting epochs afterwards."""
+        description = popargs('description', kwargs)
+        if self.num_trials == 0:
+            raise ValueError("no epochs have been added to the CSDAccumulator")
+        # with variance, data is the mean of the same moments, which skip NaN, so that n_per_cell describes data
+        moments = self.__moments
+        if self.estimator is not None:
+            data = self.estimator.estimate(self.__mean) if moments is None else None
+            kwargs.update(self.estimator.location_kwargs())
+            if description is None:
+                description = self.estimator.description
+        elif self.spacing is None:
+            data = self.__mean
+            if description is None:
+                description = "Trial-averaged CSD of %d epochs." % self.num_trials
+        else:
+            data = compute.second_spatial_derivative(self.__mean, self.spacing, axis=1) if moments is None else None
+            num_channels = self.__mean.shape[1] - 2
+            kwargs['rel_electrode_locations_x'] = (self.spacing * np.arange(1, num_channels + 1)).astype(np.float32)
+            kwargs['actual_electrodes'] = True
+            if description is None:
+                description = ("Standard CSD: negative second spatial derivative of the trial-averaged LFP, with %g m "
+                               "spacing between channels." % self.spacing)
+        if moments is not None:
+            data = np.where(moments.count > 0, moments.mean, np.nan)
+            kwargs['data_variance'] = moments.variance().astype(np.float32)
+            if np.any(moments.count != self.num_trials):
+                kwargs['n_per_cell'] = moments.count.astype(np.uint32)
+        return CSD(description=description,
+                   num_trials=np.uint(self.num_trials),
+                   data=data.astype(np.float32),
+                   time_from_event=self.time_from_event,
+                   **kwargs)
@@ -0,0 +1,138 @@
+"""Appending trials and time points to a CSD in an HDF5 file, without rewriting it.
+
+A CSD written with resizable=True stores data and time_from_event as datasets with maxshape None along the time axis.
+extend_time resizes them and writes the new time points, so only the chunks that hold new time points are written.
+merge_trials merges the average of newly recorded trials into the running mean of data, block by block of time points,
+as CSDAccumulator does in memory, and updates num_trials in place. It rewrites the values of data, but no other
+dataset, and works on any CSD in an HDF5 file, resizable or not.
+
+The summary of data, if the CSD has one, is kept up to date without reading data again: extend_time combines it with
+the summary of the new time points, and merge_trials summarizes the merged blocks as it writes them. The mean of an
+extended summary weights the old mean by the old number of time points, which is exact unless data holds NaN values.
+CSDs whose other datasets would have to be rewritten to stay consistent with data, i.e., quantized data, data_pyramid,
+data_variance, n_per_cell and trial_data, are refused. The file must be open for writing, e.g., with
+NWBHDF5IO(path, mode='a').
+
+Both functions take the CSD read from the file or its data. Given the CSD, merge_trials also updates its num_trials,
+which, unlike its datasets, is read into memory; given only data, the CSD must be read again to see the new num_trials.
+"""
+import h5py
+import numpy as np
+from hdmf.utils import get_data_shape
+
+from .summary import FIELDS, RunningSummary, Summary
+
+# raw data merged at once
+BLOCK_BYTES = 2 ** 26
+
+# datasets that appending to data would leave out of date
+_DEPENDENT = ('data_pyramid', 'data_variance', 'n_per_cell', 'trial_data')
+
+
+def _group(data, operation):
+    """Return the CSD, if ``data`` is one, its HDF5 dataset data and the group of the CSD, checking that ``operation``
+    can keep it consistent."""
+    csd = None
+    if not isinstance(data, h5py.Dataset) and isinstance(getattr(data, 'data', None), h5py.Dataset):
+        csd, data = data, data.data
+    if not isinstance(data, h5py.Dataset):
+        raise ValueError("can only %s the data of a CSD in an HDF5 file" % operation)
+    group = data.parent
+    found = [name for name in _DEPENDENT if name in group]
+    if 'conversion' in data.attrs or 'offset' in data.attrs:
+        found.insert(0, 'quantized data')
+    if found:
+        raise ValueError("cannot %s CSD '%s', which has %s" % (operation, group.name, ', '.join(found)))
+    return csd, data, group
+
+
+def _check_shape(group, values, data):
+    """Return the shape of ``values``, checking that it has the electrodes of ``data``."""
+    shape = tuple(get_data_shape(values))
+    if shape[1:] != data.shape[1:]:
+        raise ValueError("values of shape %s do not match data of CSD '%s' with %s electrodes"
+                         % (shape, group.name, data.shape[1:]))
+    return shape
+
+
+def _block_length(data, block_bytes):
+    return max(block_bytes // (8 * int(np.prod(data.shape[1:]))), 1)
+
+
+def _running_summary(group, num_times=None):
+    """Return a RunningSummary that continues the summary of the first ``num_times`` time points of the CSD of
+    ``group``, or a new one if ``num_times`` is None, or None if the CSD has no summary."""
+    if 'data_min' not in group:
+        return None
+    if num_times is None:
+        return RunningSummary(group['data'].shape[1:])
+    return RunningSummary.from_summary(Summary(*(group[field][...] for field in FIELDS)), num_times)
+
+
+def _write_summary(group, running):
+    if running is not None:
+        for field, statistic in zip(FIELDS, running.summary()):
+            group[field][...] = statistic
+
+
+def extend_time(data, values, time_from_event, block_bytes=BLOCK_BYTES):
+    """Append the time points ``values``, an array-like read block by block, at times ``time_from_event`` after the
+    last time point, to the resizable HDF5 dataset ``data`` of a CSD, or to the CSD itself, and to its
+    time_from_event. Return the new number of time points."""
+    _, data, group = _group(data, 'extend the time axis of')
+    times = group['time_from_event']
+    if data.maxshape[0] is not None or times.maxshape[0] is not None:
+        raise ValueError("data of CSD '%s' cannot grow along the time axis: write the CSD with resizable=True"
+                         % group.name)
+    shape = _check_shape(group, values, data)
+    time_from_event = np.asarray(time_from_event, dtype=np.float64).ravel()
+    if len(time_from_event) != shape[0]:
+        raise ValueError("%d time points were given with %d times" % (shape[0], len(time_from_event)))
+    if len(times) and len(time_from_event) and not time_from_event[0] > times[-1]:
+        raise ValueError("time_from_event must continue after the last time point of CSD '%s', %g s, got %g s"
+                         % (group.name, times[-1], time_from_event[0]))
+    start = data.shape[0]
+    running = _running_summary(group, start)
+    data.resize(start + shape[0], axis=0)
+    times.resize(start + shape[0], axis=0)
+    block = _block_length(data, block_bytes)
+    for offset in range(0, shape[0], block):
+        block_values = np.asarray(values[offset:offset + block], dtype=data.dtype)
+        data[start + offset:start + offset + block] = block_values
+        if running is not None:
+            running.add(block_values, time_from_event[offset:offset + block])
+    times[start:] = time_from_event
+    _write_summary(group, running)
+    return data.shape[0]
+
+
+def merge_trials(data, values, num_trials, block_bytes=BLOCK_BYTES):
+    """Merge ``values``, the average of ``num_trials`` new trials, an array-like read block by block, into the HDF5
+    dataset ``data`` of a CSD, the average of its num_trials trials, or into the CSD itself, and update num_trials,
+    also on the CSD if it is given. Return the new number of trials."""
+    csd, data, group = _group(data, 'merge trials into')
+    shape = _check_shape(group, values, data)
+    if shape[0] != data.shape[0]:
+        raise ValueError("values have %d time points but data of CSD '%s' has %d"
+                         % (shape[0], group.name, data.shape[0]))
+    count = int(group.attrs['num_trials'])
+    total = count + int(num_trials)
+    dtype = group.attrs['num_trials'].dtype
+    if total > np.iinfo(dtype).max:
+        raise ValueError("CSD '%s' cannot hold %d trials in its %s num_trials" % (group.name, total, dtype))
+    running = _running_summary(group)
+    times = group['time_from_event'] if running is not None else None
+    block = _block_length(data, block_bytes)
+    for start in range(0, data.shape[0], block):
+        mean = np.asarray(data[start:start + block], dtype=np.float64)
+        mean += (np.asarray(values[start:start + block], dtype=np.float64) - mean) * (int(num_trials) / total)
+        mean = mean.astype(data.dtype)
+        data[start:start + block] = mean
+        if running is not None:
+            running.add(mean, times[start:start + block])
+    group.attrs['num_trials'] = np.asarray(total, dtype=dtype)
+    _write_summary(group, running)
+    if csd is not None:
+        # num_trials is set once on a container, so it is replaced in its fields
+        csd.fields['num_trials'] = np.asarray(total, dtype=dtype)[()]
+    return total
@@ -0,0 +1,98 @@
+"""Cache of precomputed linear operators, e.g., inverted forward matrices, keyed by the geometry they depend on."""
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from .namespace import cache_dir
+
+
+def make_key(*parts):
+    """Return a hex digest identifying ``parts``, which may be strings, numbers, None, or arrays."""
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, (np.ndarray, list, tuple)):
+            array = np.ascontiguousarray(part, dtype=np.float64)
+            digest.update(repr(array.shape).encode())
+            digest.update(array.tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+class OperatorCache:
+    """An in-memory LRU cache of numpy arrays, optionally backed by a directory of .npy and .npz files.
+
+    The directory can be shared between processes and sessions. Files are written atomically, so concurrent writers
+    of the same key are safe.
+    """
+
+    def __init__(self, maxsize=32, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def get(self, key, compute):
+        """Return the value for ``key``, calling ``compute()`` to create it if it is not in memory or on disk.
+
+        Values are numpy arrays, or dicts of numpy arrays for operators made of several parts. They are returned
+        read-only since they are shared by all users of the cache.
+        """
+        if key in self.__entries:
+            self.__entries.move_to_end(key)
+            return self.__entries[key]
+        value = self.__load(key)
+        if value is None:
+            value = compute()
+            value = {k: np.asarray(v) for k, v in value.items()} if isinstance(value, dict) else np.asarray(value)
+            self.__save(key, value)
+        for array in (value.values() if isinstance(value, dict) else [value]):
+            array.setflags(write=False)
+        self.__entries[key] = value
+        while len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Remove all in-memory entries. Files in cache_dir are kept."""
+        self.__entries.clear()
+
+    def __path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def __load(self, key):
+        if self.cache_dir is None:
+            return None
+        if os.path.exists(self.__path(key, '.npy')):
+            return np.load(self.__path(key, '.npy'))
+        if os.path.exists(self.__path(key, '.npz')):
+            with np.load(self.__path(key, '.npz')) as f:
+                return dict(f)
+        return None
+
+    def __save(self, key, value):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        ext = '.npz' if isinstance(value, dict) else '.npy'
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=ext + '.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(value, dict):
+                np.savez(f, **value)
+            else:
+                np.save(f, value)
+        os.replace(tmp_path, self.__path(key, ext))
+
+
+# the cache shared by all estimators by default, persisted in the directory named by NDX_CSD_CACHE_DIR, if any, like
+# the namespace
+operator_cache = OperatorCache(cache_dir=cache_dir())
@@ -0,0 +1,239 @@
+"""Command-line interface of ndx-csd.
+
+``ndx-csd batch`` computes the event-aligned CSD of many NWB files in parallel, one file per worker process:
+
+    ndx-csd batch 'sessions/*.nwb' --window -0.05 0.1 --spacing 20e-6 --event-column stimulus
+
+For each file, it finds the LFP ElectricalSeries, computes one CSD per event type, i.e., per value of a column of the
+trials table, with CSD.from_lfp, and appends the CSDs to the 'ecephys' processing module of the file. Epochs are read
+batch_size at a time, and every worker exits after one file, so the memory used by a worker is bounded by one file
+and is returned to the system between files.
+
+Each file that is done is recorded in a log, one JSON object per line, and files that the log lists as done are
+skipped, so a batch that was interrupted resumes where it stopped when it is run again. Files that failed are
+reported, and not recorded as done, so that they are retried. Since a crash can come after a file was written but
+before it was logged, the file has the last word: CSDs that its 'ecephys' module already holds are skipped, or, with
+--replace, computed again and written in place of the old ones.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+DEFAULT_LOG = 'ndx-csd-batch.jsonl'
+
+
+def find_lfp(nwbfile, name=None):
+    """Return the ElectricalSeries of ``nwbfile`` named ``name`` or, by default, its only LFP ElectricalSeries, i.e.,
+    the only one in an LFP container or, if there is none, the only ElectricalSeries."""
+    from pynwb.ecephys import LFP, ElectricalSeries
+    series = [obj for obj in nwbfile.objects.values() if isinstance(obj, ElectricalSeries)]
+    if name is not None:
+        series = [obj for obj in series if obj.name == name]
+    elif any(isinstance(obj.parent, LFP) for obj in series):
+        series = [obj for obj in series if isinstance(obj.parent, LFP)]
+    if len(series) != 1:
+        raise ValueError("found %d %sElectricalSeries, expected one: pass --lfp to choose"
+                         % (len(series), 'LFP ' if name is None else "'%s' " % name))
+    return series[0]
+
+
+def event_groups(nwbfile, time_column='start_time', event_column=None):
+    """Return a dict from each event type to its times, the ``time_column`` of the trials of ``nwbfile`` with that
+    value of ``event_column``, or from None to the times of all trials if ``event_column`` is None."""
+    if nwbfile.trials is None:
+        raise ValueError("the file has no trials table")
+    times = np.asarray(nwbfile.trials[time_column].data[:], dtype=np.float64)
+    if event_column is None:
+        return {None: times}
+    values = np.asarray(nwbfile.trials[event_column].data[:])
+    return {value: times[values == value] for value in np.unique(values)}
+
+
+def _csd_name(value, options):
+    return options['name'] if value is None else '%s_%s' % (options['name'], value)
+
+
+def compute_csds(nwbfile, options, skip=()):
+    """Return the CSD of each event type of ``nwbfile``, computed with the batch ``options``, except those named in
+    ``skip``."""
+    from .csd import CSD
+    electrical_series = find_lfp(nwbfile, options['lfp'])
+    csds = []
+    for value, times in event_groups(nwbfile, options['time_column'], options['event_column']).items():
+        name = _csd_name(value, options)
+        if name in skip:
+            continue
+        if value is None:
+            event_description = "%s of all trials" % options['time_column']
+        else:
+            event_description = "%s of trials with %s %s" % (options['time_column'], options['event_column'], value)
+        csds.append(CSD.from_lfp(electrical_series=electrical_series, event_times=times, window=options['window'],
+                                 spacing=options['spacing'], event_description=event_description, name=name,
+                                 batch_size=options['batch_size'], write_profile=options['write_profile']))
+    return csds
+
+
+def process_file(path, options):
+    """Compute the CSDs of the NWB file at ``path`` and append them to its 'ecephys' processing module. CSDs that the
+    module already holds, e.g., because a previous run wrote them but crashed before logging the file, are skipped,
+    or, with the 'replace' option, computed again and written in place of the old ones. Return a record of the
+    result: the path, its status, 'done' or 'failed', the names of the CSDs that were written and skipped or the
+    error, and the time taken, in seconds."""
+    import h5py
+    from pynwb import NWBHDF5IO
+    start = time.perf_counter()
+    record = {'path': path}
+    replace = options.get('replace', False)
+    try:
+        # the file itself, not the log, tells which CSDs are done
+        with NWBHDF5IO(path, mode='r', load_namespaces=True) as io:
+            nwbfile = io.read()
+            module = nwbfile.processing.get('ecephys')
+            existing = set() if module is None else set(module.data_interfaces)
+            csds = compute_csds(nwbfile, options, skip=() if replace else existing)
+            groups = event_groups(nwbfile, options['time_column'], options['event_column'])
+            names = {_csd_name(value, options) for value in groups}
+        replaced = [csd.name for csd in csds if csd.name in existing]
+        if replaced:
+            with h5py.File(path, mode='a') as file:
+                for name in replaced:
+                    del file['processing/ecephys'][name]
+        if csds:
+            with NWBHDF5IO(path, mode='a', load_namespaces=True) as io:
+                nwbfile = io.read()
+                module = nwbfile.processing.get('ecephys')
+                if module is None:
+                    module = nwbfile.create_processing_module(name='ecephys', description='processed ecephys data')
+                for csd in csds:
+                    module.add(csd)
+                io.write(nwbfile)
+        record.update(status='done', csds=[csd.name for csd in csds],
+                      skipped=sorted(names & existing - set(replaced)))
+    except Exception as error:
+        record.update(status='failed', error='%s: %s' % (type(error).__name__, error))
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def _process(args):
+    return process_file(*args)
+
+
+def read_done(log):
+    """Return the paths that ``log`` records as done."""
+    if not os.path.exists(log):
+        return set()
+    done = set()
+    with open(log) as file:
+        for line in file:
+            # a line cut short by a crash is not a record
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'done':
+                done.add(record['path'])
+    return done
+
+
+def batch(pattern, options, jobs=None, log=DEFAULT_LOG, stream=None):
+    """Process the NWB files that match the glob ``pattern`` and are not recorded as done in ``log`` with ``jobs``
+    worker processes, by default one per CPU, or in this process if ``jobs`` is 1. Print and log a record of each
+    file as it finishes, to ``stream``, by default sys.stdout, and return the records."""
+    stream = sys.stdout if stream is None else stream
+    paths = sorted(os.path.abspath(path) for path in glob.glob(pattern, recursive=True))
+    done = read_done(log)
+    todo = [path for path in paths if path not in done]
+    print("%d files match %s, %d already done, %d to process" % (len(paths), pattern, len(paths) - len(todo),
+                                                                 len(todo)), file=stream)
+    jobs = min(jobs or os.cpu_count() or 1, max(len(todo), 1))
+    tasks = [(path, options) for path in todo]
+    records = []
+    if jobs == 1:
+        results = map(_process, tasks)
+        pool = None
+    else:
+        # a fresh process per file releases its memory, and spawning avoids forking open HDF5 files
+        pool = multiprocessing.get_context('spawn').Pool(jobs, maxtasksperchild=1)
+        results = pool.imap_unordered(_process, tasks)
+    try:
+        with open(log, 'a+') as file:
+            # end a line cut short by a crash, so that it does not swallow the next record
+            if file.tell() > 0:
+                file.seek(file.tell() - 1)
+                if file.read(1) != '\n':
+                    file.write('\n')
+            for record in results:
+                file.write(json.dumps(record) + '\n')
+                file.flush()
+                records.append(record)
+                if record['status'] == 'done':
+                    print("%s: %d CSDs in %.1f s, %d already in the file" % (record['path'], len(record['csds']),
+                                                                             record['seconds'], len(record['skipped'])),
+                          file=stream)
+                else:
+                    print("%s: failed after %.1f s: %s" % (record['path'], record['seconds'], record['error']),
+                          file=stream)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    failed = sum(record['status'] == 'failed' for record in records)
+    print("%d files done, %d failed" % (len(records) - failed, failed), file=stream)
+    return records
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='ndx-csd', description='Tools for current source density data in NWB.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    batch_parser = commands.add_parser(
+        'batch', help='compute and write the CSDs of many NWB files in parallel',
+        description="Compute the CSD of each event type of each NWB file that matches PATTERN and append it to the "
+                    "'ecephys' processing module of the file. Files that are done are logged and skipped when the "
+                    "command is run again.")
+    batch_parser.add_argument('pattern', help="glob of the NWB files, e.g., 'sessions/**/*.nwb'")
+    batch_parser.add_argument('--window', nargs=2, type=float, required=True, metavar=('START', 'STOP'),
+                              help='window around each event, in seconds, e.g., -0.05 0.1')
+    batch_parser.add_argument('--spacing', type=float, required=True,
+                              help='distance between adjacent channels, in meters')
+    batch_parser.add_argument('--event-column', default=None,
+                              help='column of the trials table whose values are the event types, one CSD each. '
+                                   'Defaults to one CSD of all trials')
+    batch_parser.add_argument('--time-column', default='start_time',
+                              help='column of the trials table with the event times (default: start_time)')
+    batch_parser.add_argument('--lfp', default=None,
+                              help='name of the LFP ElectricalSeries. Defaults to the only one in the file')
+    batch_parser.add_argument('--name', default='CSD',
+                              help='name of the CSD, followed by the event type if there are several (default: CSD)')
+    batch_parser.add_argument('--batch-size', type=int, default=256,
+                              help='number of epochs to read at once, which bounds memory (default: 256)')
+    batch_parser.add_argument('--write-profile', default=None, choices=['time-slice', 'channel-trace', 'archive'],
+                              help='write profile of the CSDs')
+    batch_parser.add_argument('--replace', action='store_true',
+                              help='compute CSDs that a file already holds again and replace them, instead of '
+                                   'skipping them')
+    batch_parser.add_argument('--jobs', type=int, default=None,
+                              help='number of worker processes (default: one per CPU)')
+    batch_parser.add_argument('--log', default=DEFAULT_LOG,
+                              help='log of the files that are done, to resume from (default: %s)' % DEFAULT_LOG)
+    return parser
+
+
+def main(argv=None):
+    """Run the ndx-csd command with the arguments ``argv``, by default those of the command line, and return its exit
+    status."""
+    args = _parser().parse_args(argv)
+    options = {'window': tuple(args.window), 'spacing': args.spacing, 'event_column': args.event_column,
+               'time_column': args.time_column, 'lfp': args.lfp, 'name': args.name, 'batch_size': args.batch_size,
+               'write_profile': args.write_profile, 'replace': args.replace}
+    records = batch(args.pattern, options, jobs=args.jobs, log=args.log)
+    return int(any(record['status'] == 'failed' for record in records))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Vectorized helpers for computing current source density (CSD) from local field potential (LFP) data.
+
+All functions operate on whole batches of trials and channels at once. Inputs may be numpy arrays or array-like
+datasets (e.g., h5py.Dataset) that support slicing along the first (time) axis. Epochs of dask arrays are read and
+summed in parallel by dask (see parallel).
+"""
+import warnings
+
+import numpy as np
+from hdmf.utils import docval, popargs
+
+from . import parallel
+
+
+def window_offsets(window, rate):
+    """Return the sample offsets covered by ``window``, a (start, stop) pair in seconds relative to an event.
+
+    Both endpoints are included, so a window of (-1, 1) at 50 Hz spans 101 samples.
+    """
+    start, stop = (int(np.round(w * rate)) for w in window)
+    if stop < start:
+        raise ValueError("window must be given as (start, stop) with start <= stop, got %s" % (tuple(window), ))
+    return np.arange(start, stop + 1)
+
+
+def event_onsets(event_times, rate=None, starting_time=0.0, timestamps=None):
+    """Convert event times, in seconds, to the indices of the nearest samples of a time series.
+
+    Either ``rate`` (and ``starting_time``) or ``timestamps`` must be given. Events outside the time series get
+    indices outside it, extrapolated from the rate or from the interval between the first or last two timestamps, so
+    that valid_onsets drops them, rather than the first or last sample.
+    """
+    event_times = np.asarray(event_times, dtype=np.float64).ravel()
+    if timestamps is None:
+        if rate is None:
+            raise ValueError("either rate or timestamps must be provided")
+        return np.round((event_times - starting_time) * rate).astype(np.int64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    right = np.clip(np.searchsorted(timestamps, event_times), 1, len(timestamps) - 1)
+    left = right - 1
+    nearer_left = (event_times - timestamps[left]) <= (timestamps[right] - event_times)
+    onsets = np.where(nearer_left, left, right).astype(np.int64)
+    before, after = event_times < timestamps[0], event_times > timestamps[-1]
+    onsets[before] = np.round((event_times[before] - timestamps[0]) / (timestamps[1] - timestamps[0]))
+    onsets[after] = len(timestamps) - 1 + np.round((event_times[after] - timestamps[-1])
+                                                   / (timestamps[-1] - timestamps[-2]))
+    return onsets
+
+
+def valid_onsets(onsets, offsets, num_samples):
+    """Return the onsets whose full epoch lies within a recording of ``num_samples`` samples.
+
+    A warning is raised if any onsets have to be dropped.
+    """
+    onsets = np.asarray(onsets, dtype=np.int64)
+    keep = (onsets + offsets[0] >= 0) & (onsets + offsets[-1] < num_samples)
+    if not keep.all():
+        warnings.warn("%d of %d events were dropped because their epoch extends beyond the recording"
+                      % (np.count_nonzero(~keep), len(onsets)))
+    return onsets[keep]
+
+
+def read_epochs(data, onsets, offsets, channels=None):
+    """Read the epochs around ``onsets`` from ``data`` as a (num_events, num_offsets, num_channels) array.
+
+    numpy arrays are gathered with a single fancy-indexing operation. Other array-likes (e.g., h5py.Dataset) are read
+    one contiguous hyperslab per event, since they do not support multi-dimensional fancy indexing.
+    """
+    if parallel.is_dask_array(data):
+        return parallel.read_epochs(data, onsets, offsets, channels)
+    if isinstance(data, np.ndarray):
+        epochs = data[onsets[:, np.newaxis] + offsets[np.newaxis, :]]
+    else:
+        epochs = np.stack([data[onset + offsets[0]:onset + offsets[-1] + 1] for onset in onsets])
+    if channels is not None:
+        epochs = epochs[..., channels]
+    return epochs
+
+
+def epoch_sum(data, onsets, offsets, channels=None, batch_size=256):
+    """Sum the epochs of ``data`` around ``onsets`` in float64, reading ``batch_size`` epochs at a time.
+
+    Peak memory is bounded by ``batch_size * len(offsets) * num_channels`` values regardless of the number of events.
+    Epochs of dask arrays are summed as one task graph, and dask bounds memory instead of ``batch_size``.
+    """
+    if parallel.is_dask_array(data):
+        return parallel.epoch_sum(data, onsets, offsets, channels)
+    total = None
+    for start in range(0, len(onsets), batch_size):
+        batch = read_epochs(data, onsets[start:start + batch_size], offsets, channels)
+        batch_sum = batch.sum(axis=0, dtype=np.float64)
+        total = batch_sum if total is None else total + batch_sum
+    return total
+
+
+def second_spatial_derivative(lfp, spacing, axis=-1):
+    """Compute the standard CSD estimate, the negative second spatial derivative of ``lfp`` along ``axis``.
+
+    The result is in volts/meters^2 if ``lfp`` is in volts and ``spacing`` is in meters, and is defined only at the
+    interior electrodes, so the output has two fewer elements along ``axis`` than the input.
+    """
+    return -np.diff(lfp, n=2, axis=axis) / spacing ** 2
+
+
+class CSDEstimator:
+    """Base class for estimators that compute the CSD from a trial-averaged LFP, for use with CSD.from_lfp and
+    CSDAccumulator."""
+
+    # description of the method, used as the default description of the CSD
+    description = None
+
+    def estimate(self, lfp):
+        """Estimate the CSD from ``lfp``, a (num_times, num_electrodes) array of potentials in volts."""
+        raise NotImplementedError
+
+    def location_kwargs(self):
+        """Return the CSD constructor arguments describing the locations of the estimated CSD."""
+        raise NotImplementedError
+
+    def fit(self, lfp):
+        """Return an estimator whose parameters that depend on the data are chosen from all of ``lfp``, so that it
+        estimates blocks of time points of ``lfp`` as it would estimate ``lfp`` as a whole. By default, this
+        estimator itself."""
+        return self
+
+    @docval(
+        {'doc': 'Trial-averaged LFP, in volts, with shape (num_times, num_electrodes).',
+         'name': 'lfp',
+         'shape': [None, None],
+         'type': ('data', 'array_data')},
+        {'doc': 'Timestamps representing time from event onset, in seconds.',
+         'name': 'time_from_event',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'doc': 'Number of trials used to compute the average LFP.',
+         'name': 'num_trials',
+         'type': np.unsignedinteger},
+        {'doc': 'Description of what a time value of 0 represents, i.e., '
+                'what event is the CSD aligned to.',
+         'name': 'event_description',
+         'type': str},
+        {'default': 'CSD',
+         'doc': 'The name of the CSD object.',
+         'name': 'name',
+         'type': str},
+        {'default': None,
+         'doc': 'Description of the current source density analysis. Defaults to a description of the estimator.',
+         'name': 'description',
+         'type': str},
+        {'default': '0 is the reference point of the electrode positions, +x points toward increasing positions',
+         'doc': 'Description of what a value of 0 represents and what a positive value represents.',
+         'name': 'electrodes_reference_frame',
+         'type': str},
+        {'default': None,
+         'doc': "Write profile of the CSD: 'time-slice', 'channel-trace' or 'archive'. See ndx_csd.profiles.",
+         'name': 'write_profile',
+         'type': str})
+    def to_csd(self, **kwargs):
+        """Estimate the CSD from a trial-averaged LFP and return it as a CSD object."""
+        from .csd import CSD  # csd imports this module
+        lfp, description = popargs('lfp', 'description', kwargs)
+        return CSD(description=self.description if description is None else description,
+                   data=self.estimate(lfp).astype(np.float32),
+                   **self.location_kwargs(),
+                   **kwargs)
@@ -1,7 +1,16 @@
+import warnings
+
 import numpy as np
-from hdmf.utils import docval, getargs
+from hdmf.common import DynamicTableRegion
+from hdmf.data_utils import AbstractDataChunkIterator, DataIO
+from hdmf.utils import docval, get_data_shape, get_docval, getargs, popargs
 from pynwb import register_class
 from pynwb.core import NWBDataInterface
+from pynwb.ecephys import ElectricalSeries
+
+from . import (compute, dtypes, events, interpolation, memmap, parallel, profiles, pyramid, quantize, selection,
+               spatial, spectral, summary, trial_sums)
+from .cache import OperatorCache
 
 
 @register_class('CSD', 'ndx-csd')
@@ -14,6 +23,23 @@ class CSD(NWBDataInterface):
                      'rel_electrode_locations_x',
                      'rel_electrode_locations_y',
                      'rel_electrode_locations_z',
+                     'rel_electrode_coordinates',
+                     'data_pyramid',
+                     'pyramid_factor',
+                     'pyramid_level_offsets',
+                     'trial_data',
+                     'trial_block_sums',
+                     'trial_block_size',
+                     {'name': 'trials', 'child': True},
+                     'data_variance',
+                     'n_per_cell',
+                     'frequency_band',
+                     'data_conversion',
+                     'data_offset',
+                     'data_min',
+                     'data_max',
+                     'data_mean',
+                     'data_peak_time',
                      'electrodes_reference_frame',
                      'actual_electrodes')
 
@@ -22,6 +48,10 @@ class CSD(NWBDataInterface):
     __data_unit = 'volts/meters^2'
     __rel_electrode_locations_unit = 'meters'
 
+    # the datasets that the spec stores as float32
+    __float_fields = ('data', 'time_from_event', 'rel_electrode_locations_x', 'rel_electrode_locations_y',
+                      'rel_electrode_locations_z', 'rel_electrode_coordinates', 'data_variance', 'trial_data')
+
     # these docval args were modified from the CSD.__init__.__docval__ generated by get_class
     @docval(
         {'doc': 'The name of this CSD object.',
@@ -35,12 +65,12 @@ class CSD(NWBDataInterface):
          'name': 'num_trials',
          'type': np.unsignedinteger},
         {'doc': 'The average current source density aligned to a particular '
-                'event, in volts/meters^2.',
+                'event, in volts/meters^2. A dask array is computed chunk by chunk, in parallel, while it is written.',
          'name': 'data',
          'shape': [[None, None],
                    [None, None, None],
                    [None, None, None, None]],
-         'type': ('data', 'array_data')},
+         'type': ('data', 'array_data', parallel.DaskArray)},
         {'doc': 'Timestamps representing time from event onset, in seconds.',
          'name': 'time_from_event',
          'shape': [None],
@@ -80,18 +110,225 @@ class CSD(NWBDataInterface):
                 'locations (where interpolation is used to compute the CSD '
                 'at the virtual locations).',
          'name': 'actual_electrodes',
-         'type': bool})
+         'type': bool},
+        {'default': None,
+         'doc': "Write profile that sets the chunking and compression of data, time_from_event and the electrode "
+                "locations: 'time-slice', 'channel-trace' or 'archive'. See ndx_csd.profiles.",
+         'name': 'write_profile',
+         'type': str},
+        {'default': 'hdf5',
+         'doc': "Backend the write profile is for: 'hdf5' or 'zarr' (requires hdmf-zarr).",
+         'name': 'write_backend',
+         'type': str},
+        {'default': False,
+         'doc': 'Whether to write data and time_from_event as HDF5 datasets that can grow along the time axis, so that '
+                'trials and time points can be appended later without rewriting them. See ndx_csd.append.',
+         'name': 'resizable',
+         'type': bool},
+        {'default': None,
+         'doc': "How to convert data, time_from_event and the electrode locations to float32 if they have another "
+                "dtype: None to leave them to hdmf when the file is written, 'inplace' to downcast data into its own "
+                "buffer chunk by chunk, 'stream' to convert data buffer by buffer while writing, or 'error' to raise "
+                "a TypeError. See ndx_csd.dtypes.",
+         'name': 'dtype_conversion',
+         'type': str},
+        {'default': None,
+         'doc': "Coordinates of each site, relative to the 'electrodes_reference_frame', in meters, for sites that do "
+                "not lie on a grid. data must then have shape (num_times, num_sites), and the "
+                "rel_electrode_locations_x/y/z must not be given.",
+         'name': 'rel_electrode_coordinates',
+         'shape': [[None, 1],
+                   [None, 2],
+                   [None, 3]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Decimation factor of the multi-resolution pyramid of data along the time axis. If data_pyramid is '
+                'not given, the pyramid is built from data with this factor. See ndx_csd.pyramid.',
+         'name': 'pyramid_factor',
+         'type': ('int', 'uint')},
+        {'default': None,
+         'doc': 'Multi-resolution pyramid of data along the time axis, with the minimum, maximum and mean of each '
+                'bin along the second dimension.',
+         'name': 'data_pyramid',
+         'shape': [[None, 3, None],
+                   [None, 3, None, None],
+                   [None, 3, None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Index of the first bin of each level of data_pyramid, followed by the total number of bins.',
+         'name': 'pyramid_level_offsets',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'The CSD of each trial, of which data is the average, in volts/meters^2. It is written in chunks that '
+                'each hold part of a single trial.',
+         'name': 'trial_data',
+         'shape': [[None, None, None],
+                   [None, None, None, None],
+                   [None, None, None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'The rows of the trials table of the trials in trial_data.',
+         'name': 'trials',
+         'type': DynamicTableRegion},
+        {'default': None,
+         'doc': 'Number of consecutive trials summed in each block of trial_block_sums. Defaults to 16 if '
+                'trial_block_sums is computed from trial_data. See ndx_csd.trial_sums.',
+         'name': 'trial_block_size',
+         'type': ('int', 'uint')},
+        {'default': None,
+         'doc': 'Sums of trial_data over consecutive blocks of trial_block_size trials. Computed from trial_data if '
+                'not given.',
+         'name': 'trial_block_sums',
+         'shape': [[None, None, None],
+                   [None, None, None, None],
+                   [None, None, None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Sample variance, with one delta degree of freedom, of the CSD of the trials in each cell of data, '
+                'in (volts/meters^2)^2. See ndx_csd.moments.',
+         'name': 'data_variance',
+         'shape': [[None, None],
+                   [None, None, None],
+                   [None, None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Number of trials in each cell of data and data_variance, if it differs between cells. Defaults to '
+                'num_trials for every cell.',
+         'name': 'n_per_cell',
+         'shape': [[None, None],
+                   [None, None, None],
+                   [None, None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Lower and upper edge, in Hz, of the frequency band that the CSD was filtered to.',
+         'name': 'frequency_band',
+         'shape': [2],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': "Integer type to store data as, 'int16' or 'int8', with data_conversion and data_offset computed from "
+                "the range of data. See ndx_csd.quantize.",
+         'name': 'quantize',
+         'type': str},
+        {'default': None,
+         'doc': 'Scale of quantized data: its values in volts/meters^2 are data * data_conversion + data_offset.',
+         'name': 'data_conversion',
+         'type': 'float'},
+        {'default': None,
+         'doc': 'Offset of quantized data: its values in volts/meters^2 are data * data_conversion + data_offset.',
+         'name': 'data_offset',
+         'type': 'float'},
+        {'default': False,
+         'doc': 'Whether to compute data_min, data_max, data_mean and data_peak_time from data if they are not given, '
+                'which takes an extra pass over data. They are not computed, with a warning, for data from a data '
+                'chunk iterator or a dask array, which is only read while it is written; add them after writing with '
+                'ndx_csd.summary.add_summary.',
+         'name': 'summarize',
+         'type': bool},
+        {'default': None,
+         'doc': 'Minimum of data over time at each electrode, in volts/meters^2.',
+         'name': 'data_min',
+         'shape': [[None], [None, None], [None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Maximum of data over time at each electrode, in volts/meters^2.',
+         'name': 'data_max',
+         'shape': [[None], [None, None], [None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Mean of data over time at each electrode, in volts/meters^2.',
+         'name': 'data_mean',
+         'shape': [[None], [None, None], [None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Time from event of the peak of data, the first time point with the largest absolute value, at each '
+                'electrode, in seconds.',
+         'name': 'data_peak_time',
+         'shape': [[None], [None, None], [None, None, None]],
+         'type': ('data', 'array_data')})
     def __init__(self, **kwargs):
         super().__init__(kwargs['name'])
 
         description, num_trials, data = getargs('description', 'num_trials', 'data', kwargs)
+        data = self.__from_dask(data, getargs('dtype_conversion', kwargs))
         time_from_event, event_description = getargs('time_from_event', 'event_description', kwargs)
         actual_electrodes, electrodes_reference_frame = getargs('actual_electrodes', 'electrodes_reference_frame',
                                                                 kwargs)
         rel_electrode_locations_x, rel_electrode_locations_y, rel_electrode_locations_z = getargs(
             'rel_electrode_locations_x', 'rel_electrode_locations_y', 'rel_electrode_locations_z', kwargs)
+        write_profile, write_backend = getargs('write_profile', 'write_backend', kwargs)
+        rel_electrode_coordinates = getargs('rel_electrode_coordinates', kwargs)
+        data_pyramid, pyramid_factor, pyramid_level_offsets = getargs('data_pyramid', 'pyramid_factor',
+                                                                      'pyramid_level_offsets', kwargs)
+        self.__check_lengths(kwargs['name'], data, time_from_event,
+                             [rel_electrode_locations_x, rel_electrode_locations_y, rel_electrode_locations_z])
+        if rel_electrode_coordinates is not None:
+            self.__check_sites(kwargs['name'], data, rel_electrode_coordinates,
+                               [rel_electrode_locations_x, rel_electrode_locations_y, rel_electrode_locations_z])
+        if data_pyramid is None and pyramid_factor is not None:
+            source = self.__scaled_source(data, *getargs('data_conversion', 'data_offset', kwargs))
+            if isinstance(source, AbstractDataChunkIterator):
+                raise ValueError("cannot build the pyramid of CSD '%s' from a data chunk iterator: add it after "
+                                 "writing with ndx_csd.pyramid.add_pyramid" % kwargs['name'])
+            data_pyramid, pyramid_level_offsets = pyramid.build_pyramid(source, pyramid_factor)
+        elif data_pyramid is not None and (pyramid_factor is None or pyramid_level_offsets is None):
+            raise ValueError("data_pyramid of CSD '%s' needs pyramid_factor and pyramid_level_offsets"
+                             % kwargs['name'])
+        trial_data, trials, trial_block_size, trial_block_sums = getargs('trial_data', 'trials', 'trial_block_size',
+                                                                         'trial_block_sums', kwargs)
+        if trial_data is not None:
+            self.__check_trials(kwargs['name'], num_trials, data, trial_data, trials)
+            source = trial_data.data if isinstance(trial_data, DataIO) else trial_data
+            if trial_block_sums is None and not isinstance(source, AbstractDataChunkIterator):
+                trial_block_size = trial_sums.BLOCK_SIZE if trial_block_size is None else trial_block_size
+                trial_block_sums = trial_sums.block_sums(source, trial_block_size)
+        if trial_block_sums is not None and trial_block_size is None:
+            raise ValueError("trial_block_sums of CSD '%s' needs trial_block_size" % kwargs['name'])
+        data_variance, n_per_cell = getargs('data_variance', 'n_per_cell', kwargs)
+        for field, values in (('data_variance', data_variance), ('n_per_cell', n_per_cell)):
+            if values is not None and tuple(get_data_shape(values)) != tuple(get_data_shape(data)):
+                raise ValueError("%s of CSD '%s' has shape %s but data has shape %s"
+                                 % (field, kwargs['name'], tuple(get_data_shape(values)), tuple(get_data_shape(data))))
+        quantize_dtype, data_conversion, data_offset = getargs('quantize', 'data_conversion', 'data_offset', kwargs)
+        statistics = getargs('data_min', 'data_max', 'data_mean', 'data_peak_time', kwargs)
+        if getargs('summarize', kwargs) and all(values is None for values in statistics):
+            statistics = self.__summarize(kwargs['name'], data, time_from_event, data_conversion, data_offset)
+        if quantize_dtype is not None:
+            if data_conversion is not None or data_offset is not None:
+                raise ValueError("CSD '%s' cannot quantize data that is already quantized with data_conversion and "
+                                 "data_offset" % kwargs['name'])
+            source = data.data if isinstance(data, DataIO) else data
+            if isinstance(source, AbstractDataChunkIterator):
+                raise ValueError("CSD '%s' cannot quantize data from a data chunk iterator, since finding its range "
+                                 "takes a separate pass" % kwargs['name'])
+            data, data_conversion, data_offset = quantize.quantize(source, quantize_dtype)
+        quantized = data_conversion is not None or data_offset is not None
+        dtype_conversion = getargs('dtype_conversion', kwargs)
+        layout = profiles.WRITE_PROFILES.get(write_profile, {'layout': 'balanced'})['layout']
+        # quantized data is stored as the integers it is given as
+        float_values = [dtypes.convert(kwargs['name'], field, values, dtype_conversion, layout)
+                        for field, values in zip(self.__float_fields, (None if quantized else data, time_from_event,
+                                                                       rel_electrode_locations_x,
+                                                                       rel_electrode_locations_y,
+                                                                       rel_electrode_locations_z,
+                                                                       rel_electrode_coordinates, data_variance,
+                                                                       trial_data))]
+        if dtype_conversion is None:
+            dtypes.warn_conversion(kwargs['name'], float_values)
+        if quantized:
+            float_values[0] = data
+        trial_data = profiles.wrap_by_trial(float_values.pop(), write_profile, write_backend)
+        resizable = getargs('resizable', kwargs)
+        if write_profile is not None or resizable:
+            float_values = [profiles.wrap_dataset(values, write_profile, write_backend,
+                                                  resizable and field in ('data', 'time_from_event'))
+                            for field, values in zip(self.__float_fields, float_values)]
+            data_pyramid = profiles.wrap_dataset(data_pyramid, write_profile, write_backend)
+            n_per_cell = profiles.wrap_dataset(n_per_cell, write_profile, write_backend)
+        (data, time_from_event, rel_electrode_locations_x, rel_electrode_locations_y, rel_electrode_locations_z,
+         rel_electrode_coordinates, data_variance) = float_values
         self.description = description
-        self.num_trials = num_trials
+        self.num_trials = self.__spec_num_trials(kwargs['name'], num_trials)
         self.data = data
         self.time_from_event = time_from_event
         self.event_description = event_description
@@ -100,6 +337,152 @@ class CSD(NWBDataInterface):
         self.rel_electrode_locations_x = rel_electrode_locations_x
         self.rel_electrode_locations_y = rel_electrode_locations_y
         self.rel_electrode_locations_z = rel_electrode_locations_z
+        self.rel_electrode_coordinates = rel_electrode_coordinates
+        self.data_pyramid = data_pyramid
+        self.pyramid_factor = None if pyramid_factor is None else np.uint32(pyramid_factor)
+        self.pyramid_level_offsets = pyramid_level_offsets
+        self.trial_data = trial_data
+        self.trials = trials
+        self.trial_block_size = None if trial_block_sums is None else np.uint32(trial_block_size)
+        self.trial_block_sums = trial_block_sums
+        self.data_variance = data_variance
+        self.n_per_cell = n_per_cell
+        frequency_band = getargs('frequency_band', kwargs)
+        self.frequency_band = None if frequency_band is None else np.asarray(frequency_band, dtype=np.float32)
+        self.data_conversion = np.float32(1. if data_conversion is None else data_conversion) if quantized else None
+        self.data_offset = np.float32(0. if data_offset is None else data_offset) if quantized else None
+        self.data_min, self.data_max, self.data_mean, self.data_peak_time = statistics
+        self.__site_index = None
+        self.__summary = None
+
+    @staticmethod
+    def __from_dask(data, dtype_conversion):
+        """If data is a dask array, return an iterator that computes it one buffer at a time, converting it to float32
+        with the 'inplace' and 'stream' conversions, since a dask array is never computed as a whole."""
+        if not parallel.is_dask_array(data):
+            return data
+        convert = dtype_conversion in ('inplace', 'stream')
+        return parallel.chunk_iterator(data, dtype=dtypes.SPEC_DTYPE if convert else None)
+
+    @staticmethod
+    def __scaled_source(data, data_conversion, data_offset):
+        """Return data without its DataIO, dequantized if data_conversion or data_offset is given and it is not a data
+        chunk iterator."""
+        source = data.data if isinstance(data, DataIO) else data
+        if isinstance(source, AbstractDataChunkIterator) or (data_conversion is None and data_offset is None):
+            return source
+        return quantize.Dequantized(source, 1. if data_conversion is None else data_conversion,
+                                    0. if data_offset is None else data_offset)
+
+    @staticmethod
+    def __summarize(name, data, time_from_event, data_conversion, data_offset):
+        """Return the summary of data, dequantized if data_conversion or data_offset is given, or no summary if data
+        is a data chunk iterator, e.g., from a dask array, which is read only once, when it is written."""
+        source = CSD.__scaled_source(data, data_conversion, data_offset)
+        if isinstance(source, AbstractDataChunkIterator):
+            warnings.warn("CSD '%s' has data from a data chunk iterator, which is only read when it is written, so it "
+                          "is not summarized: add the summary after writing with ndx_csd.summary.add_summary" % name)
+            return None, None, None, None
+        times = time_from_event.data if isinstance(time_from_event, DataIO) else time_from_event
+        return summary.summarize(source, times)
+
+    @staticmethod
+    def __spec_num_trials(name, num_trials):
+        """Return num_trials as the uint32 of the spec."""
+        if num_trials > np.iinfo(np.uint32).max:
+            raise ValueError("num_trials of CSD '%s' is %d, more than a uint32 can hold" % (name, num_trials))
+        return np.uint32(num_trials)
+
+    @staticmethod
+    def __check_trials(name, num_trials, data, trial_data, trials):
+        """Check that trial_data has num_trials trials of the shape of data, and that trials has a row for each."""
+        shape = get_data_shape(trial_data)
+        if shape[0] is not None and shape[0] != num_trials:
+            raise ValueError("trial_data of CSD '%s' has %d trials but num_trials is %d" % (name, shape[0], num_trials))
+        if tuple(shape[1:]) != tuple(get_data_shape(data)):
+            raise ValueError("trial_data of CSD '%s' has trials of shape %s but data has shape %s"
+                             % (name, tuple(shape[1:]), tuple(get_data_shape(data))))
+        if trials is not None and shape[0] is not None and len(trials) != shape[0]:
+            raise ValueError("trials of CSD '%s' has %d rows but trial_data has %d trials"
+                             % (name, len(trials), shape[0]))
+
+    @staticmethod
+    def __check_lengths(name, data, time_from_event, locations):
+        """Check that time_from_event and the electrode locations match the shape of data. For a data chunk
+        iterator, the shape is its maxshape, and dimensions of unlimited size (None) are not checked."""
+        shape = get_data_shape(data)
+        fields = [('time_from_event', time_from_event, 'time points')] + [
+            ('rel_electrode_locations_' + dim, loc, 'electrodes along ' + dim) for dim, loc in zip('xyz', locations)]
+        for (field, values, axis), length in zip(fields, shape):
+            if values is None:
+                continue
+            num_values = get_data_shape(values)[0]
+            if None not in (num_values, length) and num_values != length:
+                raise ValueError("%s of CSD '%s' has %d elements but data has %d %s"
+                                 % (field, name, num_values, length, axis))
+
+    @staticmethod
+    def __check_sites(name, data, coordinates, locations):
+        """Check that data of scattered sites has shape (num_times, num_sites) and no grid locations."""
+        if any(loc is not None for loc in locations):
+            raise ValueError("CSD '%s' cannot have both rel_electrode_coordinates and rel_electrode_locations_x/y/z"
+                             % name)
+        shape = get_data_shape(data)
+        if len(shape) != 2:
+            raise ValueError("data of CSD '%s' has %d dimensions, but must have shape (num_times, num_sites) when "
+                             "rel_electrode_coordinates is given" % (name, len(shape)))
+        num_sites = get_data_shape(coordinates)[0]
+        if None not in (num_sites, shape[1]) and num_sites != shape[1]:
+            raise ValueError("rel_electrode_coordinates of CSD '%s' has %d sites but data has %d sites"
+                             % (name, num_sites, shape[1]))
+
+    @property
+    def site_index(self):
+        """The spatial index of the rel_electrode_coordinates of the sites, built on first use. See
+        ndx_csd.spatial.SiteIndex."""
+        if self.rel_electrode_coordinates is None:
+            raise ValueError("CSD '%s' has no rel_electrode_coordinates: its sites lie on a grid" % self.name)
+        if self.__site_index is None:
+            self.__site_index = spatial.SiteIndex(self.rel_electrode_coordinates[:])
+        return self.__site_index
+
+    @property
+    def scaled_data(self):
+        """data in volts/meters^2: data itself, memory-mapped if possible, or, if it is quantized, a lazy view that
+        dequantizes the elements that are read. See ndx_csd.quantize."""
+        data = memmap.mapped_or_dataset(self.data)
+        if self.data_conversion is None:
+            return data
+        return quantize.Dequantized(data, self.data_conversion, self.data_offset)
+
+    @property
+    def data_summary(self):
+        """The minimum, maximum, mean and peak time of data at each electrode, as an ndx_csd.summary.Summary. They are
+        read from data_min, data_max, data_mean and data_peak_time on first use, which reads only those small
+        datasets, or, if the CSD has none, computed from data."""
+        if self.__summary is None:
+            stored = (self.data_min, self.data_max, self.data_mean, self.data_peak_time)
+            if any(values is None for values in stored):
+                self.__summary = summary.summarize(self.scaled_data, self.time_from_event)
+            else:
+                self.__summary = summary.Summary(*(np.asarray(values[()], dtype=np.float32) for values in stored))
+        return self.__summary
+
+    @property
+    def data_sem(self):
+        """Standard error of the mean of each cell of data, from data_variance and n_per_cell or num_trials, or None
+        if the CSD has no data_variance."""
+        if self.data_variance is None:
+            return None
+        count = int(self.num_trials) if self.n_per_cell is None else np.asarray(self.n_per_cell[:])
+        return np.sqrt(np.asarray(self.data_variance[:], dtype=np.float64) / count)
+
+    @property
+    def conversion_bytes(self):
+        """Number of bytes that will be allocated to convert the datasets of this CSD when it is written."""
+        # quantized data is written as the integers it holds
+        fields = self.__float_fields[1:] if self.data_conversion is not None else self.__float_fields
+        return sum(dtypes.conversion_bytes(getattr(self, field)) for field in fields)
 
     @property
     def time_unit(self):
@@ -112,3 +495,549 @@ class CSD(NWBDataInterface):
     @property
     def location_unit(self):
         return self.__rel_electrode_locations_unit
+
+    def _locations(self):
+        return [self.rel_electrode_locations_x, self.rel_electrode_locations_y, self.rel_electrode_locations_z]
+
+    @docval({'default': True,
+             'doc': 'Whether to return data as it is if it cannot be memory-mapped, e.g., because it is chunked or '
+                    'compressed, instead of raising a ValueError.',
+             'name': 'fallback',
+             'type': bool})
+    def as_memmap(self, **kwargs):
+        """Return data as a read-only numpy.memmap if it is stored contiguously and without filters in an HDF5 file.
+
+        Slices of the map are views that are read from the page cache when they are accessed, without a copy. The
+        map remains valid after the file is closed.
+        """
+        if getargs('fallback', kwargs):
+            return memmap.mapped_or_dataset(self.data)
+        return memmap.memmap_dataset(self.data)
+
+    def to_dask(self):
+        """Return data in volts/meters^2 as a dask array (requires dask), whose chunks are multiples of the chunks of
+        data on disk, dequantized lazily if it is quantized. Data that was given as a dask array and not yet written
+        is returned as it is."""
+        data = self.data.data if isinstance(self.data, DataIO) else self.data
+        if isinstance(data, AbstractDataChunkIterator):
+            if not parallel.is_dask_array(getattr(data, 'array', None)):
+                raise ValueError("CSD '%s' has data from a data chunk iterator: read it back from the file to get a "
+                                 "dask array" % self.name)
+            data = data.array.astype(data.dtype)
+        return parallel.to_dask(data, self.data_conversion, self.data_offset)
+
+    def _view(self, slices):
+        """Return a new CSD holding the hyperslab of data selected by one slice per axis. If data can be
+        memory-mapped, the hyperslab is a view of the map rather than a copy."""
+        shape = get_data_shape(self.data)
+        slices = list(slices)[:len(shape)] + [slice(None)] * (len(shape) - len(slices))
+        locations = [None if loc is None else np.asarray(loc[s]) for loc, s in zip(self._locations(), slices[1:])]
+        coordinates = self.rel_electrode_coordinates
+        variance, n_per_cell = self.data_variance, self.n_per_cell
+        return CSD(name=self.name,
+                   description=self.description,
+                   num_trials=self.num_trials,
+                   data=np.asarray(self.scaled_data[tuple(slices)]),
+                   data_variance=None if variance is None else np.asarray(variance[tuple(slices)]),
+                   n_per_cell=None if n_per_cell is None else np.asarray(n_per_cell[tuple(slices)]),
+                   time_from_event=np.asarray(self.time_from_event[slices[0]]),
+                   event_description=self.event_description,
+                   electrodes_reference_frame=self.electrodes_reference_frame,
+                   rel_electrode_locations_x=locations[0],
+                   rel_electrode_locations_y=locations[1] if len(locations) > 1 else None,
+                   rel_electrode_locations_z=locations[2] if len(locations) > 2 else None,
+                   actual_electrodes=self.actual_electrodes,
+                   rel_electrode_coordinates=None if coordinates is None else np.asarray(coordinates[slices[1]]),
+                   frequency_band=self.frequency_band)
+
+    def _check_axes(self, keys):
+        ndim = len(get_data_shape(self.data))
+        for name, key in list(zip(('x', 'y', 'z'), keys[1:]))[ndim - 1:]:
+            if key is not None:
+                raise ValueError("cannot select along %s: the data of CSD '%s' has %d dimensions"
+                                 % (name, self.name, ndim))
+
+    @docval(
+        {'default': None,
+         'doc': 'Index or slice of the time points to select.',
+         'name': 'time',
+         'type': (int, np.integer, slice)},
+        {'default': None,
+         'doc': 'Index or slice of the electrodes to select along the x-axis.',
+         'name': 'x',
+         'type': (int, np.integer, slice)},
+        {'default': None,
+         'doc': 'Index or slice of the electrodes to select along the y-axis.',
+         'name': 'y',
+         'type': (int, np.integer, slice)},
+        {'default': None,
+         'doc': 'Index or slice of the electrodes to select along the z-axis.',
+         'name': 'z',
+         'type': (int, np.integer, slice)})
+    def isel(self, **kwargs):
+        """Select a window of the CSD by position along each axis and return it as a new CSD.
+
+        Only the selected hyperslab of data is read. An integer selects a single position but keeps the dimension,
+        since CSD data must have 2, 3 or 4 dimensions. Slices with a negative step are not supported.
+        """
+        keys = getargs('time', 'x', 'y', 'z', kwargs)
+        self._check_axes(keys)
+        shape = get_data_shape(self.data)
+        return self._view([selection.index_slice(key, length) for key, length in zip(keys, shape)])
+
+    @docval(
+        {'default': None,
+         'doc': 'Time from event, in seconds, or slice of times to select. A slice selects all time points between '
+                'its start and stop, inclusive, and a number selects the nearest time point.',
+         'name': 'time',
+         'type': (int, float, slice)},
+        {'default': None,
+         'doc': 'X-axis coordinate, in meters, or slice of coordinates to select.',
+         'name': 'x',
+         'type': (int, float, slice)},
+        {'default': None,
+         'doc': 'Y-axis coordinate, in meters, or slice of coordinates to select.',
+         'name': 'y',
+         'type': (int, float, slice)},
+        {'default': None,
+         'doc': 'Z-axis coordinate, in meters, or slice of coordinates to select.',
+         'name': 'z',
+         'type': (int, float, slice)})
+    def sel(self, **kwargs):
+        """Select a window of the CSD by time from event and electrode coordinates and return it as a new CSD.
+
+        The monotonic time_from_event and rel_electrode_locations_* datasets are binary-searched, so when the CSD is
+        read from a file only a few of their elements are read, and the selection is read from data as one
+        hyperslab.
+        """
+        keys = getargs('time', 'x', 'y', 'z', kwargs)
+        self._check_axes(keys)
+        slices = []
+        for name, key, values in zip(('time', 'x', 'y', 'z'), keys, [self.time_from_event] + self._locations()):
+            if key is None:
+                slices.append(slice(None))
+                continue
+            if values is None:
+                raise ValueError("cannot select along %s: CSD '%s' has no coordinates along that axis"
+                                 % (name, self.name))
+            if isinstance(key, slice):
+                slices.append(selection.label_slice(values, key.start, key.stop))
+            else:
+                index = selection.nearest_index(values, key)
+                slices.append(slice(index, index + 1))
+        return self._view(slices)
+
+    @docval({'doc': 'Positions of the trials in trial_data to average, or a boolean mask over all trials, e.g., a '
+                    'column of the trials table read through trials.',
+             'name': 'trials',
+             'type': ('data', 'array_data')})
+    def trial_mean(self, **kwargs):
+        """Return the average of a subset of the trials in trial_data as a new CSD.
+
+        The sums of trial_block_sums are used for the blocks of trials that are mostly selected, so at most half of
+        the trials of each block are read. See ndx_csd.trial_sums.
+        """
+        if self.trial_data is None:
+            raise ValueError("CSD '%s' has no trial_data" % self.name)
+        num_trials = get_data_shape(self.trial_data)[0]
+        positions = trial_sums.trial_positions(getargs('trials', kwargs), num_trials)
+        if len(positions) == 0:
+            raise ValueError("cannot average an empty subset of the trials of CSD '%s'" % self.name)
+        block_size = None if self.trial_block_size is None else int(self.trial_block_size)
+        total = trial_sums.subset_sum(self.trial_data, self.trial_block_sums, block_size, positions)
+        locations = [None if loc is None else np.asarray(loc) for loc in self._locations()]
+        coordinates = self.rel_electrode_coordinates
+        return CSD(name=self.name,
+                   description=self.description,
+                   num_trials=np.uint(len(positions)),
+                   data=(total / len(positions)).astype(np.float32),
+                   time_from_event=np.asarray(self.time_from_event),
+                   event_description=self.event_description,
+                   electrodes_reference_frame=self.electrodes_reference_frame,
+                   rel_electrode_locations_x=locations[0],
+                   rel_electrode_locations_y=locations[1],
+                   rel_electrode_locations_z=locations[2],
+                   actual_electrodes=self.actual_electrodes,
+                   rel_electrode_coordinates=None if coordinates is None else np.asarray(coordinates),
+                   frequency_band=self.frequency_band)
+
+    @docval(
+        {'doc': 'Absolute CSD, in volts/meters^2, that a cell must reach to belong to a sink (data <= -threshold) '
+                'or a source (data >= threshold).',
+         'name': 'threshold',
+         'type': (int, float)},
+        {'default': 0.,
+         'doc': 'Minimum time between the first and last time points of an event, in seconds.',
+         'name': 'min_duration',
+         'type': (int, float)},
+        {'default': 0.,
+         'doc': 'Minimum extent of an event along at least one spatial axis, in meters.',
+         'name': 'min_extent',
+         'type': (int, float)},
+        {'default': 'sinks_sources',
+         'doc': 'The name of the returned table.',
+         'name': 'name',
+         'type': str})
+    def find_sinks_sources(self, **kwargs):
+        """Detect current sinks and sources as connected regions of data beyond threshold and return them as a
+        DynamicTable with one row per event.
+
+        Regions are connected across time and every spatial axis. data is read in blocks of time points, and each
+        block is labeled and reduced with scipy.ndimage. See ndx_csd.events for the columns of the table.
+        """
+        threshold, min_duration, min_extent, name = getargs('threshold', 'min_duration', 'min_extent', 'name', kwargs)
+        if threshold <= 0:
+            raise ValueError("threshold must be positive, not %g" % threshold)
+        if self.rel_electrode_coordinates is not None:
+            raise ValueError("cannot find sinks and sources of CSD '%s': its sites do not lie on a grid" % self.name)
+        locations = [None if loc is None else np.asarray(loc) for loc in self._locations()]
+        return events.event_table(self.scaled_data, np.asarray(self.time_from_event), locations, threshold,
+                                  min_duration=min_duration, min_extent=min_extent, name=name)
+
+    @docval(
+        {'doc': 'Minimum number of time bins to return, e.g., the width of the plot in pixels.',
+         'name': 'num_samples',
+         'type': int},
+        {'default': None,
+         'doc': 'Slice of times from event, in seconds, to return, with inclusive start and stop as in sel. Defaults '
+                'to all time points.',
+         'name': 'time',
+         'type': slice})
+    def overview(self, **kwargs):
+        """Return a window of the CSD at the coarsest resolution of data_pyramid that has at least num_samples bins.
+
+        Only the bins of that level in the window are read, so the cost depends on num_samples rather than on the
+        number of time points. If no level is fine enough, or the CSD has no pyramid, data itself is returned with a
+        bin size of 1.
+        """
+        num_samples, time = getargs('num_samples', 'time', kwargs)
+        num_times = get_data_shape(self.data)[0]
+        if time is None:
+            window = slice(0, num_times)
+        else:
+            window = selection.label_slice(self.time_from_event, time.start, time.stop)
+        num_levels = 0 if self.data_pyramid is None else len(self.pyramid_level_offsets) - 1
+        factor = None if self.pyramid_factor is None else int(self.pyramid_factor)
+        level = pyramid.choose_level(window.start, window.stop, num_samples, num_levels, factor)
+        if level == 0:
+            values = np.asarray(self.scaled_data[window])
+            return pyramid.Overview(np.asarray(self.time_from_event[window]), values, values, values, 1)
+        bin_size = factor ** level
+        first, last = window.start // bin_size, -(-window.stop // bin_size)
+        offset = int(self.pyramid_level_offsets[level - 1])
+        stats = np.asarray(self.data_pyramid[offset + first:offset + last])
+        times = np.asarray(self.time_from_event[first * bin_size:(last - 1) * bin_size + 1:bin_size])
+        return pyramid.Overview(times, stats[:, 0], stats[:, 1], stats[:, 2], bin_size)
+
+    @docval(
+        {'default': None,
+         'doc': 'X-axis coordinates to interpolate the CSD to, in meters. Defaults to the current ones.',
+         'name': 'x',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Y-axis coordinates to interpolate the CSD to, in meters. Defaults to the current ones.',
+         'name': 'y',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Z-axis coordinates to interpolate the CSD to, in meters. Defaults to the current ones.',
+         'name': 'z',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': 'linear',
+         'doc': "Interpolation method: 'linear', 'cubic' or 'spline'. See ndx_csd.interpolation.",
+         'name': 'method',
+         'type': str},
+        {'default': None,
+         'doc': 'The cache to store the weight matrices in. Defaults to the cache shared by all estimators.',
+         'name': 'cache',
+         'type': OperatorCache})
+    def resample(self, **kwargs):
+        """Interpolate the CSD to virtual electrodes at new coordinates and return it as a new CSD.
+
+        The interpolation weights of each axis are a sparse matrix that is computed once per pair of source and
+        target coordinates and cached, and are applied to all time points at once. The coordinates must lie within
+        the current ones, and the result has actual_electrodes=False.
+        """
+        targets, method, cache = getargs('x', 'y', 'z', kwargs), getargs('method', kwargs), getargs('cache', kwargs)
+        if self.rel_electrode_coordinates is not None:
+            raise ValueError("cannot resample CSD '%s': its sites do not lie on a grid" % self.name)
+        ndim = len(get_data_shape(self.data))
+        data = np.asarray(self.scaled_data[:])
+        locations = [None if loc is None else np.asarray(loc) for loc in self._locations()]
+        for axis, (name, target, source) in enumerate(zip('xyz', targets, locations), start=1):
+            if target is None:
+                continue
+            if axis >= ndim:
+                raise ValueError("cannot resample along %s: the data of CSD '%s' has %d dimensions"
+                                 % (name, self.name, ndim))
+            if source is None:
+                raise ValueError("cannot resample along %s: CSD '%s' has no coordinates along that axis"
+                                 % (name, self.name))
+            target = np.asarray(target)
+            matrix = interpolation.cached_weight_matrix(source, target, method, cache)
+            data = interpolation.apply_weight_matrix(data, matrix, axis)
+            locations[axis - 1] = target.astype(np.float32)
+        return CSD(name=self.name,
+                   description=self.description,
+                   num_trials=self.num_trials,
+                   data=data,
+                   time_from_event=np.asarray(self.time_from_event),
+                   event_description=self.event_description,
+                   electrodes_reference_frame=self.electrodes_reference_frame,
+                   rel_electrode_locations_x=locations[0],
+                   rel_electrode_locations_y=locations[1],
+                   rel_electrode_locations_z=locations[2],
+                   actual_electrodes=self.actual_electrodes and all(target is None for target in targets),
+                   frequency_band=self.frequency_band)
+
+    @classmethod
+    @docval(
+        {'doc': 'The LFP ElectricalSeries to compute the CSD from. Its columns must be ordered along the probe.',
+         'name': 'electrical_series',
+         'type': ElectricalSeries},
+        {'doc': 'Times of the events to align the LFP to, in seconds, in the same time base as the electrical series.',
+         'name': 'event_times',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'doc': 'Start and stop of the window around each event, in seconds, e.g., (-0.1, 0.5).',
+         'name': 'window',
+         'shape': [2],
+         'type': ('data', 'array_data')},
+        {'doc': 'Description of what a time value of 0 represents, i.e., '
+                'what event is the CSD aligned to.',
+         'name': 'event_description',
+         'type': str},
+        {'default': None,
+         'doc': 'Distance between adjacent channels, in meters, for the standard CSD estimate. '
+                'Required unless an estimator is given.',
+         'name': 'spacing',
+         'type': (int, float)},
+        {'default': None,
+         'doc': 'Estimator to compute the CSD from the trial-averaged LFP with, e.g., a StepiCSD, instead of the '
+                'standard second spatial derivative.',
+         'name': 'estimator',
+         'type': compute.CSDEstimator},
+        {'default': None,
+         'doc': 'Indices of the columns of the electrical series to use, ordered along the probe. '
+                'Defaults to all columns.',
+         'name': 'channels',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': 'CSD',
+         'doc': 'The name of this CSD object.',
+         'name': 'name',
+         'type': str},
+        {'default': None,
+         'doc': 'Description of the current source density analysis. Defaults to a description of how it was computed.',
+         'name': 'description',
+         'type': str},
+        {'default': '0 is the first channel used, +x points toward the last channel',
+         'doc': 'Description of what a value of 0 represents and what a positive value represents.',
+         'name': 'electrodes_reference_frame',
+         'type': str},
+        {'default': 256,
+         'doc': 'Number of epochs to read and sum at once. Peak memory is bounded by '
+                'batch_size * num_times * num_channels values.',
+         'name': 'batch_size',
+         'type': int},
+        {'default': None,
+         'doc': "Write profile of the CSD: 'time-slice', 'channel-trace' or 'archive'. See ndx_csd.profiles.",
+         'name': 'write_profile',
+         'type': str},
+        {'default': False,
+         'doc': 'Whether data and time_from_event can grow along the time axis when written. See ndx_csd.append.',
+         'name': 'resizable',
+         'type': bool},
+        {'default': None,
+         'doc': 'Lower and upper edge, in Hz, of a frequency band to filter the CSD to, e.g., (30, 80) for gamma. '
+                'See ndx_csd.spectral.',
+         'name': 'band',
+         'shape': [2],
+         'type': ('data', 'array_data')},
+        {'default': False,
+         'doc': 'Whether to read and sum the epochs with dask (requires dask), in parallel, from a dask array with '
+                'chunks that are multiples of the chunks of the LFP on disk. See ndx_csd.parallel.',
+         'name': 'use_dask',
+         'type': bool})
+    def from_lfp(cls, **kwargs):
+        """Compute the trial-averaged, event-aligned CSD of a linear probe from an LFP ElectricalSeries.
+
+        Epochs around each event are extracted and summed in batches, then the negative second spatial derivative
+        of the trial average is taken along the channel axis. Because both steps are linear, the derivative is only
+        computed once, on the average. Events whose window extends beyond the recording are dropped with a warning.
+        The standard CSD is defined at the interior channels, so the result has two fewer channels than the input.
+        If an estimator is given, it is applied to the trial-averaged LFP instead.
+
+        With use_dask, the epochs are summed in parallel by dask, and an estimator is applied lazily, block by block
+        of time points, so that its CSD is computed chunk by chunk while it is written. See ndx_csd.parallel.
+
+        With a band, the trial-averaged LFP is read with a margin of half the filter length around each window and
+        band-pass filtered by FFT overlap-save convolution, for all channels at once, which, by linearity, equals the
+        average of the band-limited CSD of each trial. Events whose margin extends beyond the recording are dropped.
+        The band is stored in frequency_band.
+        """
+        electrical_series, event_times, window, spacing, estimator = popargs('electrical_series', 'event_times',
+                                                                             'window', 'spacing', 'estimator', kwargs)
+        if spacing is None and estimator is None:
+            raise ValueError("either spacing or estimator must be provided")
+        channels, batch_size, description, band = popargs('channels', 'batch_size', 'description', 'band', kwargs)
+        use_dask = popargs('use_dask', kwargs)
+        data = parallel.to_dask(electrical_series.data) if use_dask else electrical_series.data
+
+        rate = _rate(electrical_series)
+        margin = 0 if band is None else spectral.num_taps(band, rate) // 2
+        offsets, onsets = _event_epochs(electrical_series, event_times, window, rate, margin)
+        if channels is not None:
+            channels = np.asarray(channels)
+        padded = np.arange(offsets[0] - margin, offsets[-1] + margin + 1)
+        lfp = compute.epoch_sum(data, onsets, padded, channels, batch_size) / len(onsets)
+        gain, offset = _lfp_gain(electrical_series, channels)
+        lfp = lfp * gain + offset
+        if band is not None:
+            lfp = spectral.band_filter(lfp, band, rate)
+            kwargs['frequency_band'] = band
+
+        csd_data, location_kwargs, default_description = _estimate(lfp, spacing, estimator, electrical_series.name,
+                                                                   lazy=use_dask)
+        kwargs.update(location_kwargs)
+        if description is None:
+            description = default_description
+            if band is not None:
+                description += " Band-pass filtered to %g-%g Hz." % tuple(band)
+        return cls(description=description,
+                   num_trials=np.uint(len(onsets)),
+                   data=csd_data.astype(np.float32),
+                   time_from_event=(offsets / rate).astype(np.float32),
+                   **kwargs)
+
+    @classmethod
+    @docval(*get_docval(from_lfp.__func__, 'electrical_series', 'event_times', 'window'),
+            {'doc': 'Lower and upper edge, in Hz, of each frequency band, e.g., [(4, 8), (8, 12), (30, 80)].',
+             'name': 'bands',
+             'shape': [None, 2],
+             'type': ('data', 'array_data')},
+            *get_docval(from_lfp.__func__, 'event_description', 'spacing', 'estimator', 'channels', 'name',
+                        'description', 'electrodes_reference_frame', 'batch_size', 'write_profile', 'use_dask'))
+    def time_frequency(cls, **kwargs):
+        """Compute the trial-averaged amplitude envelope of the CSD in each of several frequency bands and return
+        one CSD per band, named after name and the band, e.g., CSD_30-80Hz.
+
+        The CSD of each epoch, with a margin of half the longest filter on each side, is filtered with the complex
+        kernel of each band, whose absolute value is the amplitude envelope of the band. Each batch of epochs is
+        transformed once, by FFT overlap-save convolution, for all trials, channels and bands at once, and its
+        envelopes are summed, so the memory used is bounded by batch_size. See ndx_csd.spectral. With use_dask, the
+        epochs of each batch are read in parallel by dask. An estimator is fitted to the first batch, e.g., a kCSD
+        selects its regularization on it, and is applied unchanged to every batch.
+        """
+        electrical_series, event_times, window, bands = popargs('electrical_series', 'event_times', 'window', 'bands',
+                                                                kwargs)
+        spacing, estimator, channels, batch_size = popargs('spacing', 'estimator', 'channels', 'batch_size', kwargs)
+        name, description, use_dask = popargs('name', 'description', 'use_dask', kwargs)
+        if spacing is None and estimator is None:
+            raise ValueError("either spacing or estimator must be provided")
+
+        data = parallel.to_dask(electrical_series.data) if use_dask else electrical_series.data
+        rate = _rate(electrical_series)
+        bands = [spectral.check_band(band, rate) for band in bands]
+        kernels = spectral.band_kernels(bands, rate)
+        margin = kernels.shape[1] // 2
+        offsets, onsets = _event_epochs(electrical_series, event_times, window, rate, margin)
+        if channels is not None:
+            channels = np.asarray(channels)
+        num_channels = get_data_shape(electrical_series.data)[1] if channels is None else len(channels)
+        _, location_kwargs, default_description = _estimate(None, spacing, estimator, electrical_series.name,
+                                                            num_channels)
+        kwargs.update(location_kwargs)
+        padded = np.arange(offsets[0] - margin, offsets[-1] + margin + 1)
+        gain, offset = _lfp_gain(electrical_series, channels)
+        total = 0.
+        for start in range(0, len(onsets), batch_size):
+            epochs = compute.read_epochs(data, onsets[start:start + batch_size], padded, channels)
+            epochs = epochs * gain + offset
+            if estimator is not None:
+                lfp = epochs.reshape((-1, ) + epochs.shape[2:])
+                if start == 0:
+                    # parameters chosen from the data, e.g., a kCSD regularization, are chosen once, from the first
+                    # batch, so that all epochs are estimated alike
+                    estimator = estimator.fit(lfp)
+                epoch_csd = estimator.estimate(lfp)
+                epoch_csd = epoch_csd.reshape(epochs.shape[:2] + epoch_csd.shape[1:])
+            else:
+                epoch_csd = compute.second_spatial_derivative(epochs, spacing, axis=2)
+            total = total + np.abs(spectral.overlap_save(epoch_csd, kernels, axis=1)).sum(axis=1)
+        if estimator is not None:
+            default_description = estimator.description
+
+        csds = []
+        for band, band_total in zip(bands, total):
+            band_description = description
+            if band_description is None:
+                band_description = ("Trial-averaged amplitude envelope of the %g-%g Hz band of the CSD of each trial. "
+                                    "%s" % (band + (default_description, )))
+            csds.append(cls(name='%s_%g-%gHz' % ((name, ) + band),
+                            description=band_description,
+                            num_trials=np.uint(len(onsets)),
+                            data=(band_total / len(onsets)).astype(np.float32),
+                            time_from_event=(offsets / rate).astype(np.float32),
+                            frequency_band=band,
+                            **kwargs))
+        return csds
+
+
+def _rate(electrical_series):
+    """Return the sampling rate of ``electrical_series``, estimated from its timestamps if it has no rate."""
+    if electrical_series.rate is not None:
+        return electrical_series.rate
+    return 1. / np.median(np.diff(np.asarray(electrical_series.timestamps)))
+
+
+def _event_epochs(electrical_series, event_times, window, rate, margin=0):
+    """Return the sample offsets of ``window`` and the onsets of the events whose window, with ``margin`` more samples
+    on each side, lies within ``electrical_series``."""
+    offsets = compute.window_offsets(window, rate)
+    timestamps = None if electrical_series.rate is not None else np.asarray(electrical_series.timestamps)
+    onsets = compute.event_onsets(event_times, rate=rate, starting_time=electrical_series.starting_time,
+                                  timestamps=timestamps)
+    padded = np.arange(offsets[0] - margin, offsets[-1] + margin + 1)
+    onsets = compute.valid_onsets(onsets, padded, len(electrical_series.data))
+    if len(onsets) == 0:
+        raise ValueError("no events have a full window within ElectricalSeries '%s'" % electrical_series.name)
+    return offsets, onsets
+
+
+def _lfp_gain(electrical_series, channels):
+    """Return the gain, overall or per channel, and the offset that convert the data of ``electrical_series`` to
+    volts."""
+    gain = electrical_series.conversion
+    if electrical_series.channel_conversion is not None:
+        channel_conversion = np.asarray(electrical_series.channel_conversion)
+        gain = gain * (channel_conversion if channels is None else channel_conversion[channels])
+    return gain, getattr(electrical_series, 'offset', 0.)
+
+
+def _estimate(lfp, spacing, estimator, series_name, num_channels=None, lazy=False):
+    """Return the CSD of ``lfp``, or None if it is None, the constructor arguments describing its locations and its
+    default description, with ``estimator`` or the standard CSD for channels ``spacing`` apart. If ``lazy``, the CSD
+    of an estimator is a dask array that computes it block by block of time points, with the estimator fitted to all
+    of ``lfp``."""
+    if estimator is not None:
+        if lfp is None:
+            csd_data = None
+        elif lazy:
+            # parameters chosen from the data, e.g., a kCSD regularization, must not be chosen again for each block
+            estimator = estimator.fit(lfp)
+            csd_data = parallel.map_time_blocks(estimator.estimate, lfp)
+        else:
+            csd_data = estimator.estimate(lfp)
+        return csd_data, estimator.location_kwargs(), estimator.description
+    num_channels = lfp.shape[1] if lfp is not None else num_channels
+    if num_channels < 3:
+        raise ValueError("at least 3 channels are needed to compute the second spatial derivative")
+    csd_data = None if lfp is None else compute.second_spatial_derivative(lfp, spacing, axis=1)
+    location_kwargs = {'rel_electrode_locations_x': (spacing * np.arange(1, num_channels - 1)).astype(np.float32),
+                       'actual_electrodes': True}
+    description = ("Standard CSD: negative second spatial derivative of the trial-averaged LFP from ElectricalSeries "
+                   "'%s', with %g m spacing between channels." % (series_name, spacing))
+    return csd_data, location_kwargs, description
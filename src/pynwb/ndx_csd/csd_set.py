@@ -0,0 +1,330 @@
+import numpy as np
+from hdmf.utils import docval, get_data_shape, getargs, popargs
+from pynwb import register_class
+from pynwb.core import NWBDataInterface
+
+from . import memmap
+from .csd import CSD
+
+
+@register_class('CSDSet', 'ndx-csd')
+class CSDSet(NWBDataInterface):
+    """The CSDs of many conditions that share the same time axis and electrode locations, stored in one data array.
+
+    Compared to one CSD group per condition, all conditions are written and read as a single dataset, and building
+    or reading the file traverses a single group.
+    """
+
+    __nwbfields__ = ('description',
+                     'num_trials',
+                     'data',
+                     'time_from_event',
+                     'event_description',
+                     'rel_electrode_locations_x',
+                     'rel_electrode_locations_y',
+                     'rel_electrode_locations_z',
+                     'electrodes_reference_frame',
+                     'actual_electrodes',
+                     'rel_electrode_coordinates',
+                     'frequency_band',
+                     'data_variance',
+                     'n_per_cell')
+
+    # these are fixed values in the spec
+    __time_from_event_unit = 'seconds'
+    __data_unit = 'volts/meters^2'
+    __rel_electrode_locations_unit = 'meters'
+
+    @docval(
+        {'doc': 'The name of this CSDSet object.',
+         'name': 'name',
+         'type': str},
+        {'doc': 'Description of the current source density analysis, '
+                'including how it was computed.',
+         'name': 'description',
+         'type': str},
+        {'doc': 'Number of trials used to compute the average CSD of each condition.',
+         'name': 'num_trials',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'doc': 'The average current source density of each condition, aligned to the event of that condition, in '
+                'volts/meters^2.',
+         'name': 'data',
+         'shape': [[None, None, None],
+                   [None, None, None, None],
+                   [None, None, None, None, None]],
+         'type': ('data', 'array_data')},
+        {'doc': 'Timestamps representing time from event onset, in seconds, shared by all conditions.',
+         'name': 'time_from_event',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'doc': 'Description of what a time value of 0 represents for each condition, i.e., what event the CSD of '
+                'the condition is aligned to.',
+         'name': 'event_description',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'doc': 'Description of what a value of 0 (or (0,0) or (0,0,0)) '
+                'represents, e.g., top (most superior point) of a linear '
+                'probe, or most posterior and most left point of a 2D array. '
+                'This value should also describe what a positive value in '
+                'each dimension represents, e.g., +x is superior.',
+         'name': 'electrodes_reference_frame',
+         'type': str},
+        {'default': None,
+         'doc': "X-axis coordinates of CSD, relative to the "
+                "'electrodes_reference_frame', in meters.",
+         'name': 'rel_electrode_locations_x',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': "Y-axis coordinates of CSD, relative to the "
+                "'electrodes_reference_frame', in meters.",
+         'name': 'rel_electrode_locations_y',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': "Z-axis coordinates of CSD, relative to the "
+                "'electrodes_reference_frame', in meters.",
+         'name': 'rel_electrode_locations_z',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': False,
+         'doc': 'Whether the electrode locations provided correspond to '
+                'actual electrode locations as opposed to virtual electrode '
+                'locations (where interpolation is used to compute the CSD '
+                'at the virtual locations).',
+         'name': 'actual_electrodes',
+         'type': bool},
+        {'default': None,
+         'doc': "Coordinates of each site, relative to the 'electrodes_reference_frame', in meters, for sites that do "
+                "not lie on a grid. data must then have shape (num_conditions, num_times, num_sites), and the "
+                "rel_electrode_locations_x/y/z must not be given.",
+         'name': 'rel_electrode_coordinates',
+         'shape': [[None, 1],
+                   [None, 2],
+                   [None, 3]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Lower and upper edge, in Hz, of the frequency band that the CSDs were filtered to.',
+         'name': 'frequency_band',
+         'shape': [2],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Sample variance of the CSD of the trials in each cell of data, for each condition, in '
+                '(volts/meters^2)^2.',
+         'name': 'data_variance',
+         'shape': [[None, None, None],
+                   [None, None, None, None],
+                   [None, None, None, None, None]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Number of trials in each cell of data and data_variance, for each condition, if it differs between '
+                'cells.',
+         'name': 'n_per_cell',
+         'shape': [[None, None, None],
+                   [None, None, None, None],
+                   [None, None, None, None, None]],
+         'type': ('data', 'array_data')})
+    def __init__(self, **kwargs):
+        super().__init__(kwargs['name'])
+
+        description, num_trials, data = getargs('description', 'num_trials', 'data', kwargs)
+        time_from_event, event_description = getargs('time_from_event', 'event_description', kwargs)
+        actual_electrodes, electrodes_reference_frame = getargs('actual_electrodes', 'electrodes_reference_frame',
+                                                                kwargs)
+        rel_electrode_locations_x, rel_electrode_locations_y, rel_electrode_locations_z = getargs(
+            'rel_electrode_locations_x', 'rel_electrode_locations_y', 'rel_electrode_locations_z', kwargs)
+        data_variance, n_per_cell = getargs('data_variance', 'n_per_cell', kwargs)
+        rel_electrode_coordinates, frequency_band = getargs('rel_electrode_coordinates', 'frequency_band', kwargs)
+        num_conditions = get_data_shape(data)[0]
+        if rel_electrode_coordinates is not None:
+            self.__check_sites(data, rel_electrode_coordinates,
+                               [rel_electrode_locations_x, rel_electrode_locations_y, rel_electrode_locations_z])
+        for field, values in (('data_variance', data_variance), ('n_per_cell', n_per_cell)):
+            if values is not None and tuple(get_data_shape(values)) != tuple(get_data_shape(data)):
+                raise ValueError("%s of CSDSet '%s' has shape %s but data has shape %s"
+                                 % (field, self.name, tuple(get_data_shape(values)), tuple(get_data_shape(data))))
+        for field, values in (('num_trials', num_trials), ('event_description', event_description)):
+            length = get_data_shape(values)[0]
+            if None not in (num_conditions, length) and length != num_conditions:
+                raise ValueError("%s of CSDSet '%s' has %d elements but data has %d conditions"
+                                 % (field, self.name, length, num_conditions))
+        self.description = description
+        self.num_trials = num_trials
+        self.data = data
+        self.time_from_event = time_from_event
+        self.event_description = event_description
+        self.actual_electrodes = actual_electrodes
+        self.electrodes_reference_frame = electrodes_reference_frame
+        self.rel_electrode_locations_x = rel_electrode_locations_x
+        self.rel_electrode_locations_y = rel_electrode_locations_y
+        self.rel_electrode_locations_z = rel_electrode_locations_z
+        self.rel_electrode_coordinates = rel_electrode_coordinates
+        self.frequency_band = None if frequency_band is None else np.asarray(frequency_band, dtype=np.float32)
+        self.data_variance = data_variance
+        self.n_per_cell = n_per_cell
+
+    def __check_sites(self, data, rel_electrode_coordinates, locations):
+        """Check that data has one site per row of rel_electrode_coordinates, which excludes the locations."""
+        if any(loc is not None for loc in locations):
+            raise ValueError("CSDSet '%s' cannot have both rel_electrode_coordinates and rel_electrode_locations_x/y/z"
+                             % self.name)
+        shape = get_data_shape(data)
+        if len(shape) != 3:
+            raise ValueError("data of CSDSet '%s' must have shape (num_conditions, num_times, num_sites) when "
+                             "rel_electrode_coordinates is given, not %d dimensions" % (self.name, len(shape)))
+        num_sites = get_data_shape(rel_electrode_coordinates)[0]
+        if None not in (num_sites, shape[2]) and num_sites != shape[2]:
+            raise ValueError("rel_electrode_coordinates of CSDSet '%s' has %d sites but data has %d sites"
+                             % (self.name, num_sites, shape[2]))
+
+    @property
+    def time_unit(self):
+        return self.__time_from_event_unit
+
+    @property
+    def data_unit(self):
+        return self.__data_unit
+
+    @property
+    def location_unit(self):
+        return self.__rel_electrode_locations_unit
+
+    @property
+    def num_conditions(self):
+        return get_data_shape(self.data)[0]
+
+    def __len__(self):
+        return self.num_conditions
+
+    def index(self, event_description):
+        """Return the index of the condition with ``event_description``."""
+        for i, description in enumerate(self.event_description[:]):
+            if _as_str(description) == event_description:
+                return i
+        raise KeyError("no condition of CSDSet '%s' has event_description '%s'" % (self.name, event_description))
+
+    def __getitem__(self, key):
+        return self.get_csd(key)
+
+    def __iter__(self):
+        """Iterate over the CSD of each condition. All of data is read at once, unless it can be memory-mapped."""
+        data = memmap.mapped_or_dataset(self.data)[:]
+        num_trials, event_description = self.num_trials[:], self.event_description[:]
+        variance = [None] * len(data) if self.data_variance is None else self.data_variance[:]
+        n_per_cell = [None] * len(data) if self.n_per_cell is None else self.n_per_cell[:]
+        locations = self._locations()
+        for i in range(len(data)):
+            yield self._make_csd(i, data[i], num_trials[i], event_description[i], locations, variance[i],
+                                 n_per_cell[i])
+
+    @docval({'doc': 'Index or event_description of the condition.',
+             'name': 'key',
+             'type': (int, np.integer, str)})
+    def get_csd(self, **kwargs):
+        """Return the CSD of one condition. Only the data of that condition is read."""
+        key = getargs('key', kwargs)
+        index = self.index(key) if isinstance(key, str) else int(key)
+        if index < 0:
+            index += self.num_conditions
+        if not 0 <= index < self.num_conditions:
+            raise IndexError("index %d is out of bounds for CSDSet '%s' with %d conditions"
+                             % (key, self.name, self.num_conditions))
+        return self._make_csd(index, memmap.mapped_or_dataset(self.data)[index], self.num_trials[index],
+                              self.event_description[index], self._locations(),
+                              None if self.data_variance is None else self.data_variance[index],
+                              None if self.n_per_cell is None else self.n_per_cell[index])
+
+    def _locations(self):
+        return [None if loc is None else np.asarray(loc)
+                for loc in (self.rel_electrode_locations_x, self.rel_electrode_locations_y,
+                            self.rel_electrode_locations_z)]
+
+    def _make_csd(self, index, data, num_trials, event_description, locations, variance=None, n_per_cell=None):
+        return CSD(name='%s_%d' % (self.name, index),
+                   description=self.description,
+                   num_trials=np.uint64(num_trials),
+                   data=np.asarray(data),
+                   time_from_event=np.asarray(self.time_from_event),
+                   event_description=_as_str(event_description),
+                   electrodes_reference_frame=self.electrodes_reference_frame,
+                   rel_electrode_locations_x=locations[0],
+                   rel_electrode_locations_y=locations[1],
+                   rel_electrode_locations_z=locations[2],
+                   actual_electrodes=self.actual_electrodes,
+                   rel_electrode_coordinates=(None if self.rel_electrode_coordinates is None
+                                              else np.asarray(self.rel_electrode_coordinates)),
+                   frequency_band=self.frequency_band,
+                   data_variance=None if variance is None else np.asarray(variance),
+                   n_per_cell=None if n_per_cell is None else np.asarray(n_per_cell))
+
+    @classmethod
+    @docval(
+        {'doc': 'The CSDs to stack, one per condition. They must share time_from_event, the electrode locations or '
+                'coordinates, the electrodes reference frame, actual_electrodes and frequency_band.',
+         'name': 'csds',
+         'type': (list, tuple)},
+        {'default': 'CSDSet',
+         'doc': 'The name of the CSDSet.',
+         'name': 'name',
+         'type': str},
+        {'default': None,
+         'doc': 'Description of the analysis. Defaults to the description of the first CSD.',
+         'name': 'description',
+         'type': str})
+    def from_csds(cls, **kwargs):
+        """Stack the CSDs of several conditions into a CSDSet. data_variance is kept if every CSD has one. Quantized
+        data is stacked in volts/meters^2, since the conditions do not share a quantization."""
+        csds, name, description = popargs('csds', 'name', 'description', kwargs)
+        if not csds:
+            raise ValueError("at least one CSD is needed to create a CSDSet")
+        first = csds[0]
+        shared = _shared(first)
+        for csd in csds[1:]:
+            if get_data_shape(csd.data) != get_data_shape(first.data):
+                raise ValueError("the data of CSD '%s' has shape %s, expected %s"
+                                 % (csd.name, get_data_shape(csd.data), get_data_shape(first.data)))
+            different = [field for field, values in _shared(csd).items() if not _equal(values, shared[field])]
+            if different:
+                raise ValueError("CSD '%s' does not share the %s of CSD '%s'"
+                                 % (csd.name, ', '.join(different), first.name))
+        variances = [csd.data_variance for csd in csds]
+        has_variance = all(variance is not None for variance in variances)
+        if any(csd.n_per_cell is not None for csd in csds) and has_variance:
+            n_per_cell = np.stack([np.full(get_data_shape(csd.data), csd.num_trials, dtype=np.uint32)
+                                   if csd.n_per_cell is None else np.asarray(csd.n_per_cell) for csd in csds])
+        else:
+            n_per_cell = None
+        return cls(name=name,
+                   description=first.description if description is None else description,
+                   num_trials=np.array([csd.num_trials for csd in csds], dtype=np.uint32),
+                   data=np.stack([np.asarray(csd.scaled_data) for csd in csds]),
+                   event_description=[csd.event_description for csd in csds],
+                   data_variance=np.stack([np.asarray(v) for v in variances]) if has_variance else None,
+                   n_per_cell=n_per_cell,
+                   **shared)
+
+
+def _shared(csd):
+    """Return the constructor arguments of a CSDSet that the CSDs of all its conditions must share."""
+    locations = [None if loc is None else np.asarray(loc) for loc in csd._locations()]
+    coordinates = csd.rel_electrode_coordinates
+    return {'time_from_event': np.asarray(csd.time_from_event),
+            'rel_electrode_locations_x': locations[0],
+            'rel_electrode_locations_y': locations[1],
+            'rel_electrode_locations_z': locations[2],
+            'rel_electrode_coordinates': None if coordinates is None else np.asarray(coordinates),
+            'electrodes_reference_frame': csd.electrodes_reference_frame,
+            'actual_electrodes': bool(csd.actual_electrodes),
+            'frequency_band': csd.frequency_band}
+
+
+def _equal(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return np.array_equal(np.asarray(a), np.asarray(b))
+
+
+def _as_str(value):
+    """h5py can return variable-length strings as bytes."""
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
@@ -0,0 +1,119 @@
+"""Conversion of CSD arrays to the float32 dtype that the spec requires.
+
+By default, arrays of another dtype are kept as given. When the file is written, hdmf stores floats of higher
+precision, e.g., float64, as they are, which doubles the size of the datasets, and converts other dtypes, e.g.,
+integers, by allocating a converted copy of the whole array next to the original. The conversion policies of CSD
+store float32 without that copy, or fail fast:
+
+- 'inplace': downcast data into its own buffer, chunk by chunk, so the only extra memory is one chunk. The array
+  that was passed in is overwritten.
+- 'stream': wrap data in an ArrayChunkIterator that converts one buffer at a time while the file is written. The
+  array that was passed in is left untouched, and indexing the iterator reads converted slices of it, so the CSD can
+  still be sliced, e.g., with sel, before and after it is written.
+- 'error': raise a TypeError if any of the datasets is not float32.
+
+data_variance and trial_data, the CSD of each trial, are converted like data. time_from_event and the electrode
+locations are small, so with 'inplace' and 'stream' they are simply copied to float32. Quantized data, see
+ndx_csd.quantize, is stored as the integers it holds and is not converted.
+"""
+import warnings
+
+import numpy as np
+from hdmf.data_utils import AbstractDataChunkIterator, DataIO
+
+from . import profiles
+from .iterators import ArrayChunkIterator
+
+SPEC_DTYPE = np.dtype(np.float32)
+
+# the datasets that are as large as the CSD itself, which are converted without a full copy
+LARGE_FIELDS = ('data', 'data_variance', 'trial_data')
+
+CONVERSIONS = ('inplace', 'stream', 'error')
+
+# converting more than this many bytes when writing triggers a warning
+WARN_BYTES = 2 ** 30
+
+
+def conversion_bytes(data):
+    """Return the number of bytes that hdmf allocates to convert ``data`` when writing it. Floats of at least 32 bits
+    are written as they are, and data chunk iterators are converted buffer by buffer, so they need none."""
+    if isinstance(data, DataIO):
+        data = data.data
+    if data is None or isinstance(data, AbstractDataChunkIterator):
+        return 0
+    dtype = getattr(data, 'dtype', None)
+    if dtype is None:
+        return 0
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f' and dtype.itemsize >= SPEC_DTYPE.itemsize:
+        return 0
+    return int(np.prod(data.shape)) * max(dtype.itemsize, SPEC_DTYPE.itemsize)
+
+
+def excess_bytes(data):
+    """Return the number of bytes by which ``data`` is larger on disk than it would be as float32."""
+    if isinstance(data, DataIO):
+        data = data.data
+    dtype = getattr(data, 'dtype', None)
+    if dtype is None or isinstance(data, AbstractDataChunkIterator) or np.dtype(dtype).kind != 'f':
+        return 0
+    return int(np.prod(data.shape)) * max(np.dtype(dtype).itemsize - SPEC_DTYPE.itemsize, 0)
+
+
+def downcast_inplace(array, chunk_bytes=profiles.CHUNK_BYTES):
+    """Convert the C-contiguous, writeable ``array`` to float32 in its own buffer and return the float32 view.
+
+    Elements are converted in order, one chunk at a time. Since a float32 element is no larger than the element it
+    replaces, a chunk is only ever written over itself and elements that were already converted.
+    """
+    if getattr(array, 'dtype', None) == SPEC_DTYPE:
+        return array
+    if not (isinstance(array, np.ndarray) and array.flags.c_contiguous and array.flags.writeable
+            and array.dtype.kind in 'fiu' and array.dtype.itemsize >= SPEC_DTYPE.itemsize):
+        raise ValueError("cannot downcast %s in place: it must be a C-contiguous, writeable numpy array of real "
+                         "numbers with at least 4 bytes per element" % type(array).__name__)
+    source = array.reshape(-1)
+    target = array.view(np.uint8).reshape(-1)[:source.size * SPEC_DTYPE.itemsize].view(SPEC_DTYPE)
+    step = max(chunk_bytes // array.dtype.itemsize, 1)
+    for start in range(0, source.size, step):
+        # numpy buffers the source chunk where it overlaps the target
+        target[start:start + step] = source[start:start + step]
+    return target.reshape(array.shape)
+
+
+def convert(name, field, values, conversion, layout='balanced'):
+    """Apply ``conversion`` to ``values``, the ``field`` dataset of the CSD ``name``."""
+    if values is None or conversion is None or isinstance(values, DataIO):
+        return values
+    if conversion not in CONVERSIONS:
+        raise ValueError("unknown dtype conversion '%s', must be one of %s" % (conversion, list(CONVERSIONS)))
+    dtype = getattr(values, 'dtype', None)
+    if dtype is None:
+        dtype = np.asarray(values).dtype
+    if np.dtype(dtype) == SPEC_DTYPE:
+        return values
+    if conversion == 'error':
+        raise TypeError("%s of CSD '%s' has dtype %s, but the spec requires float32" % (field, name, dtype))
+    if isinstance(values, AbstractDataChunkIterator):
+        return values
+    if conversion == 'inplace' and field in LARGE_FIELDS:
+        return downcast_inplace(values)
+    if field not in LARGE_FIELDS or not hasattr(values, 'shape'):
+        return np.asarray(values, dtype=SPEC_DTYPE)
+    return ArrayChunkIterator(values, chunk_shape=profiles.chunk_shape(values.shape, SPEC_DTYPE.itemsize, layout),
+                              dtype=SPEC_DTYPE)
+
+
+def warn_conversion(name, values):
+    """Warn if writing ``values``, the float datasets of the CSD ``name``, needs or wastes more than WARN_BYTES."""
+    needed = sum(conversion_bytes(v) for v in values)
+    if needed >= WARN_BYTES:
+        warnings.warn("CSD '%s' is not float32 and will be converted when written, which needs %.1f MiB of additional "
+                      "memory. Pass dtype_conversion='inplace' or 'stream' to avoid the copy."
+                      % (name, needed / 2 ** 20))
+    excess = sum(excess_bytes(v) for v in values)
+    if excess >= WARN_BYTES:
+        warnings.warn("CSD '%s' has float64 data, which will be written as float64 and take %.1f MiB more than the "
+                      "float32 declared by the spec. Pass dtype_conversion='inplace' or 'stream' to write float32."
+                      % (name, excess / 2 ** 20))
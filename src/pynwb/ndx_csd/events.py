@@ -0,0 +1,172 @@
+"""Detection of current sinks and sources as connected regions of the time x space grid of CSD data.
+
+A sink is a region of cells, i.e., time points and electrodes, where the CSD is at most ``-threshold``, and a source
+one where it is at least ``threshold``. Cells are connected to their neighbours along each axis, so a region can
+extend over time, depth and, for 2D and 3D arrays, the other spatial axes.
+
+Data is read in blocks of time points. The cells of each block are labeled with scipy.ndimage.label, and the bounding
+box, size and peak of each label are reduced with scipy.ndimage, so no Python code runs per cell. A region that spans
+several blocks gets one label in each of them: labels that touch across the boundary between two blocks are joined
+with scipy.sparse.csgraph.connected_components, and their statistics merged, after the last block.
+"""
+import numpy as np
+from hdmf.common import DynamicTable, VectorData
+from hdmf.utils import get_data_shape
+
+from .memmap import mapped_or_dataset
+
+# raw data read at once when detecting events
+BLOCK_BYTES = 2 ** 26
+
+POLARITIES = ('sink', 'source')
+
+AXES = ('x', 'y', 'z')
+
+
+class _Regions:
+    """Per-label bounding box, size and peak of the regions of one polarity, over all blocks so far."""
+
+    def __init__(self, ndim):
+        self.ndim = ndim
+        self.num_labels = 0
+        self.lower, self.upper, self.size, self.peak, self.peak_index = [], [], [], [], []
+        self.links = []
+        self.last = None
+
+    def add(self, values, mask, start):
+        """Label ``mask``, the cells of polarity of the block of ``values`` starting at time point ``start``."""
+        # scipy.ndimage and scipy.sparse.csgraph are imported when needed, as they are slow to import
+        from scipy import ndimage
+        labels, count = ndimage.label(mask)
+        if count:
+            index = np.arange(1, count + 1)
+            offset = np.zeros(self.ndim, dtype=np.intp)
+            offset[0] = start
+            boxes = ndimage.find_objects(labels)
+            self.lower.append(np.array([[s.start for s in box] for box in boxes]) + offset)
+            self.upper.append(np.array([[s.stop for s in box] for box in boxes]) + offset)
+            self.size.append(np.bincount(labels.ravel(), minlength=count + 1)[1:])
+            magnitude = np.abs(values)
+            largest = np.concatenate([[np.inf], ndimage.maximum(magnitude, labels, index)])
+            # the first cell, in time order, of each label at its largest absolute value
+            flat = np.flatnonzero((labels > 0) & (magnitude == largest[labels]))
+            _, first = np.unique(labels.ravel()[flat], return_index=True)
+            positions = np.stack(np.unravel_index(flat[first], labels.shape), axis=1)
+            self.peak.append(values[tuple(positions.T)])
+            self.peak_index.append(positions + offset)
+        offset_labels = np.where(labels > 0, labels + self.num_labels, 0)
+        if self.last is not None:
+            touching = (self.last > 0) & (offset_labels[0] > 0)
+            self.links.append(np.stack([self.last[touching], offset_labels[0][touching]]))
+        self.last = offset_labels[-1]
+        self.num_labels += count
+
+    def merge(self):
+        """Return the bounding box, size, peak and peak position of each region, joining labels across blocks."""
+        from scipy import sparse
+        from scipy.sparse import csgraph
+        if self.num_labels == 0:
+            empty = np.empty((0, self.ndim), dtype=np.intp)
+            return empty, empty, np.empty(0, dtype=np.intp), np.empty(0), empty
+        lower, upper = np.concatenate(self.lower), np.concatenate(self.upper)
+        size, peak, peak_index = np.concatenate(self.size), np.concatenate(self.peak), np.concatenate(self.peak_index)
+        links = np.concatenate(self.links, axis=1) - 1 if self.links else np.empty((2, 0), dtype=np.intp)
+        graph = sparse.coo_matrix((np.ones(links.shape[1]), (links[0], links[1])),
+                                  shape=(self.num_labels, self.num_labels))
+        num_regions, region = csgraph.connected_components(graph, directed=False)
+        merged_lower = np.full((num_regions, self.ndim), np.iinfo(np.intp).max)
+        merged_upper = np.zeros((num_regions, self.ndim), dtype=np.intp)
+        np.minimum.at(merged_lower, region, lower)
+        np.maximum.at(merged_upper, region, upper)
+        merged_size = np.bincount(region, weights=size, minlength=num_regions).astype(np.intp)
+        # the label with the largest absolute peak of each region, the first one of ties, from a sort by region, then
+        # by absolute peak and then by label in reverse
+        order = np.lexsort((-np.arange(self.num_labels), np.abs(peak), region))
+        best = order[np.r_[np.flatnonzero(np.diff(region[order])), len(order) - 1]]
+        return merged_lower, merged_upper, merged_size, peak[best], peak_index[best]
+
+
+def _block_length(shape, block_bytes):
+    return max(block_bytes // (8 * int(np.prod(shape[1:]))), 1)
+
+
+def find_regions(data, threshold, block_bytes=BLOCK_BYTES):
+    """Return a dict with the ``lower`` and ``upper`` (exclusive) corners of the bounding box, ``size`` in cells,
+    ``peak`` and ``peak_index`` of each region of ``data`` of each polarity, keyed by polarity. ``data`` is read one
+    block of time points at a time."""
+    shape = get_data_shape(data)
+    data = mapped_or_dataset(data)
+    regions = {polarity: _Regions(len(shape)) for polarity in POLARITIES}
+    block = _block_length(shape, block_bytes)
+    for start in range(0, shape[0], block):
+        values = np.asarray(data[start:start + block], dtype=np.float64)
+        regions['sink'].add(values, values <= -threshold, start)
+        regions['source'].add(values, values >= threshold, start)
+    keys = ('lower', 'upper', 'size', 'peak', 'peak_index')
+    return {polarity: dict(zip(keys, regions[polarity].merge())) for polarity in POLARITIES}
+
+
+def _coordinates(values, indices):
+    """Return the coordinates at ``indices``, or the indices themselves if ``values`` is None."""
+    if values is None:
+        return indices.astype(np.float64)
+    return np.asarray(values, dtype=np.float64)[indices]
+
+
+def event_table(data, time_from_event, locations, threshold, min_duration=0., min_extent=0., name='sinks_sources',
+                description=None, block_bytes=BLOCK_BYTES):
+    """Return a DynamicTable of the sinks and sources of ``data`` that last at least ``min_duration`` seconds and
+    extend at least ``min_extent`` along one spatial axis, ordered by start time.
+
+    ``locations`` holds the coordinates of the electrodes along each spatial axis of data, or None for an axis without
+    coordinates, along which positions and extents are given in electrodes instead.
+    """
+    ndim = len(get_data_shape(data))
+    times = np.asarray(time_from_event, dtype=np.float64)
+    found = find_regions(data, threshold, block_bytes)
+    columns = {'polarity': [], 'start_time': [], 'stop_time': [], 'peak_time': [], 'peak_amplitude': [],
+               'num_cells': []}
+    for axis in AXES[:ndim - 1]:
+        columns.update({axis + '_min': [], axis + '_max': [], 'peak_' + axis: []})
+    for polarity in POLARITIES:
+        regions = found[polarity]
+        lower, upper, index = regions['lower'], regions['upper'] - 1, regions['peak_index']
+        start, stop = times[lower[:, 0]], times[upper[:, 0]]
+        spatial = [(_coordinates(loc, lower[:, axis]), _coordinates(loc, upper[:, axis]),
+                    _coordinates(loc, index[:, axis])) for axis, loc in enumerate(locations[:ndim - 1], start=1)]
+        extent = np.max([np.abs(high - low) for low, high, _ in spatial], axis=0) if len(start) else np.empty(0)
+        keep = (stop - start >= min_duration) & (extent >= min_extent)
+        columns['polarity'].append(np.full(keep.sum(), polarity, dtype=object))
+        columns['start_time'].append(start[keep])
+        columns['stop_time'].append(stop[keep])
+        columns['peak_time'].append(times[index[keep, 0]])
+        columns['peak_amplitude'].append(regions['peak'][keep])
+        columns['num_cells'].append(regions['size'][keep])
+        for axis, (low, high, peak) in zip(AXES, spatial):
+            columns[axis + '_min'].append(np.minimum(low, high)[keep])
+            columns[axis + '_max'].append(np.maximum(low, high)[keep])
+            columns['peak_' + axis].append(peak[keep])
+    columns = {key: np.concatenate(parts) for key, parts in columns.items()}
+    order = np.argsort(columns['start_time'], kind='stable')
+    docs = _column_docs()
+    return DynamicTable(
+        name=name,
+        description=description or ('current sinks and sources, i.e., connected regions of CSD data of at most '
+                                    '-%g and at least %g volts/meters^2' % (threshold, threshold)),
+        columns=[VectorData(name=key, description=docs[key], data=values[order].tolist())
+                 for key, values in columns.items()])
+
+
+def _column_docs():
+    docs = {'polarity': "'sink' or 'source'",
+            'start_time': 'time from event of the first time point of the event, in seconds',
+            'stop_time': 'time from event of the last time point of the event, in seconds',
+            'peak_time': 'time from event of the cell with the largest absolute CSD, in seconds',
+            'peak_amplitude': 'CSD at the cell with the largest absolute CSD, in volts/meters^2',
+            'num_cells': 'number of cells, i.e., time points and electrodes, of the event'}
+    for axis in AXES:
+        unit = ', in meters, or electrode index if the CSD has no %s-coordinates' % axis
+        docs.update({axis + '_min': 'smallest %s-coordinate of the event%s' % (axis, unit),
+                     axis + '_max': 'largest %s-coordinate of the event%s' % (axis, unit),
+                     'peak_' + axis: '%s-coordinate of the cell with the largest absolute CSD%s' % (axis, unit)})
+    return docs
@@ -0,0 +1,197 @@
+"""Inverse current source density (iCSD) estimators for linear probes (Pettersen et al., 2006).
+
+Each estimator models the CSD with a number of free parameters equal to the number of electrodes, builds the forward
+matrix F mapping those parameters to the potentials at the electrodes, and inverts it. The inverted operator depends
+only on the probe geometry and the source model, so it is computed once and stored in an OperatorCache keyed by the
+electrode positions, conductivities and source diameter. Estimating the CSD of a new session is then a single matrix
+multiplication.
+
+The spec fixes the unit of CSD data to volts/meters^2, so the estimators return the CSD divided by the conductivity
+of the tissue, which is the negative Laplacian of the potential.
+"""
+import numpy as np
+from hdmf.utils import docval, get_docval, getargs, popargs
+
+from .cache import OperatorCache, make_key, operator_cache
+from .compute import CSDEstimator
+
+
+def _disk_potential(u, radius):
+    """Potential at axial distance ``u`` from a disk of unit surface current density and radius ``radius``,
+    multiplied by 2 * conductivity."""
+    return np.sqrt(u ** 2 + radius ** 2) - np.abs(u)
+
+
+def _disk_potential_integral(u, radius):
+    """Antiderivative of _disk_potential with respect to ``u``."""
+    return 0.5 * (u * np.sqrt(u ** 2 + radius ** 2) + radius ** 2 * np.arcsinh(u / radius) - u * np.abs(u))
+
+
+class InverseCSD(CSDEstimator):
+    """Base class for iCSD estimators. Subclasses define the forward matrix of their source model."""
+
+    # whether the CSD is estimated at the electrode positions themselves
+    actual_electrodes = True
+    method = None
+
+    @docval(
+        {'doc': 'Positions of the electrodes along the probe, in meters, in increasing order. If top_conductivity '
+                'differs from conductivity, 0 must be the surface between the two media, with positive values in '
+                'the tissue.',
+         'name': 'electrode_positions',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': 0.3,
+         'doc': 'Conductivity of the tissue, in siemens/meter.',
+         'name': 'conductivity',
+         'type': (int, float)},
+        {'default': None,
+         'doc': 'Conductivity of the medium above the surface at position 0, in siemens/meter, handled with the '
+                'method of images. Defaults to the conductivity of the tissue, i.e., an infinite homogeneous medium.',
+         'name': 'top_conductivity',
+         'type': (int, float)},
+        {'default': 500e-6,
+         'doc': 'Diameter of the disk-shaped sources, in meters.',
+         'name': 'diameter',
+         'type': (int, float)},
+        {'default': None,
+         'doc': 'The cache to store the inverted operator in. Defaults to the cache shared by all estimators.',
+         'name': 'cache',
+         'type': OperatorCache})
+    def __init__(self, **kwargs):
+        electrode_positions, conductivity, top_conductivity, diameter, cache = getargs(
+            'electrode_positions', 'conductivity', 'top_conductivity', 'diameter', 'cache', kwargs)
+        electrode_positions = np.asarray(electrode_positions, dtype=np.float64)
+        if len(electrode_positions) < 2 or np.any(np.diff(electrode_positions) <= 0):
+            raise ValueError("electrode_positions must contain at least 2 strictly increasing values")
+        self.electrode_positions = electrode_positions
+        self.conductivity = conductivity
+        self.top_conductivity = conductivity if top_conductivity is None else top_conductivity
+        self.diameter = diameter
+        self.cache = operator_cache if cache is None else cache
+
+    @property
+    def locations(self):
+        """Positions at which the CSD is estimated, in meters."""
+        return self.electrode_positions
+
+    @property
+    def operator(self):
+        """The (num_locations, num_electrodes) matrix that maps potentials to CSD divided by conductivity."""
+        key = make_key(type(self).__name__, self.electrode_positions, self.conductivity, self.top_conductivity,
+                       self.diameter, *self._key_parts())
+        return self.cache.get(key, self._compute_operator)
+
+    @property
+    def description(self):
+        return ("%s iCSD (Pettersen et al., 2006) with conductivity %g S/m, top conductivity %g S/m and source "
+                "diameter %g m, divided by the conductivity."
+                % (self.method, self.conductivity, self.top_conductivity, self.diameter))
+
+    def location_kwargs(self):
+        return {'rel_electrode_locations_x': self.locations.astype(np.float32),
+                'actual_electrodes': self.actual_electrodes}
+
+    def estimate(self, lfp):
+        lfp = np.asarray(lfp)
+        if lfp.ndim != 2 or lfp.shape[1] != len(self.electrode_positions):
+            raise ValueError("lfp must have shape (num_times, %d), got %s" % (len(self.electrode_positions), lfp.shape))
+        return lfp @ self.operator.T
+
+    def _key_parts(self):
+        return ()
+
+    def _image_weight(self):
+        return (self.conductivity - self.top_conductivity) / (self.conductivity + self.top_conductivity)
+
+    def _forward_matrix(self):
+        raise NotImplementedError
+
+    def _compute_operator(self):
+        return np.linalg.inv(self._forward_matrix()) / self.conductivity
+
+
+class DeltaiCSD(InverseCSD):
+    """iCSD with infinitely thin disk sources at the electrode positions."""
+
+    method = 'Delta'
+
+    def _forward_matrix(self):
+        z = self.electrode_positions
+        radius = self.diameter / 2
+        # each disk stands for the tissue halfway to the neighboring electrodes
+        edges = np.concatenate([[1.5 * z[0] - 0.5 * z[1]], (z[1:] + z[:-1]) / 2, [1.5 * z[-1] - 0.5 * z[-2]]])
+        thickness = np.diff(edges)
+        potentials = (_disk_potential(z[:, np.newaxis] - z[np.newaxis, :], radius)
+                      + self._image_weight() * _disk_potential(z[:, np.newaxis] + z[np.newaxis, :], radius))
+        return potentials * thickness[np.newaxis, :] / (2 * self.conductivity)
+
+
+class StepiCSD(InverseCSD):
+    """iCSD with a CSD that is constant in cylinders centered on each electrode and extending halfway to its
+    neighbors."""
+
+    method = 'Step'
+
+    def _forward_matrix(self):
+        z = self.electrode_positions
+        radius = self.diameter / 2
+        edges = np.concatenate([[1.5 * z[0] - 0.5 * z[1]], (z[1:] + z[:-1]) / 2, [1.5 * z[-1] - 0.5 * z[-2]]])
+        lower, upper = edges[np.newaxis, :-1], edges[np.newaxis, 1:]
+        zj = z[:, np.newaxis]
+        direct = _disk_potential_integral(zj - lower, radius) - _disk_potential_integral(zj - upper, radius)
+        image = _disk_potential_integral(zj + upper, radius) - _disk_potential_integral(zj + lower, radius)
+        return (direct + self._image_weight() * image) / (2 * self.conductivity)
+
+
+class SplineiCSD(InverseCSD):
+    """iCSD with a CSD that is a natural cubic spline through its values at the electrodes, and zero outside of the
+    probe. The CSD is returned on a grid that subdivides each interval between electrodes."""
+
+    actual_electrodes = False
+    method = 'Spline'
+
+    @docval(*get_docval(InverseCSD.__init__),
+            {'default': 10,
+             'doc': 'Number of output locations per interval between adjacent electrodes.',
+             'name': 'num_steps',
+             'type': int},
+            {'default': 16,
+             'doc': 'Number of Gauss-Legendre quadrature points per interval used to build the forward matrix.',
+             'name': 'num_quadrature_points',
+             'type': int})
+    def __init__(self, **kwargs):
+        num_steps, num_quadrature_points = popargs('num_steps', 'num_quadrature_points', kwargs)
+        super().__init__(**kwargs)
+        self.num_steps = num_steps
+        self.num_quadrature_points = num_quadrature_points
+
+    @property
+    def locations(self):
+        z = self.electrode_positions
+        steps = np.linspace(0, 1, self.num_steps, endpoint=False)
+        return np.concatenate([(z[:-1, np.newaxis] + np.diff(z)[:, np.newaxis] * steps).ravel(), z[-1:]])
+
+    def _key_parts(self):
+        return self.num_steps, self.num_quadrature_points
+
+    def _basis(self):
+        # scipy.interpolate is imported when needed, as it is slow to import
+        from scipy.interpolate import CubicSpline
+        # the spline through each unit vector, i.e., the contribution of each electrode's CSD value to the spline
+        z = self.electrode_positions
+        return CubicSpline(z, np.eye(len(z)), bc_type='natural')
+
+    def _forward_matrix(self):
+        z = self.electrode_positions
+        radius = self.diameter / 2
+        nodes, weights = np.polynomial.legendre.leggauss(self.num_quadrature_points)
+        half_widths = np.diff(z)[:, np.newaxis] / 2
+        points = ((z[:-1, np.newaxis] + z[1:, np.newaxis]) / 2 + half_widths * nodes).ravel()
+        weights = (half_widths * weights).ravel()
+        potentials = (_disk_potential(z[:, np.newaxis] - points[np.newaxis, :], radius)
+                      + self._image_weight() * _disk_potential(z[:, np.newaxis] + points[np.newaxis, :], radius))
+        return (potentials * weights) @ self._basis()(points) / (2 * self.conductivity)
+
+    def _compute_operator(self):
+        return self._basis()(self.locations) @ super()._compute_operator()
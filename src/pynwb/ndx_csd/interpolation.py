@@ -0,0 +1,117 @@
+"""Interpolation of CSD data to virtual electrode locations with sparse weight matrices.
+
+Interpolating along one axis is linear in the data, so it is a ``(num_target, num_source)`` matrix of weights that
+depends only on the source and target locations. The matrix is computed once per pair of geometries, kept in the
+operator cache, and applied to all time points, and all positions along the other axes, as one sparse-dense matrix
+product. Grids are interpolated one axis at a time, which is equivalent to, and much cheaper than, the Kronecker
+product of the matrices of the axes.
+
+- 'linear': piecewise linear interpolation between the two nearest locations.
+- 'cubic': cubic Lagrange interpolation through the four nearest locations.
+- 'spline': a not-a-knot cubic spline through all locations, as scipy.interpolate.CubicSpline. Each target depends on
+  every source, but the weights decay quickly with distance, and those that are negligible are dropped.
+"""
+import numpy as np
+from scipy import sparse
+
+from .cache import make_key, operator_cache
+
+METHODS = ('linear', 'cubic', 'spline')
+
+# spline weights smaller than this are dropped from the sparse matrix
+SPLINE_TOLERANCE = 1e-12
+
+# targets this far outside the source locations, relative to their span, are moved onto the ends, e.g., to allow for
+# locations that were rounded to float32
+EDGE_TOLERANCE = 1e-6
+
+
+def _check(source, target):
+    source = np.asarray(source, dtype=np.float64).reshape(-1)
+    target = np.asarray(target, dtype=np.float64).reshape(-1)
+    if len(np.unique(source)) != len(source):
+        raise ValueError("the source locations must be distinct")
+    low, high = source.min(), source.max()
+    margin = EDGE_TOLERANCE * (high - low)
+    if len(target) and (target.min() < low - margin or target.max() > high + margin):
+        raise ValueError("cannot extrapolate: the target locations span [%g, %g] but the source locations span "
+                         "[%g, %g]" % (target.min(), target.max(), low, high))
+    return source, np.clip(target, low, high)
+
+
+def _linear(source, target):
+    if len(source) == 1:
+        # _check moved every target onto the only location
+        return np.zeros((len(target), 1), dtype=np.intp), np.ones((len(target), 1))
+    upper = np.clip(np.searchsorted(source, target, side='right'), 1, len(source) - 1)
+    lower = upper - 1
+    fraction = (target - source[lower]) / (source[upper] - source[lower])
+    return np.stack([lower, upper], axis=1), np.stack([1 - fraction, fraction], axis=1)
+
+
+def _cubic(source, target):
+    if len(source) < 4:
+        raise ValueError("cubic interpolation needs at least 4 source locations, not %d" % len(source))
+    start = np.clip(np.searchsorted(source, target, side='right') - 2, 0, len(source) - 4)
+    columns = start[:, None] + np.arange(4)
+    nodes = source[columns]
+    weights = np.ones(columns.shape)
+    for j in range(4):
+        for k in range(4):
+            if j != k:
+                weights[:, j] *= (target - nodes[:, k]) / (nodes[:, j] - nodes[:, k])
+    return columns, weights
+
+
+def _spline(source, target):
+    if len(source) < 2:
+        raise ValueError("spline interpolation needs at least 2 source locations, not %d" % len(source))
+    # scipy.interpolate is imported when needed, as it is slow to import, unlike scipy.sparse, which hdmf imports
+    from scipy.interpolate import CubicSpline
+    weights = CubicSpline(source, np.eye(len(source)))(target)
+    weights[np.abs(weights) < SPLINE_TOLERANCE] = 0
+    return weights
+
+
+def weight_matrix(source, target, method='linear'):
+    """Return the CSR matrix of shape ``(len(target), len(source))`` that interpolates values at the ``source``
+    locations to the ``target`` locations with ``method``. The source locations may be in any order."""
+    if method not in METHODS:
+        raise ValueError("unknown interpolation method '%s', must be one of %s" % (method, list(METHODS)))
+    source, target = _check(source, target)
+    order = np.argsort(source)
+    if method == 'spline':
+        matrix = sparse.csr_matrix(_spline(source[order], target))
+    else:
+        columns, weights = (_linear if method == 'linear' else _cubic)(source[order], target)
+        rows = np.repeat(np.arange(len(target)), columns.shape[1])
+        matrix = sparse.csr_matrix((weights.ravel(), (rows, columns.ravel())), shape=(len(target), len(source)))
+    # map the columns of the sorted locations back to the order of the source locations
+    matrix = matrix.tocoo()
+    matrix = sparse.csr_matrix((matrix.data, (matrix.row, order[matrix.col])), shape=matrix.shape)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def cached_weight_matrix(source, target, method='linear', cache=None):
+    """Return weight_matrix(source, target, method), computed once per pair of geometries and kept in ``cache``,
+    by default the cache shared by all estimators."""
+    cache = operator_cache if cache is None else cache
+
+    def compute():
+        matrix = weight_matrix(source, target, method)
+        return {'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr,
+                'shape': np.array(matrix.shape)}
+
+    parts = cache.get(make_key('interpolation', method, np.asarray(source), np.asarray(target)), compute)
+    shape = tuple(int(n) for n in parts['shape'])
+    return sparse.csr_matrix((parts['data'], parts['indices'], parts['indptr']), shape=shape)
+
+
+def apply_weight_matrix(data, matrix, axis):
+    """Interpolate ``data`` along ``axis`` with the weight ``matrix``, as one sparse-dense matrix product."""
+    data = np.asarray(data)
+    dtype = data.dtype if data.dtype.kind == 'f' else np.float64
+    moved = np.moveaxis(data, axis, 0)
+    result = np.asarray(matrix.astype(dtype) @ moved.reshape(moved.shape[0], -1))
+    return np.ascontiguousarray(np.moveaxis(result.reshape((matrix.shape[0], ) + moved.shape[1:]), 0, axis))
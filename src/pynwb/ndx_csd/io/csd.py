@@ -1,3 +1,5 @@
+import numpy as np
+from hdmf.build import ObjectMapper
 from pynwb import register_map
 from pynwb.io.core import NWBContainerMapper
 
@@ -9,5 +11,23 @@ class CSDObjectMapper(NWBContainerMapper):
 
     def __init__(self, spec):
         super().__init__(spec)
+        data_spec = self.spec.get_dataset('data')
+        self.map_spec('data_conversion', data_spec.get_attribute('conversion'))
+        self.map_spec('data_offset', data_spec.get_attribute('offset'))
         time_from_event_spec = self.spec.get_dataset('time_from_event')
         self.map_spec('event_description', time_from_event_spec.get_attribute('event_description'))
+        data_pyramid_spec = self.spec.get_dataset('data_pyramid')
+        self.map_spec('pyramid_factor', data_pyramid_spec.get_attribute('decimation_factor'))
+        self.map_spec('pyramid_level_offsets', data_pyramid_spec.get_attribute('level_offsets'))
+        trial_block_sums_spec = self.spec.get_dataset('trial_block_sums')
+        self.map_spec('trial_block_size', trial_block_sums_spec.get_attribute('block_size'))
+
+    @ObjectMapper.constructor_arg('num_trials')
+    def num_trials_carg(self, builder, manager):
+        """Backends that store attributes as JSON, e.g., Zarr, read unsigned integers back as Python ints."""
+        return np.uint64(builder.attributes['num_trials'])
+
+    @ObjectMapper.constructor_arg('summarize')
+    def summarize_carg(self, builder, manager):
+        """A CSD that is read has the summary that was written with it, if any, which is not recomputed from data."""
+        return False
@@ -0,0 +1,118 @@
+"""Data chunk iterators for writing CSD data buffer by buffer."""
+import numpy as np
+from hdmf.data_utils import AbstractDataChunkIterator, DataChunk, GenericDataChunkIterator
+
+# buffers of about 32 MiB, a multiple of the chunk shape, are read and written at a time
+BUFFER_BYTES = 2 ** 25
+
+
+def aligned_buffer_shape(shape, chunks, itemsize, buffer_bytes=BUFFER_BYTES):
+    """Return a buffer shape that extends ``chunks`` along the first axis by a whole number of chunks, up to about
+    ``buffer_bytes``, so that every buffer covers whole chunks."""
+    chunk_bytes = int(np.prod(chunks)) * itemsize
+    count = max(buffer_bytes // chunk_bytes, 1)
+    return (min(chunks[0] * count, shape[0]), ) + tuple(chunks[1:])
+
+
+class ArrayChunkIterator(GenericDataChunkIterator):
+    """Iterate over an array-like in buffers that are aligned with the chunks of the dataset being written.
+
+    Buffers never straddle chunk boundaries, so backends that write buffers in parallel, such as hdmf-zarr with
+    number_of_jobs > 1, never encode the same chunk from two workers. The iterator can be pickled, which sends the
+    array to the worker processes. It can also be indexed like the array, at any time, which reads the selection
+    from the array with the dtype that is written, so a CSD whose data it wraps can still be sliced.
+    """
+
+    def __init__(self, array, chunk_shape, buffer_shape=None, dtype=None):
+        self.array = array
+        self.__dtype = np.dtype(array.dtype if dtype is None else dtype)
+        if buffer_shape is None:
+            buffer_shape = aligned_buffer_shape(array.shape, chunk_shape, self.__dtype.itemsize)
+        super().__init__(chunk_shape=tuple(chunk_shape), buffer_shape=tuple(buffer_shape))
+
+    def _get_data(self, selection):
+        return np.asarray(self.array[selection], dtype=self.__dtype)
+
+    def __getitem__(self, selection):
+        return self._get_data(selection)
+
+    def _get_maxshape(self):
+        return self.array.shape
+
+    def _get_dtype(self):
+        return self.__dtype
+
+    def _to_dict(self):
+        return {'array': self.array, 'chunk_shape': self.chunk_shape, 'buffer_shape': self.buffer_shape,
+                'dtype': self.__dtype.str}
+
+    @staticmethod
+    def _from_dict(dictionary):
+        return ArrayChunkIterator(**dictionary)
+
+
+class BlockIterator(AbstractDataChunkIterator):
+    """Iterate over blocks of data that are produced one at a time, e.g., by a CSD computed block by block.
+
+    Each block is a slab of the dataset along ``axis``, e.g., a run of time points or, with axis=3, a range of depths
+    of a 3D CSD, and blocks may have different thicknesses. Only the current block is held in memory, so a CSD of any
+    size can be written with bounded memory. The first block is read when the iterator is created, to determine the
+    initial shape of the dataset.
+    """
+
+    def __init__(self, blocks, maxshape, dtype=np.float32, axis=0):
+        self.__blocks = iter(blocks)
+        self.__maxshape = tuple(maxshape)
+        self.__dtype = np.dtype(dtype)
+        self.axis = axis
+        self.__offset = 0
+        self.__count = 0
+        self.__first = self.__next_block()
+
+    def __next_block(self):
+        try:
+            block = np.asarray(next(self.__blocks), dtype=self.__dtype)
+        except StopIteration:
+            return None
+        expected = self.__maxshape[:self.axis] + self.__maxshape[self.axis + 1:]
+        actual = block.shape[:self.axis] + block.shape[self.axis + 1:]
+        if block.ndim != len(self.__maxshape) or any(e is not None and e != a for e, a in zip(expected, actual)):
+            raise ValueError("block %d has shape %s, which does not fit in a dataset of maxshape %s along axis %d"
+                             % (self.__count, block.shape, self.__maxshape, self.axis))
+        length = self.__maxshape[self.axis]
+        if length is not None and self.__offset + block.shape[self.axis] > length:
+            raise ValueError("block %d extends to %d along axis %d, beyond the maxshape %s"
+                             % (self.__count, self.__offset + block.shape[self.axis], self.axis, self.__maxshape))
+        self.__count += 1
+        return block
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.__first is not None:
+            block, self.__first = self.__first, None
+        else:
+            block = self.__next_block()
+        if block is None:
+            raise StopIteration
+        selection = [slice(0, n) for n in block.shape]
+        selection[self.axis] = slice(self.__offset, self.__offset + block.shape[self.axis])
+        self.__offset += block.shape[self.axis]
+        return DataChunk(data=block, selection=tuple(selection))
+
+    def recommended_chunk_shape(self):
+        return None
+
+    def recommended_data_shape(self):
+        if self.__first is None:
+            return tuple(0 if n is None else n for n in self.__maxshape)
+        return tuple(b if n is None else n for n, b in zip(self.__maxshape, self.__first.shape))
+
+    @property
+    def dtype(self):
+        return self.__dtype
+
+    @property
+    def maxshape(self):
+        return self.__maxshape
@@ -0,0 +1,233 @@
+"""Kernel current source density (kCSD) estimation for 2D and 3D electrode arrays (Potworowski et al., 2012).
+
+The CSD is modeled as a sum of Gaussian basis sources centered on the points of the estimation grid. The kernel
+matrix K between electrodes and the cross kernel between the grid and the electrodes depend only on the geometry and
+the basis, so they are computed once and stored, together with the eigendecomposition of K, in an OperatorCache.
+With K = U S U^T, the regularized inverse (K + lambda I)^-1 = U (S + lambda)^-1 U^T is available for any lambda
+without refactoring, which also makes the leave-one-out cross-validation error of a whole regularization path a
+handful of matrix products.
+
+As for the iCSD estimators, the spec fixes the unit of CSD data to volts/meters^2, so the estimate is the negative
+Laplacian of the potential, i.e., the CSD divided by the conductivity of the tissue.
+"""
+import copy
+
+import numpy as np
+from hdmf.utils import docval, getargs
+
+from .cache import OperatorCache, make_key, operator_cache
+from .compute import CSDEstimator
+
+# Gaussian basis sources are truncated at this many widths when integrating their potential
+_CUTOFF = 6.
+
+
+def _gaussian_potential_3d(distances, width):
+    """Potential of a Gaussian source of unit peak density and standard deviation ``width`` in an infinite medium of
+    unit conductivity."""
+    # scipy.special and scipy.spatial are imported when needed, as they are slow to import
+    from scipy.special import erf
+    distances = np.asarray(distances, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        potential = (2 * np.pi) ** 1.5 * width ** 3 * erf(distances / (np.sqrt(2) * width)) / (4 * np.pi * distances)
+    return np.where(distances == 0, width ** 2, potential)
+
+
+def _gaussian_potential_2d(distances, width, thickness, num_nodes=64):
+    """Potential in the mid-plane of a slab of unit conductivity and thickness ``thickness``, of a source that is
+    Gaussian in the plane, with unit peak density and standard deviation ``width``, and uniform across the slab.
+
+    The integral of arcsinh(thickness / (2 r)) over the source is taken in polar coordinates centered on each
+    evaluation point, where the r dr factor removes the singularity at r = 0, and limited to the sector that covers
+    the truncated source.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    nodes, weights = np.polynomial.legendre.leggauss(num_nodes)
+    d = distances[:, np.newaxis, np.newaxis]
+    r_low = np.maximum(d - _CUTOFF * width, 0)
+    r_high = d + _CUTOFF * width
+    r = r_low + (r_high - r_low) * (nodes[np.newaxis, :, np.newaxis] + 1) / 2
+    r_weights = (r_high - r_low) / 2 * weights[np.newaxis, :, np.newaxis]
+    # the source center lies at theta = pi
+    half_angle = np.where(d > _CUTOFF * width, np.arcsin(np.minimum(_CUTOFF * width / np.maximum(d, 1e-300), 1)),
+                          np.pi)
+    theta = np.pi + half_angle * nodes[np.newaxis, np.newaxis, :]
+    theta_weights = half_angle * weights[np.newaxis, np.newaxis, :]
+    squared_distance_to_center = d ** 2 + r ** 2 + 2 * d * r * np.cos(theta)
+    integrand = np.arcsinh(thickness / (2 * r)) * r * np.exp(-squared_distance_to_center / (2 * width ** 2))
+    return (integrand * r_weights * theta_weights).sum(axis=(1, 2)) / (2 * np.pi)
+
+
+class KernelCSD(CSDEstimator):
+    """kCSD estimator for 2D and 3D electrode arrays, returning the CSD on a regular grid."""
+
+    @docval(
+        {'doc': 'Positions of the electrodes, in meters, with shape (num_electrodes, 2) or (num_electrodes, 3). The '
+                'columns are the x, y and, for 3D arrays, z coordinates.',
+         'name': 'electrode_positions',
+         'shape': [[None, 2], [None, 3]],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'X-axis coordinates of the estimation grid, in meters. Defaults to the distinct x coordinates of the '
+                'electrodes.',
+         'name': 'x',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Y-axis coordinates of the estimation grid, in meters. Defaults to the distinct y coordinates of the '
+                'electrodes.',
+         'name': 'y',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Z-axis coordinates of the estimation grid, in meters, for 3D arrays. Defaults to the distinct z '
+                'coordinates of the electrodes.',
+         'name': 'z',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'Standard deviation of the Gaussian basis sources, in meters. Defaults to the mean distance between '
+                'each electrode and its nearest neighbor.',
+         'name': 'source_width',
+         'type': (int, float)},
+        {'default': None,
+         'doc': 'Thickness of the slab of tissue for 2D arrays, in meters. Defaults to the source width.',
+         'name': 'thickness',
+         'type': (int, float)},
+        {'default': None,
+         'doc': 'Regularization parameter lambda. If None, it is chosen by leave-one-out cross-validation over '
+                'lambdas each time the CSD is estimated.',
+         'name': 'regularization',
+         'type': (int, float)},
+        {'default': None,
+         'doc': 'Candidate values of the regularization parameter. Defaults to 30 values logarithmically spaced '
+                'between 1e-9 and 1 times the mean eigenvalue of the kernel matrix.',
+         'name': 'lambdas',
+         'shape': [None],
+         'type': ('data', 'array_data')},
+        {'default': None,
+         'doc': 'The cache to store the kernel matrices in. Defaults to the cache shared by all estimators.',
+         'name': 'cache',
+         'type': OperatorCache})
+    def __init__(self, **kwargs):
+        electrode_positions, x, y, z = getargs('electrode_positions', 'x', 'y', 'z', kwargs)
+        source_width, thickness, regularization, lambdas, cache = getargs(
+            'source_width', 'thickness', 'regularization', 'lambdas', 'cache', kwargs)
+        electrode_positions = np.asarray(electrode_positions, dtype=np.float64)
+        self.electrode_positions = electrode_positions
+        self.ndim = electrode_positions.shape[1]
+        axes = [x, y, z][:self.ndim]
+        self.axes = [np.unique(electrode_positions[:, i]) if axis is None else np.asarray(axis, dtype=np.float64)
+                     for i, axis in enumerate(axes)]
+        if source_width is None:
+            from scipy.spatial.distance import cdist
+            distances = cdist(electrode_positions, electrode_positions)
+            np.fill_diagonal(distances, np.inf)
+            source_width = distances.min(axis=1).mean()
+        self.source_width = source_width
+        self.thickness = source_width if thickness is None else thickness
+        self.regularization = regularization
+        self.selected_regularization = regularization
+        self.lambdas = None if lambdas is None else np.asarray(lambdas, dtype=np.float64)
+        self.cache = operator_cache if cache is None else cache
+
+    @property
+    def grid_shape(self):
+        return tuple(len(axis) for axis in self.axes)
+
+    @property
+    def grid_points(self):
+        """Coordinates of the points of the estimation grid, with shape (num_points, ndim)."""
+        return np.stack([g.ravel() for g in np.meshgrid(*self.axes, indexing='ij')], axis=1)
+
+    @property
+    def kernels(self):
+        """The eigendecomposition of the kernel matrix and the cross kernel projected onto its eigenvectors."""
+        key = make_key(type(self).__name__, self.electrode_positions, self.source_width,
+                       self.thickness if self.ndim == 2 else None, *self.axes)
+        return self.cache.get(key, self._compute_kernels)
+
+    @property
+    def description(self):
+        slab = ", slab thickness %g m" % self.thickness if self.ndim == 2 else ""
+        return ("%dD kCSD (Potworowski et al., 2012) with Gaussian basis sources of width %g m%s and regularization "
+                "%g, as the negative Laplacian of the potential."
+                % (self.ndim, self.source_width, slab, self.selected_regularization or 0.))
+
+    def location_kwargs(self):
+        names = ['rel_electrode_locations_x', 'rel_electrode_locations_y', 'rel_electrode_locations_z']
+        kwargs = {name: axis.astype(np.float32) for name, axis in zip(names, self.axes)}
+        kwargs['actual_electrodes'] = False
+        return kwargs
+
+    def default_lambdas(self):
+        return np.logspace(-9, 0, 30) * self.kernels['eigenvalues'].mean()
+
+    def regularization_path(self, lfp, lambdas=None):
+        """Return the leave-one-out cross-validation error of the estimate for each of ``lambdas``.
+
+        For kernel ridge regression, the leave-one-out residual at electrode i is [A V]_i / A_ii with
+        A = (K + lambda I)^-1, so the errors of all lambdas and time points are computed at once from the cached
+        eigendecomposition.
+        """
+        if lambdas is None:
+            lambdas = self.default_lambdas() if self.lambdas is None else self.lambdas
+        lambdas = np.asarray(lambdas, dtype=np.float64)
+        kernels = self.kernels
+        eigenvectors = kernels['eigenvectors']
+        potentials = self.__check_lfp(lfp).T
+        inverse_eigenvalues = 1. / (kernels['eigenvalues'][np.newaxis, :] + lambdas[:, np.newaxis])
+        projected = eigenvectors.T @ potentials
+        residuals = np.einsum('ik,lk,kt->lit', eigenvectors, inverse_eigenvalues, projected)
+        diagonals = inverse_eigenvalues @ (eigenvectors ** 2).T
+        return np.mean((residuals / diagonals[:, :, np.newaxis]) ** 2, axis=(1, 2))
+
+    def select_regularization(self, lfp):
+        """Return the lambda with the smallest leave-one-out cross-validation error on ``lfp``."""
+        lambdas = self.default_lambdas() if self.lambdas is None else self.lambdas
+        return lambdas[np.argmin(self.regularization_path(lfp, lambdas))]
+
+    def fit(self, lfp):
+        """Return a copy of this estimator with the regularization selected on all of ``lfp``, or this estimator if its
+        regularization is fixed."""
+        if self.regularization is not None:
+            return self
+        fitted = copy.copy(self)
+        fitted.regularization = fitted.selected_regularization = self.select_regularization(self.__check_lfp(lfp))
+        return fitted
+
+    def estimate(self, lfp):
+        lfp = self.__check_lfp(lfp)
+        regularization = self.regularization
+        if regularization is None:
+            regularization = self.select_regularization(lfp)
+        self.selected_regularization = regularization
+        kernels = self.kernels
+        inverse_eigenvalues = 1. / (kernels['eigenvalues'] + regularization)
+        coefficients = inverse_eigenvalues[:, np.newaxis] * (kernels['eigenvectors'].T @ lfp.T)
+        csd = (kernels['cross_eigenvectors'] @ coefficients).T
+        return csd.reshape((len(lfp), ) + self.grid_shape)
+
+    def __check_lfp(self, lfp):
+        lfp = np.asarray(lfp)
+        if lfp.ndim != 2 or lfp.shape[1] != len(self.electrode_positions):
+            raise ValueError("lfp must have shape (num_times, %d), got %s" % (len(self.electrode_positions), lfp.shape))
+        return lfp
+
+    def _basis_potential(self, distances):
+        if self.ndim == 3:
+            return _gaussian_potential_3d(distances, self.source_width)
+        # tabulate the potential, which depends only on the distance, and interpolate
+        table_distances = np.linspace(0, distances.max(), 1024)
+        table = _gaussian_potential_2d(table_distances, self.source_width, self.thickness)
+        return np.interp(distances, table_distances, table)
+
+    def _compute_kernels(self):
+        from scipy.spatial.distance import cdist
+        sources = self.grid_points
+        potentials = self._basis_potential(cdist(self.electrode_positions, sources))
+        basis = np.exp(-cdist(sources, sources, 'sqeuclidean') / (2 * self.source_width ** 2))
+        eigenvalues, eigenvectors = np.linalg.eigh(potentials @ potentials.T)
+        return {'eigenvalues': eigenvalues,
+                'eigenvectors': eigenvectors,
+                'cross_eigenvectors': (basis @ potentials.T) @ eigenvectors}
@@ -0,0 +1,47 @@
+"""Zero-copy, memory-mapped reading of contiguous HDF5 datasets.
+
+The raw data of an HDF5 dataset that is stored contiguously, without filters, in a plain file, is a C-ordered array
+at a fixed byte offset of the file. Mapping it with numpy.memmap lets slices be served from the page cache without
+going through h5py, and a slice of the map is itself a view that is read only when it is accessed.
+"""
+import h5py
+import numpy as np
+
+# file drivers that store the file as a single file on disk
+_PLAIN_DRIVERS = ('sec2', 'stdio')
+
+
+def memmap_problem(dataset):
+    """Return why ``dataset`` cannot be memory-mapped, or None if it can."""
+    if not isinstance(dataset, h5py.Dataset):
+        return 'it is not an HDF5 dataset'
+    if dataset.chunks is not None:
+        return 'it is chunked'
+    # any filter, e.g., compression, shuffle, fletcher32 or scaleoffset, changes the bytes on disk
+    if dataset.id.get_create_plist().get_nfilters() > 0:
+        return 'it is compressed or filtered'
+    if dataset.dtype.hasobject or dataset.dtype.kind not in 'biuf':
+        return 'its dtype %s is not numeric' % dataset.dtype
+    if dataset.file.driver not in _PLAIN_DRIVERS:
+        return "its file uses the '%s' driver" % dataset.file.driver
+    if dataset.external:
+        return 'its data is stored in external files'
+    if dataset.id.get_offset() is None:
+        return 'its data has not been written'
+    return None
+
+
+def memmap_dataset(dataset):
+    """Return a read-only numpy.memmap of the contiguous ``dataset``, or raise a ValueError if it cannot be mapped."""
+    problem = memmap_problem(dataset)
+    if problem is not None:
+        raise ValueError("cannot memory-map dataset '%s' because %s" % (getattr(dataset, 'name', dataset), problem))
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r', offset=dataset.id.get_offset(),
+                     shape=dataset.shape, order='C')
+
+
+def mapped_or_dataset(dataset):
+    """Return a memory map of ``dataset`` if it can be mapped, and ``dataset`` itself otherwise."""
+    if memmap_problem(dataset) is None:
+        return memmap_dataset(dataset)
+    return dataset
@@ -0,0 +1,55 @@
+"""Streaming, mergeable per-cell moments of trials, for the variance of a CSD across trials.
+
+For each cell, i.e., each time point and electrode, Moments keeps the number of trials, their mean and the sum of
+squared deviations from the mean (M2), in float64. A batch of trials is reduced with two passes over the batch, which
+is in memory, and merged into the running moments with the pairwise update of Chan et al. (1979), which is
+numerically stable even when the variance is small compared to the mean. The same update merges the moments of
+disjoint sets of trials, e.g., accumulated by different worker processes.
+
+NaN values are skipped, so the number of trials can differ between cells.
+"""
+import numpy as np
+
+
+class Moments:
+    """Per-cell count, mean and M2 of a stream of trials."""
+
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+
+    def add(self, trials):
+        """Merge a batch of trials, with trials along the first axis, into the moments."""
+        trials = np.asarray(trials, dtype=np.float64)
+        valid = ~np.isnan(trials)
+        count = valid.sum(axis=0)
+        mean = np.divide(np.where(valid, trials, 0.).sum(axis=0), count, out=np.zeros(count.shape), where=count > 0)
+        m2 = np.square(np.where(valid, trials - mean, 0.)).sum(axis=0)
+        self.merge_moments(count, mean, m2)
+
+    def merge(self, other):
+        """Merge the moments of ``other``, computed from a disjoint set of trials, into these moments."""
+        if other.count is not None:
+            self.merge_moments(other.count, other.mean, other.m2)
+
+    def merge_moments(self, count, mean, m2):
+        """Merge the ``count``, ``mean`` and ``m2`` of a disjoint set of trials into these moments."""
+        count = np.asarray(count, dtype=np.int64)
+        if self.count is None:
+            self.count, self.mean, self.m2 = count.copy(), np.array(mean, dtype=np.float64), np.array(m2, np.float64)
+            return
+        if count.shape != self.count.shape:
+            raise ValueError("moments of shape %s cannot be merged into moments of shape %s"
+                             % (count.shape, self.count.shape))
+        total = self.count + count
+        ratio = np.divide(count, total, out=np.zeros(total.shape), where=total > 0)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * ratio
+        self.m2 = self.m2 + m2 + np.square(delta) * self.count * ratio
+        self.count = total
+
+    def variance(self, ddof=1):
+        """Return the variance of each cell, with ``ddof`` delta degrees of freedom, or NaN for cells with at most
+        ``ddof`` trials."""
+        return np.divide(self.m2, self.count - ddof, out=np.full(self.m2.shape, np.nan), where=self.count > ddof)
@@ -0,0 +1,133 @@
+"""Loading of the ndx-csd namespace into the pynwb type map, with an optional on-disk cache of the parsed spec files.
+
+Parsing the YAML spec files is most of the cost of loading the namespace, and short-lived processes pay it on every
+import. If the NDX_CSD_CACHE_DIR environment variable names a directory, the parsed documents are therefore stored
+there as JSON, under a name that includes a hash of the spec files and the hdmf version, so that a changed spec or
+hdmf creates a new cache entry instead of using a stale one, and older entries are removed when a new one is written.
+Caching is off by default, so importing ndx_csd writes nothing, and NDX_CSD_NO_CACHE_DIR=1 turns it off even if the
+directory is set, as for pynwb's PYNWB_NO_CACHE_DIR. JSON holds only data, so a cache file that is not valid is
+ignored rather than run.
+
+The namespace is still loaded when ndx_csd is imported rather than on first use: register_class needs the spec of a
+class when the class is defined, and an NWBHDF5IO copies the type map when it is opened, so a namespace loaded later
+would be missing from files opened before it.
+"""
+import copy
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+import hdmf
+from hdmf.spec.namespace import YAMLSpecReader
+from pynwb import get_type_map, load_namespaces
+
+# bump when the format of the cached documents changes
+CACHE_VERSION = 2
+
+# cache files are named with this prefix, followed by the hash of the spec files
+CACHE_PREFIX = 'namespace-'
+
+# Set path of the namespace.yaml file to the expected install location
+NAMESPACE_PATH = os.path.join(
+    os.path.dirname(__file__),
+    'spec',
+    'ndx-csd.namespace.yaml'
+)
+
+# If the extension has not been installed yet but we are running directly from
+# the git repo
+if not os.path.exists(NAMESPACE_PATH):
+    NAMESPACE_PATH = os.path.abspath(os.path.join(
+        os.path.dirname(__file__),
+        '..', '..', '..',
+        'spec',
+        'ndx-csd.namespace.yaml'
+    ))
+
+_loaded = False
+
+
+class CachingSpecReader(YAMLSpecReader):
+    """A YAMLSpecReader that keeps the documents it parses, and returns documents parsed earlier without reading the
+    files."""
+
+    def __init__(self, indir, documents=None):
+        super().__init__(indir=indir)
+        self.documents = {} if documents is None else documents
+
+    def read_namespace(self, namespace_path):
+        key = 'namespace:' + os.path.basename(namespace_path)
+        if key not in self.documents:
+            self.documents[key] = super().read_namespace(namespace_path)
+        return copy.deepcopy(self.documents[key])
+
+    def read_spec(self, spec_path):
+        key = 'spec:' + spec_path
+        if key not in self.documents:
+            self.documents[key] = super().read_spec(spec_path)
+        return copy.deepcopy(self.documents[key])
+
+
+def cache_dir():
+    """Return the directory of the cache of parsed spec files, or None if caching is off."""
+    if os.environ.get('NDX_CSD_NO_CACHE_DIR', '0') == '1':
+        return None
+    return os.environ.get('NDX_CSD_CACHE_DIR') or None
+
+
+def cache_path(namespace_path=NAMESPACE_PATH, directory=None):
+    """Return the path of the cache file in ``directory``, by default cache_dir(), for the spec files in the directory
+    of ``namespace_path``."""
+    digest = hashlib.sha1(('%d|%s|' % (CACHE_VERSION, hdmf.__version__)).encode())
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(namespace_path), '*.yaml'))):
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return os.path.join(cache_dir() if directory is None else directory,
+                        '%s%s.json' % (CACHE_PREFIX, digest.hexdigest()))
+
+
+def _read_cache(path):
+    try:
+        with open(path) as f:
+            documents = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(documents, dict) or not all(isinstance(key, str) for key in documents):
+        return None
+    return documents
+
+
+def _write_cache(path, documents):
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(documents, f)
+        os.replace(tmp_path, path)
+        # entries of other versions of the spec or hdmf are stale
+        for stale in glob.glob(os.path.join(directory, CACHE_PREFIX + '*')):
+            if stale != path:
+                os.remove(stale)
+    except OSError:
+        pass  # skip caching if the cache directory is not writable
+
+
+def load_namespace():
+    """Load the ndx-csd namespace into the pynwb type map, once."""
+    global _loaded
+    if _loaded:
+        return
+    if cache_dir() is None:
+        load_namespaces(NAMESPACE_PATH)
+    else:
+        path = cache_path()
+        documents = _read_cache(path)
+        reader = CachingSpecReader(os.path.dirname(NAMESPACE_PATH), documents)
+        get_type_map(copy=False).load_namespaces(NAMESPACE_PATH, reader=reader)
+        if documents is None and reader.documents:
+            _write_cache(path, reader.documents)
+    _loaded = True
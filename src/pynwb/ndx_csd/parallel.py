@@ -0,0 +1,101 @@
+"""Lazy, parallel computation and writing of CSDs with dask arrays (requires dask).
+
+A dask array passed as the data of a CSD is written through an ArrayChunkIterator with the chunks of the array and
+buffers of several chunks, so that the backend requests one buffer at a time and dask computes the chunks of each
+buffer in parallel with its scheduler. Nothing is computed before the file is written, and only one buffer is held in
+memory at a time. As for any data chunk iterator, data_pyramid and the summary are then not computed at construction,
+and can be added after writing.
+
+With use_dask, CSD.from_lfp wraps the LFP in a dask array with chunks that are multiples of its chunks on disk, sums
+the epochs as one task graph, reduced in parallel, and applies an estimator to the trial average block by block of
+time points, so a 3D CSD volume is computed chunk by chunk while it is written.
+
+CSD.to_dask reads data back as a dask array whose chunks are multiples of the chunks on disk, so every task reads
+whole chunks.
+
+dask is only imported when a dask array is used, and dask arrays are recognized by their type, without importing it.
+"""
+import os
+
+import numpy as np
+
+from .iterators import BUFFER_BYTES, ArrayChunkIterator, aligned_buffer_shape
+
+# time points of the CSD computed by one task when an estimator is applied lazily, as raw bytes of the result
+BLOCK_BYTES = 2 ** 26
+
+
+def is_dask_array(values):
+    """Return whether ``values`` is a dask array, without importing dask."""
+    return type(values).__module__.startswith('dask.array')
+
+
+class _DaskArrayType(type):
+
+    def __instancecheck__(cls, instance):
+        return is_dask_array(instance)
+
+
+class DaskArray(metaclass=_DaskArrayType):
+    """Stand-in for dask.array.Array in docval types, which matches dask arrays without importing dask."""
+
+
+def chunk_iterator(array, dtype=None, num_workers=None):
+    """Return an ArrayChunkIterator that writes the dask ``array`` with its chunks, optionally converted to ``dtype``,
+    in buffers of at least ``num_workers`` chunks, by default the number of CPUs, that dask computes in parallel."""
+    dtype = np.dtype(array.dtype if dtype is None else dtype)
+    chunks = tuple(int(n) for n in array.chunksize)
+    num_workers = os.cpu_count() or 1 if num_workers is None else num_workers
+    buffer_bytes = max(BUFFER_BYTES, int(np.prod(chunks)) * dtype.itemsize * num_workers)
+    buffer_shape = aligned_buffer_shape(array.shape, chunks, dtype.itemsize, buffer_bytes)
+    return ArrayChunkIterator(array, chunk_shape=chunks, buffer_shape=buffer_shape, dtype=dtype)
+
+
+def _epochs(data, onsets, offsets, channels=None):
+    import dask.array as da
+    epochs = da.stack([data[onset + offsets[0]:onset + offsets[-1] + 1] for onset in onsets])
+    return epochs if channels is None else epochs[..., channels]
+
+
+def read_epochs(data, onsets, offsets, channels=None):
+    """Read the epochs around ``onsets`` from the dask array ``data``, computing them in parallel."""
+    return _epochs(data, onsets, offsets, channels).compute()
+
+
+def epoch_sum(data, onsets, offsets, channels=None):
+    """Sum the epochs of the dask array ``data`` around ``onsets`` in float64, as one task graph that dask reduces
+    in parallel."""
+    return _epochs(data, onsets, offsets, channels).sum(axis=0, dtype=np.float64).compute()
+
+
+def map_time_blocks(function, values, block_bytes=BLOCK_BYTES):
+    """Return a dask array that applies ``function``, e.g., the estimate of a CSD estimator, to ``values`` one block of
+    time points at a time. ``function`` must map each time point independently of the others."""
+    import dask
+    import dask.array as da
+    values = np.asarray(values)
+    sample = np.asarray(function(values[:1]))
+    block = max(block_bytes // max(sample[0].nbytes, 1), 1)
+    blocks = [da.from_delayed(dask.delayed(function)(values[start:start + block]),
+                              shape=(len(values[start:start + block]), ) + sample.shape[1:], dtype=sample.dtype)
+              for start in range(0, len(values), block)]
+    return da.concatenate(blocks, axis=0)
+
+
+def to_dask(data, conversion=None, offset=None):
+    """Return ``data``, dequantized with ``conversion`` and ``offset`` if either is given, as a dask array with chunks
+    that are multiples of its chunks on disk. Contiguous HDF5 datasets are memory-mapped if possible."""
+    import dask.array as da
+    import h5py
+
+    from .memmap import mapped_or_dataset
+    if is_dask_array(data):
+        array = data
+    else:
+        source = mapped_or_dataset(data)
+        # from_array aligns automatic chunks to the chunks of the source; h5py is not thread-safe
+        array = da.from_array(source, chunks='auto', lock=isinstance(source, h5py.Dataset))
+    if conversion is None and offset is None:
+        return array
+    conversion = np.float32(1. if conversion is None else conversion)
+    return array * conversion + np.float32(0. if offset is None else offset)
@@ -0,0 +1,143 @@
+"""Write profiles that set the chunking and compression of CSD datasets for a particular access pattern.
+
+- 'time-slice': each chunk holds all electrodes of a few consecutive time points, for reading frames of a CSD movie.
+- 'channel-trace': each chunk holds a long run of time points of a few electrodes, for reading the trace of one
+  electrode over time.
+- 'archive': balanced chunks and the strongest gzip compression, for long-term storage.
+
+All profiles use the shuffle filter. With the HDF5 backend they compress with gzip, which every HDF5 installation
+can read, and with the Zarr backend (hdmf-zarr) with Blosc zstd at the same level. For Zarr, 3D and 4D data is also
+wrapped in an ArrayChunkIterator with chunk-aligned buffers, so that NWBZarrIO.write(number_of_jobs=...) can encode
+the chunks of large volumes in parallel.
+"""
+import h5py
+import numpy as np
+from hdmf.data_utils import AbstractDataChunkIterator, DataIO
+from hdmf.utils import get_data_shape
+from pynwb import H5DataIO
+
+from .iterators import ArrayChunkIterator
+
+# chunks of about 1 MiB fit in the default HDF5 chunk cache
+CHUNK_BYTES = 2 ** 20
+
+WRITE_PROFILES = {
+    'time-slice': {'layout': 'time-slice', 'level': 4},
+    'channel-trace': {'layout': 'channel-trace', 'level': 4},
+    'archive': {'layout': 'balanced', 'level': 9},
+}
+
+BACKENDS = ('hdf5', 'zarr')
+
+
+def _fill_chunk(shape, itemsize, order, chunk_bytes):
+    """Grow a chunk of ones to the full extent of each dimension in ``order`` until it reaches ``chunk_bytes``."""
+    chunk = [1] * len(shape)
+    budget = max(chunk_bytes // itemsize, 1)
+    for dim in order:
+        chunk[dim] = int(min(shape[dim], max(budget // int(np.prod(chunk)), 1)))
+        if chunk[dim] < shape[dim]:
+            break
+    return tuple(chunk)
+
+
+def _balanced_chunk(shape, itemsize, chunk_bytes):
+    """Halve the largest dimension of the full shape until the chunk fits in ``chunk_bytes``."""
+    chunk = list(shape)
+    while int(np.prod(chunk)) * itemsize > chunk_bytes and max(chunk) > 1:
+        dim = int(np.argmax(chunk))
+        chunk[dim] = (chunk[dim] + 1) // 2
+    return tuple(chunk)
+
+
+def chunk_shape(shape, itemsize, layout, chunk_bytes=CHUNK_BYTES):
+    """Return the chunk shape for a dataset of ``shape`` with time along the first axis, for ``layout``.
+
+    Dimensions of unknown size (None), e.g., from an iterator, are treated as unbounded.
+    """
+    budget = max(chunk_bytes // itemsize, 1)
+    shape = tuple(budget if n is None else max(int(n), 1) for n in shape)
+    if layout == 'time-slice':
+        return _fill_chunk(shape, itemsize, list(range(len(shape) - 1, 0, -1)) + [0], chunk_bytes)
+    if layout == 'channel-trace':
+        return _fill_chunk(shape, itemsize, [0] + list(range(len(shape) - 1, 0, -1)), chunk_bytes)
+    if layout == 'balanced':
+        return _balanced_chunk(shape, itemsize, chunk_bytes)
+    raise ValueError("unknown chunk layout '%s'" % layout)
+
+
+def _itemsize(data):
+    dtype = getattr(data, 'dtype', None)
+    if dtype is None:
+        dtype = np.asarray(data[:1] if len(data) else data).dtype
+    return np.dtype(dtype).itemsize
+
+
+def _stored(data):
+    """Whether ``data`` was read from an HDF5 or Zarr file, so its chunks are already set."""
+    return isinstance(data, h5py.Dataset) or type(data).__module__.startswith('zarr')
+
+
+def _check(profile, backend):
+    if profile not in WRITE_PROFILES:
+        raise ValueError("unknown write profile '%s', must be one of %s" % (profile, sorted(WRITE_PROFILES)))
+    if backend not in BACKENDS:
+        raise ValueError("unknown backend '%s', must be one of %s" % (backend, list(BACKENDS)))
+
+
+def wrap_dataset(data, profile, backend='hdf5', resizable=False):
+    """Wrap ``data``, with time or electrodes along the first axis, in the DataIO of ``backend`` with the settings of
+    ``profile``. If ``resizable``, an HDF5 dataset can grow along its first axis (maxshape None), and without a profile
+    its chunks are balanced and it is not compressed. Zarr arrays can always grow.
+
+    Data that is already wrapped in a DataIO, and None, are returned unchanged.
+    """
+    if data is None or isinstance(data, DataIO):
+        return data
+    if profile is None and (not resizable or backend == 'zarr'):
+        return data
+    _check('archive' if profile is None else profile, backend)
+    settings = WRITE_PROFILES.get(profile, {'layout': 'balanced', 'level': None})
+    shape = get_data_shape(data)
+    chunks = chunk_shape(shape, _itemsize(data), settings['layout'])
+    if backend == 'hdf5':
+        kwargs = {'maxshape': (None, ) + tuple(shape[1:])} if resizable else {}
+        if settings['level'] is None:
+            return H5DataIO(data=data, chunks=chunks, **kwargs)
+        return H5DataIO(data=data, chunks=chunks, compression='gzip', compression_opts=settings['level'],
+                        shuffle=True, **kwargs)
+
+    from hdmf_zarr import ZarrDataIO
+    from numcodecs import Blosc
+    if len(shape) >= 3 and hasattr(data, 'dtype') and None not in shape \
+            and not isinstance(data, AbstractDataChunkIterator):
+        data = ArrayChunkIterator(data, chunk_shape=chunks)
+    return ZarrDataIO(data=data, chunks=list(chunks),
+                      compressor=Blosc(cname='zstd', clevel=settings['level'], shuffle=Blosc.SHUFFLE))
+
+
+def wrap_by_trial(data, profile=None, backend='hdf5'):
+    """Wrap ``data``, with trials along the first axis, in the DataIO of ``backend`` with chunks that each hold part
+    of a single trial, shaped by the layout of ``profile`` over the remaining axes.
+
+    Without a profile, the chunks of a trial are balanced and are not compressed. Data that is already wrapped in a
+    DataIO or stored in a file, and None, are returned unchanged.
+    """
+    if data is None or isinstance(data, DataIO) or _stored(data):
+        return data
+    _check('archive' if profile is None else profile, backend)
+    settings = WRITE_PROFILES.get(profile, {'layout': 'balanced', 'level': None})
+    shape = get_data_shape(data)
+    chunks = (1, ) + chunk_shape(shape[1:], _itemsize(data), settings['layout'])
+    if backend == 'hdf5':
+        if settings['level'] is None:
+            return H5DataIO(data=data, chunks=chunks)
+        return H5DataIO(data=data, chunks=chunks, compression='gzip', compression_opts=settings['level'],
+                        shuffle=True)
+
+    from hdmf_zarr import ZarrDataIO
+    from numcodecs import Blosc
+    if settings['level'] is None:
+        return ZarrDataIO(data=data, chunks=list(chunks))
+    return ZarrDataIO(data=data, chunks=list(chunks),
+                      compressor=Blosc(cname='zstd', clevel=settings['level'], shuffle=Blosc.SHUFFLE))
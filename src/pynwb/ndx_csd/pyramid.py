@@ -0,0 +1,120 @@
+"""Multi-resolution pyramid of CSD data along the time axis, for zoomed-out visualization.
+
+Level k of the pyramid holds the minimum, maximum and mean of consecutive bins of ``factor ** k`` time points of data,
+for k = 1, 2, ... until a level has at most MIN_LEVEL_SAMPLES bins. The levels are concatenated along the first axis
+of one ``(num_pyramid_samples, 3, ...)`` dataset, data_pyramid, with the minimum, maximum and mean along its second
+axis, and the first bin of each level, followed by the total number of bins, in its level_offsets attribute.
+
+A plot that is a few thousand pixels wide then reads the coarsest level with at least that many bins in the plotted
+window, so its cost depends on the number of pixels rather than the number of time points. With the default factor
+of 8, the pyramid takes 3/7 of the space of data.
+
+The pyramid is built in one streaming pass over blocks of time points whose length is a multiple of the largest bin,
+so no bin straddles two blocks, and each level is reduced from the level below it.
+"""
+import collections
+
+import h5py
+import numpy as np
+from hdmf.utils import get_data_shape
+
+from .quantize import Dequantized
+
+FACTOR = 8
+
+# the coarsest level has at most this many bins
+MIN_LEVEL_SAMPLES = 256
+
+# raw data read at once when building a pyramid
+BLOCK_BYTES = 2 ** 26
+
+STATISTICS = ('min', 'max', 'mean')
+
+Overview = collections.namedtuple('Overview', ['time_from_event', 'min', 'max', 'mean', 'bin_size'])
+Overview.__doc__ = """Data of a window of a CSD at a reduced resolution, with the start time, minimum, maximum and mean
+of each bin of ``bin_size`` time points. With a bin_size of 1, min, max and mean are the data itself."""
+
+
+def level_lengths(num_times, factor=FACTOR, min_level_samples=MIN_LEVEL_SAMPLES):
+    """Return the number of bins of each level of the pyramid of ``num_times`` time points."""
+    lengths = []
+    length = num_times
+    while length > min_level_samples:
+        length = -(-length // factor)
+        lengths.append(length)
+    return lengths
+
+
+def level_offsets(num_times, factor=FACTOR, min_level_samples=MIN_LEVEL_SAMPLES):
+    """Return the first bin of each level in data_pyramid, followed by the total number of bins."""
+    return np.concatenate([[0], np.cumsum(level_lengths(num_times, factor, min_level_samples))]).astype(np.uint64)
+
+
+def _reduce(minimum, maximum, total, count, factor):
+    starts = np.arange(0, len(count), factor)
+    return (np.minimum.reduceat(minimum, starts, axis=0), np.maximum.reduceat(maximum, starts, axis=0),
+            np.add.reduceat(total, starts, axis=0), np.add.reduceat(count, starts))
+
+
+def iter_levels(data, factor=FACTOR, min_level_samples=MIN_LEVEL_SAMPLES, block_bytes=BLOCK_BYTES):
+    """Yield ``(level, first_bin, stats)`` for consecutive blocks of each level of the pyramid of ``data``, where
+    ``stats`` has shape ``(num_bins, 3, ...)``. ``data`` is read one block of time points at a time."""
+    shape = get_data_shape(data)
+    num_levels = len(level_lengths(shape[0], factor, min_level_samples))
+    if num_levels == 0:
+        return
+    largest_bin = factor ** num_levels
+    row_bytes = 8 * int(np.prod(shape[1:]))
+    block = largest_bin * max(block_bytes // (row_bytes * largest_bin), 1)
+    for start in range(0, shape[0], block):
+        values = np.asarray(data[start:start + block], dtype=np.float64)
+        minimum, maximum, total, count = values, values, values, np.ones(len(values))
+        for level in range(1, num_levels + 1):
+            minimum, maximum, total, count = _reduce(minimum, maximum, total, count, factor)
+            mean = total / count.reshape((-1, ) + (1, ) * (values.ndim - 1))
+            yield level, start // factor ** level, np.stack([minimum, maximum, mean], axis=1).astype(np.float32)
+
+
+def build_pyramid(data, factor=FACTOR, min_level_samples=MIN_LEVEL_SAMPLES):
+    """Return the ``(num_pyramid_samples, 3, ...)`` pyramid of ``data`` and its level offsets."""
+    shape = get_data_shape(data)
+    offsets = level_offsets(shape[0], factor, min_level_samples)
+    pyramid = np.empty((int(offsets[-1]), len(STATISTICS)) + tuple(shape[1:]), dtype=np.float32)
+    for level, first_bin, stats in iter_levels(data, factor, min_level_samples):
+        begin = int(offsets[level - 1]) + first_bin
+        pyramid[begin:begin + len(stats)] = stats
+    return pyramid, offsets
+
+
+def add_pyramid(data, factor=FACTOR, min_level_samples=MIN_LEVEL_SAMPLES):
+    """Build the pyramid of the HDF5 dataset ``data`` of a CSD that was already written, in a streaming pass, and
+    store it as data_pyramid next to it. The file must be open for writing, e.g., with NWBHDF5IO(path, mode='a')."""
+    if not isinstance(data, h5py.Dataset):
+        raise ValueError("a pyramid can only be added to the data of a CSD in an HDF5 file")
+    group = data.parent
+    if 'data_pyramid' in group:
+        raise ValueError("CSD '%s' already has a data_pyramid" % group.name)
+    values = data
+    if 'conversion' in data.attrs or 'offset' in data.attrs:
+        # the levels are in volts/meters^2, like the data they summarize
+        values = Dequantized(data, data.attrs.get('conversion', 1.), data.attrs.get('offset', 0.))
+    offsets = level_offsets(data.shape[0], factor, min_level_samples)
+    pyramid = group.create_dataset('data_pyramid', shape=(int(offsets[-1]), len(STATISTICS)) + data.shape[1:],
+                                   dtype=np.float32)
+    pyramid.attrs['unit'] = 'volts/meters^2'
+    pyramid.attrs['decimation_factor'] = np.uint32(factor)
+    pyramid.attrs['level_offsets'] = offsets
+    for level, first_bin, stats in iter_levels(values, factor, min_level_samples):
+        begin = int(offsets[level - 1]) + first_bin
+        pyramid[begin:begin + len(stats)] = stats
+    return pyramid
+
+
+def choose_level(start, stop, num_samples, num_levels, factor=FACTOR):
+    """Return the coarsest level with at least ``num_samples`` bins between time points ``start`` and ``stop``, or 0
+    for the data itself if no level has enough."""
+    for level in range(num_levels, 0, -1):
+        bin_size = factor ** level
+        if -(-stop // bin_size) - start // bin_size >= num_samples:
+            return level
+    return 0
@@ -0,0 +1,109 @@
+"""Storage of CSD data as quantized integers with a scale and an offset.
+
+As for the data of a core TimeSeries, the values of quantized data in volts/meters^2 are ``data * conversion +
+offset``, with conversion and offset stored as attributes of data. int16 data takes half the space of float32 data,
+and int8 data a quarter, in exchange for a quantization error of at most ``conversion / 2``, i.e., 1/65534 (int16)
+or 1/254 (int8) of the range of the data.
+
+The range is found in a streaming pass over blocks of time points, offset is set to its midpoint and conversion so
+that the range maps onto ``[-qmax, qmax]``, symmetric around 0, where qmax is the largest value of the integer type.
+The data is then quantized block by block. Both are stored as float32, and the data is quantized with the float32
+values, so that dequantizing with the stored attributes reproduces the quantized values exactly.
+
+Reading is lazy: Dequantized wraps the stored integers and converts only the elements that are read, so a slice
+reads and converts only its own chunks.
+"""
+import numpy as np
+from hdmf.utils import get_data_shape
+
+DTYPES = ('int16', 'int8')
+
+# raw data read at once when quantizing
+BLOCK_BYTES = 2 ** 26
+
+
+def _block_length(shape, block_bytes):
+    return max(block_bytes // (8 * int(np.prod(shape[1:]))), 1)
+
+
+def check_dtype(dtype):
+    """Return the numpy dtype of ``dtype``, one of DTYPES."""
+    if dtype not in DTYPES:
+        raise ValueError("cannot quantize to '%s', must be one of %s" % (dtype, list(DTYPES)))
+    return np.dtype(dtype)
+
+
+def quantization(data, dtype, block_bytes=BLOCK_BYTES):
+    """Return the float32 ``(conversion, offset)`` that map the range of ``data`` onto ``dtype``, finding the range in
+    one pass over blocks of time points."""
+    dtype = check_dtype(dtype)
+    shape = get_data_shape(data)
+    block = _block_length(shape, block_bytes)
+    low, high = np.inf, -np.inf
+    for start in range(0, shape[0], block):
+        values = np.asarray(data[start:start + block])
+        if not np.isfinite(values).all():
+            raise ValueError("cannot quantize data with NaN or infinite values")
+        if values.size:
+            low, high = min(low, values.min()), max(high, values.max())
+    if not np.isfinite(low):
+        return np.float32(1.), np.float32(0.)
+    qmax = np.iinfo(dtype).max
+    offset = np.float32((float(low) + float(high)) / 2)
+    # the largest distance from the float32 offset, so that rounding the offset does not push values out of range
+    spread = max(float(high) - float(offset), float(offset) - float(low))
+    conversion = np.float32(spread / qmax) if spread > 0 else np.float32(1.)
+    if float(conversion) * qmax < spread:
+        conversion = np.nextafter(conversion, np.float32(np.inf))
+    return conversion, offset
+
+
+def quantize_block(values, conversion, offset, dtype):
+    """Return ``values`` quantized to ``dtype`` with ``conversion`` and ``offset``."""
+    qmax = np.iinfo(dtype).max
+    scaled = (np.asarray(values, dtype=np.float64) - float(offset)) / float(conversion)
+    return np.clip(np.rint(scaled), -qmax, qmax).astype(dtype)
+
+
+def quantize(data, dtype, block_bytes=BLOCK_BYTES):
+    """Return ``data`` quantized to ``dtype``, with its float32 conversion and offset, reading and quantizing one
+    block of time points at a time."""
+    conversion, offset = quantization(data, dtype, block_bytes)
+    dtype = check_dtype(dtype)
+    shape = get_data_shape(data)
+    quantized = np.empty(shape, dtype=dtype)
+    block = _block_length(shape, block_bytes)
+    for start in range(0, shape[0], block):
+        quantized[start:start + block] = quantize_block(data[start:start + block], conversion, offset, dtype)
+    return quantized, conversion, offset
+
+
+class Dequantized:
+    """Read-only, array-like view of quantized data in volts/meters^2, which converts the elements that are read."""
+
+    def __init__(self, data, conversion, offset):
+        self.data = data
+        self.conversion = np.float32(conversion)
+        self.offset = np.float32(offset)
+
+    @property
+    def shape(self):
+        return tuple(get_data_shape(self.data))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        return np.asarray(self.data[key]) * self.conversion + self.offset
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[()]
+        return values if dtype is None else values.astype(dtype)
@@ -0,0 +1,87 @@
+"""Helpers to translate time and coordinate labels into slices of CSD datasets.
+
+The time_from_event and rel_electrode_locations_* datasets are monotonic, so labels are located with a binary search
+that reads only O(log n) elements when the dataset is on disk.
+"""
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+
+class _Negated:
+    """Read-only view of a sequence with negated values, so that descending sequences can be bisected."""
+
+    def __init__(self, values):
+        self.values = values
+        self.dtype = getattr(values, 'dtype', None)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return -self.values[index]
+
+
+def _search(values, value, side):
+    """Return the index at which ``value`` would be inserted into the ascending ``values``.
+
+    ``value`` is compared at the precision of ``values``, so that, e.g., 0.025 matches float32(0.025).
+    """
+    dtype = getattr(values, 'dtype', None)
+    if dtype is not None and np.issubdtype(dtype, np.floating):
+        value = dtype.type(value)
+    if isinstance(values, np.ndarray):
+        return int(np.searchsorted(values, value, side=side))
+    return (bisect_left if side == 'left' else bisect_right)(values, value)
+
+
+def _ascending(values):
+    """Return ``values`` as an ascending sequence along with the sign used to make it ascending."""
+    if len(values) > 1 and values[0] > values[-1]:
+        return (-values if isinstance(values, np.ndarray) else _Negated(values)), -1
+    return values, 1
+
+
+def label_slice(values, start=None, stop=None):
+    """Return the slice of the monotonic ``values`` that lie between ``start`` and ``stop``, inclusive.
+
+    A bound of None leaves that side of the slice open.
+    """
+    if start is not None and stop is not None and start > stop:
+        start, stop = stop, start
+    values, sign = _ascending(values)
+    if sign < 0:
+        start, stop = (None if stop is None else -stop), (None if start is None else -start)
+    lo = 0 if start is None else _search(values, start, 'left')
+    hi = len(values) if stop is None else _search(values, stop, 'right')
+    return slice(lo, max(lo, hi))
+
+
+def nearest_index(values, value):
+    """Return the index of the element of the monotonic ``values`` that is closest to ``value``."""
+    ascending, sign = _ascending(values)
+    index = _search(ascending, sign * value, 'left')
+    if index == len(values):
+        return index - 1
+    if index > 0 and abs(values[index - 1] - value) <= abs(values[index] - value):
+        return index - 1
+    return index
+
+
+def index_slice(key, length):
+    """Convert an integer or slice used to select positions along an axis of ``length`` into a slice.
+
+    Slices with a negative step are rejected, since HDF5 datasets can only be read in increasing order.
+    """
+    if key is None:
+        return slice(0, length)
+    if isinstance(key, slice):
+        if key.step is not None and key.step < 0:
+            raise ValueError("slices with a negative step are not supported, got step %d" % key.step)
+        return slice(*key.indices(length))
+    index = int(key)
+    if index < 0:
+        index += length
+    if not 0 <= index < length:
+        raise IndexError("index %d is out of bounds for axis of length %d" % (key, length))
+    return slice(index, index + 1)
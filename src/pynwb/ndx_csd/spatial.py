@@ -0,0 +1,61 @@
+"""Spatial index of scattered CSD sites, e.g., of probes with staggered layouts or of 3D reconstructions.
+
+The sites are indexed with a KD-tree, so nearest-site, radius and bounding-box queries visit only the branches of the
+tree near the query instead of every site.
+"""
+import numpy as np
+
+
+class SiteIndex:
+    """A KD-tree over the ``(num_sites, ndim)`` coordinates of scattered CSD sites."""
+
+    def __init__(self, coordinates):
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        if coordinates.ndim != 2 or not 1 <= coordinates.shape[1] <= 3:
+            raise ValueError("site coordinates must have shape (num_sites, ndim) with ndim 1, 2 or 3, not %s"
+                             % (coordinates.shape, ))
+        # scipy.spatial is imported when needed, as it is slow to import
+        from scipy.spatial import KDTree
+        self.coordinates = coordinates
+        self.tree = KDTree(coordinates)
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    @property
+    def ndim(self):
+        return self.coordinates.shape[1]
+
+    def _point(self, point):
+        point = np.asarray(point, dtype=np.float64).reshape(-1)
+        if len(point) != self.ndim:
+            raise ValueError("point %s has %d coordinates but the sites have %d" % (point, len(point), self.ndim))
+        return point
+
+    def nearest(self, point, k=1):
+        """Return the distances to and the indices of the ``k`` sites nearest to ``point``, nearest first."""
+        k = min(k, len(self))
+        distances, indices = self.tree.query(self._point(point), k=[i + 1 for i in range(k)])
+        return np.asarray(distances), np.asarray(indices, dtype=np.intp)
+
+    def within(self, point, radius):
+        """Return the sorted indices of the sites within ``radius`` of ``point``."""
+        indices = self.tree.query_ball_point(self._point(point), radius)
+        return np.sort(np.asarray(indices, dtype=np.intp))
+
+    def in_box(self, lower, upper):
+        """Return the sorted indices of the sites inside the axis-aligned box from ``lower`` to ``upper``, inclusive.
+
+        The tree is searched for the sites within half the largest side of the box from its center, in Chebyshev
+        distance, and those are filtered to the box.
+        """
+        lower, upper = self._point(lower), self._point(upper)
+        if np.any(lower > upper):
+            raise ValueError("the lower corner %s of the box is above its upper corner %s" % (lower, upper))
+        center, radius = (lower + upper) / 2, ((upper - lower) / 2).max()
+        # pad the radius so that rounding of the center cannot exclude sites on the faces of the box
+        radius += 1e-9 * max(radius, np.abs(center).max())
+        candidates = np.asarray(self.tree.query_ball_point(center, radius, p=np.inf), dtype=np.intp)
+        coordinates = self.coordinates[candidates]
+        inside = np.all((coordinates >= lower) & (coordinates <= upper), axis=1)
+        return np.sort(candidates[inside])
@@ -0,0 +1,101 @@
+"""Band-limited CSD with FIR filters applied by batched FFT overlap-save convolution.
+
+A band is filtered with a linear-phase FIR kernel: a Hamming-windowed low-pass of half the bandwidth, modulated to the
+center of the band. Its real part is a band-pass filter, and the kernel itself gives the analytic signal of the band,
+whose absolute value is the amplitude envelope. Kernels have an odd number of taps, so the filtered value at a time
+point is centered on it, and a signal is padded by half the kernel length on each side to filter a window without edge
+effects.
+
+Filtering is a 'valid' convolution along the time axis, computed by overlap-save: the signal is cut into overlapping
+blocks of a fixed FFT length, and each block is transformed once, for all trials, channels and kernels at once, so the
+memory used depends on the FFT length rather than on the length of the signal. Since the CSD estimators and trial
+averaging are linear, a band-limited average CSD is filtered once, after averaging; only the amplitude envelope,
+which is not linear, is computed trial by trial.
+"""
+import numpy as np
+
+# the transition bands of a kernel are this fraction of the bandwidth wide
+TRANSITION_FRACTION = 0.25
+
+# the FFT length of overlap-save convolution is at least this many times the kernel length
+FFT_FACTOR = 4
+
+
+def check_band(band, rate):
+    """Return ``band`` as a (low, high) pair of floats, checking that it lies strictly between 0 and the Nyquist
+    frequency."""
+    low, high = (float(edge) for edge in band)
+    if not 0 < low < high < rate / 2:
+        raise ValueError("the frequency band must satisfy 0 < low < high < %g Hz (the Nyquist frequency), got "
+                         "(%g, %g)" % (rate / 2, low, high))
+    return low, high
+
+
+def num_taps(band, rate):
+    """Return the odd number of taps of the kernel of ``band`` at ``rate``, for transition bands of
+    TRANSITION_FRACTION times the bandwidth."""
+    low, high = check_band(band, rate)
+    # a Hamming window has a transition band of about 3.3 / num_taps times the rate
+    taps = int(np.ceil(3.3 * rate / (TRANSITION_FRACTION * (high - low))))
+    return taps + 1 - taps % 2
+
+
+def band_kernel(band, rate, taps=None):
+    """Return the complex kernel of ``taps`` taps, by default num_taps(band, rate), whose real part is a band-pass
+    filter of ``band`` and whose imaginary part is its Hilbert transform."""
+    # scipy.signal and scipy.fft are imported when needed, as they are slow to import
+    from scipy import signal
+    low, high = check_band(band, rate)
+    taps = num_taps(band, rate) if taps is None else taps
+    lowpass = signal.firwin(taps, (high - low) / 2, window='hamming', fs=rate)
+    phase = 2 * np.pi * (low + high) / 2 / rate * (np.arange(taps) - taps // 2)
+    return 2 * lowpass * np.exp(1j * phase)
+
+
+def band_kernels(bands, rate):
+    """Return the complex kernels of ``bands`` as one ``(num_bands, taps)`` array, padding shorter kernels with zeros
+    on both sides, so that they share the length and center of the longest."""
+    taps = max(num_taps(band, rate) for band in bands)
+    kernels = np.zeros((len(bands), taps), dtype=np.complex128)
+    for row, band in enumerate(bands):
+        kernel = band_kernel(band, rate)
+        start = (taps - len(kernel)) // 2
+        kernels[row, start:start + len(kernel)] = kernel
+    return kernels
+
+
+def overlap_save(values, kernels, axis=0, fft_length=None):
+    """Return the 'valid' convolution of ``values`` with ``kernels`` along ``axis``, which has ``taps - 1`` fewer
+    elements than ``values``. A 1D kernel gives an array of the shape of the result, and a 2D stack of kernels one
+    result per kernel, along a new first axis. Real kernels give real results. ``fft_length`` defaults to the next
+    fast FFT length of at least FFT_FACTOR times the number of taps."""
+    from scipy import fft
+    values = np.moveaxis(np.asarray(values), axis, 0)
+    kernels = np.asarray(kernels)
+    stacked = np.atleast_2d(kernels)
+    taps = stacked.shape[1]
+    length = len(values) - taps + 1
+    if length < 1:
+        raise ValueError("cannot filter %d samples with a kernel of %d taps" % (len(values), taps))
+    fft_length = fft.next_fast_len(FFT_FACTOR * taps) if fft_length is None else fft_length
+    if fft_length < taps:
+        raise ValueError("the FFT length must be at least the number of taps, %d" % taps)
+    step = fft_length - taps + 1
+    if np.iscomplexobj(stacked):
+        forward, inverse, dtype = fft.fft, fft.ifft, np.complex128
+    else:
+        forward, inverse, dtype = fft.rfft, fft.irfft, np.float64
+    spectra = forward(stacked, fft_length, axis=1).reshape(stacked.shape[:1] + (-1, ) + (1, ) * (values.ndim - 1))
+    result = np.empty((len(stacked), length) + values.shape[1:], dtype=dtype)
+    for start in range(0, length, step):
+        count = min(step, length - start)
+        block = forward(values[start:start + count + taps - 1], fft_length, axis=0)
+        # the first taps - 1 values of each block wrap around, the rest equal the linear convolution
+        result[:, start:start + count] = inverse(block * spectra, fft_length, axis=1)[:, taps - 1:taps - 1 + count]
+    result = np.moveaxis(result, 1, axis + 1)
+    return result[0] if kernels.ndim == 1 else result
+
+
+def band_filter(values, band, rate, axis=0):
+    """Band-pass filter ``values``, padded by num_taps(band, rate) // 2 samples on each side, along ``axis``."""
+    return overlap_save(values, band_kernel(band, rate).real, axis)
@@ -0,0 +1,109 @@
+"""Per-electrode summary statistics of CSD data, stored next to it for quality control without reading data.
+
+For each electrode, i.e., each position along the spatial axes of data, the summary holds the minimum, maximum and
+mean of data over time and the time from event of its peak, the first time point with the largest absolute value.
+They are computed in one streaming pass over blocks of time points when a CSD is constructed with summarize=True,
+and stored as the small data_min, data_max, data_mean and data_peak_time datasets, so that a dashboard reads a few
+kilobytes per file instead of data. Data from a data chunk iterator or a dask array is read only while it is written,
+after the other datasets of the CSD, so it is not summarized at construction. add_summary adds the summary to a CSD
+that was written without one. RunningSummary keeps the state of the pass, so that a summary can also be continued with
+time points appended later.
+"""
+import collections
+
+import h5py
+import numpy as np
+from hdmf.utils import get_data_shape
+
+from .quantize import Dequantized
+
+# raw data read at once when summarizing
+BLOCK_BYTES = 2 ** 26
+
+FIELDS = ('data_min', 'data_max', 'data_mean', 'data_peak_time')
+
+Summary = collections.namedtuple('Summary', ['min', 'max', 'mean', 'peak_time'])
+Summary.__doc__ = """Minimum, maximum and mean of the data of each electrode over time, in volts/meters^2, and the time
+from event of its peak, in seconds."""
+
+
+class RunningSummary:
+    """Summary of data that is updated one block of time points at a time, as they are read or appended."""
+
+    def __init__(self, shape):
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+        self.total = np.zeros(shape)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.peak = np.full(shape, -1.)
+        self.peak_time = np.full(shape, np.nan)
+
+    @classmethod
+    def from_summary(cls, summary, num_times):
+        """Return a RunningSummary that continues ``summary``, the Summary of ``num_times`` time points. Its mean is
+        weighted by ``num_times``, since the number of values that are not NaN is not stored."""
+        minimum, maximum, mean, peak_time = (np.asarray(values, dtype=np.float64) for values in summary)
+        running = cls(minimum.shape)
+        empty = np.isnan(mean)
+        running.minimum = np.where(empty, np.inf, minimum)
+        running.maximum = np.where(empty, -np.inf, maximum)
+        running.count = np.where(empty, 0, num_times)
+        running.total = np.where(empty, 0., mean * num_times)
+        # the peak is the largest absolute value, i.e., that of the minimum or the maximum
+        running.peak = np.where(empty, -1., np.fmax(-running.minimum, running.maximum))
+        running.peak_time = peak_time
+        return running
+
+    def add(self, values, time_from_event):
+        """Update the summary with ``values``, the next block of time points, at times ``time_from_event``."""
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        self.minimum = np.fmin(self.minimum, np.where(valid, values, np.inf).min(axis=0))
+        self.maximum = np.fmax(self.maximum, np.where(valid, values, -np.inf).max(axis=0))
+        self.total += np.where(valid, values, 0.).sum(axis=0)
+        self.count += valid.sum(axis=0)
+        magnitude = np.where(valid, np.abs(values), -1.)
+        block_index = magnitude.argmax(axis=0)
+        block_peak = np.take_along_axis(magnitude, block_index[np.newaxis], axis=0)[0]
+        # a later block only takes over a strictly larger peak, so ties go to the first time point
+        larger = block_peak > self.peak
+        self.peak = np.where(larger, block_peak, self.peak)
+        self.peak_time = np.where(larger, np.asarray(time_from_event, dtype=np.float64)[block_index], self.peak_time)
+
+    def summary(self):
+        """Return the float32 Summary of the values added so far. Electrodes without any value that is not NaN get
+        NaN."""
+        empty = self.count == 0
+        mean = np.divide(self.total, self.count, out=np.full(self.total.shape, np.nan), where=~empty)
+        minimum, maximum = np.where(empty, np.nan, self.minimum), np.where(empty, np.nan, self.maximum)
+        return Summary(*(np.asarray(values, dtype=np.float32) for values in (minimum, maximum, mean, self.peak_time)))
+
+
+def summarize(data, time_from_event, block_bytes=BLOCK_BYTES):
+    """Return the float32 Summary of ``data``, reading one block of time points at a time. NaN values are ignored,
+    and electrodes without any other value get NaN."""
+    shape = get_data_shape(data)
+    times = np.asarray(time_from_event, dtype=np.float64)
+    block = max(block_bytes // (8 * int(np.prod(shape[1:]))), 1)
+    running = RunningSummary(shape[1:])
+    for start in range(0, shape[0], block):
+        running.add(data[start:start + block], times[start:start + block])
+    return running.summary()
+
+
+def add_summary(data):
+    """Compute the summary of the HDF5 dataset ``data`` of a CSD that was already written, in a streaming pass, and
+    store it next to it. The file must be open for writing, e.g., with NWBHDF5IO(path, mode='a')."""
+    if not isinstance(data, h5py.Dataset):
+        raise ValueError("a summary can only be added to the data of a CSD in an HDF5 file")
+    group = data.parent
+    if 'data_min' in group:
+        raise ValueError("CSD '%s' already has a summary" % group.name)
+    values = data
+    if 'conversion' in data.attrs or 'offset' in data.attrs:
+        values = Dequantized(data, data.attrs.get('conversion', 1.), data.attrs.get('offset', 0.))
+    summary = summarize(values, group['time_from_event'][:])
+    for field, statistic in zip(FIELDS, summary):
+        dataset = group.create_dataset(field, data=statistic)
+        dataset.attrs['unit'] = 'seconds' if field == 'data_peak_time' else 'volts/meters^2'
+    return summary
@@ -0,0 +1,68 @@
+"""Averages of subsets of the trials of a CSD, from per-trial data and sums over blocks of trials.
+
+trial_data holds the CSD of each trial, and trial_block_sums the sum of trial_data over each block of
+``block_size`` consecutive trials. The sum of a subset of trials is then accumulated block by block: a block of
+which at most half of the trials are selected contributes the selected trials, and any other block contributes its
+sum minus the trials that are not selected. At most half of the trials of a block are read, none for blocks that
+are entirely selected, and only the chunks of the trials that are read are touched, since trial_data is chunked by
+trial.
+"""
+import numpy as np
+from hdmf.utils import get_data_shape
+
+BLOCK_SIZE = 16
+
+
+def block_sums(trial_data, block_size=BLOCK_SIZE):
+    """Return the float64 sums of ``trial_data`` over consecutive blocks of ``block_size`` trials, reading one block
+    at a time."""
+    shape = get_data_shape(trial_data)
+    sums = np.empty((-(-shape[0] // block_size), ) + tuple(shape[1:]), dtype=np.float64)
+    for block, start in enumerate(range(0, shape[0], block_size)):
+        sums[block] = np.asarray(trial_data[start:start + block_size]).sum(axis=0, dtype=np.float64)
+    return sums
+
+
+def trial_positions(trials, num_trials):
+    """Return the sorted, unique positions of the trials selected by ``trials``, which are positions, negative ones
+    counting from the end, or a boolean mask over all trials."""
+    trials = np.asarray(trials)
+    if trials.dtype == bool:
+        if len(trials) != num_trials:
+            raise ValueError("the boolean mask of trials has %d elements but there are %d trials"
+                             % (len(trials), num_trials))
+        return np.flatnonzero(trials)
+    positions = trials.astype(np.intp).reshape(-1)
+    positions = np.where(positions < 0, positions + num_trials, positions)
+    if len(positions) and (positions.min() < 0 or positions.max() >= num_trials):
+        raise IndexError("trial positions must be between %d and %d" % (-num_trials, num_trials - 1))
+    return np.unique(positions)
+
+
+def _sum_rows(trial_data, rows):
+    """Sum the sorted ``rows`` of ``trial_data``, reading each run of consecutive rows with one slice."""
+    total = 0.
+    breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+    for run in np.split(rows, breaks):
+        if len(run):
+            total = total + np.asarray(trial_data[run[0]:run[-1] + 1]).sum(axis=0, dtype=np.float64)
+    return total
+
+
+def subset_sum(trial_data, sums, block_size, positions):
+    """Return the float64 sum of the trials of ``trial_data`` at the sorted, unique ``positions``, using the block
+    ``sums`` where that reads fewer trials. If ``sums`` is None, the selected trials are read."""
+    num_trials = get_data_shape(trial_data)[0]
+    total = np.zeros(get_data_shape(trial_data)[1:], dtype=np.float64)
+    if sums is None:
+        return total + _sum_rows(trial_data, positions)
+    blocks = positions // block_size
+    for block in np.unique(blocks):
+        start, stop = block * block_size, min((block + 1) * block_size, num_trials)
+        selected = positions[blocks == block]
+        if 2 * len(selected) <= stop - start:
+            total += _sum_rows(trial_data, selected)
+        else:
+            total += np.asarray(sums[block])
+            total -= _sum_rows(trial_data, np.setdiff1d(np.arange(start, stop), selected))
+    return total
@@ -0,0 +1,116 @@
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from pynwb import NWBHDF5IO, NWBFile
+from pynwb.ecephys import LFP, ElectricalSeries
+from pynwb.testing import TestCase
+
+from ndx_csd import CSD
+from ndx_csd import cli
+
+
+def write_session(path, lfp, stimuli, rate=1000.):
+    """Write an NWB file with an LFP ElectricalSeries and a trials table with a 'stimulus' column."""
+    nwbfile = NWBFile(
+        session_description='session_description',
+        identifier=os.path.basename(path),
+        session_start_time=datetime.datetime.now(datetime.timezone.utc)
+    )
+    device = nwbfile.create_device(name='probe')
+    group = nwbfile.create_electrode_group(name='shank', description='shank', location='brain', device=device)
+    for _ in range(lfp.shape[1]):
+        nwbfile.add_electrode(location='brain', group=group)
+    electrodes = nwbfile.create_electrode_table_region(region=list(range(lfp.shape[1])), description='all')
+    # a raw ElectricalSeries next to the LFP, which the batch must not pick
+    nwbfile.add_acquisition(ElectricalSeries(name='raw', data=lfp[:10], electrodes=electrodes, rate=rate))
+    module = nwbfile.create_processing_module(name='ecephys', description='processed ecephys data')
+    module.add(LFP(electrical_series=ElectricalSeries(name='LFP', data=lfp, electrodes=electrodes, rate=rate)))
+    nwbfile.add_trial_column(name='stimulus', description='stimulus shown')
+    for index, stimulus in enumerate(stimuli):
+        nwbfile.add_trial(start_time=0.5 + index, stop_time=1. + index, stimulus=stimulus)
+    with NWBHDF5IO(path, mode='w') as nwb_io:
+        nwb_io.write(nwbfile)
+
+
+class TestBatch(TestCase):
+    """Test the ndx-csd batch command on a directory of NWB files."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.lfp = np.random.rand(5000, 8)
+        self.stimuli = ['flash', 'tone', 'flash', 'tone']
+        for index in range(3):
+            write_session(os.path.join(self.directory, 'session%d.nwb' % index), self.lfp, self.stimuli)
+        self.log = os.path.join(self.directory, 'batch.jsonl')
+        self.pattern = os.path.join(self.directory, '*.nwb')
+        self.options = {'window': (-0.05, 0.1), 'spacing': 20e-6, 'event_column': 'stimulus',
+                        'time_column': 'start_time', 'lfp': None, 'name': 'CSD', 'batch_size': 2,
+                        'write_profile': None, 'replace': False}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_batch(self):
+        """Test that one CSD per event type is written to each file, and that a second run skips the files."""
+        stream = io.StringIO()
+        records = cli.batch(self.pattern, self.options, jobs=1, log=self.log, stream=stream)
+        self.assertEqual([record['status'] for record in records], ['done'] * 3)
+        self.assertIn('session0.nwb: 2 CSDs in', stream.getvalue())
+
+        with NWBHDF5IO(os.path.join(self.directory, 'session1.nwb'), mode='r', load_namespaces=True) as nwb_io:
+            module = nwb_io.read().processing['ecephys']
+            flash = module['CSD_flash']
+            self.assertEqual(flash.num_trials, 2)
+            self.assertEqual(flash.event_description, 'start_time of trials with stimulus flash')
+            expected = CSD.from_lfp(electrical_series=module['LFP']['LFP'], event_times=[0.5, 2.5],
+                                    window=(-0.05, 0.1), spacing=20e-6, event_description='flash')
+            np.testing.assert_allclose(flash.data[:], expected.data)
+            self.assertIn('CSD_tone', module.data_interfaces)
+
+        stream = io.StringIO()
+        self.assertListEqual(cli.batch(self.pattern, self.options, jobs=1, log=self.log, stream=stream), [])
+        self.assertIn('3 already done, 0 to process', stream.getvalue())
+
+    def test_written_but_not_logged(self):
+        """Test that CSDs that a file already holds, after a crash between writing and logging, are skipped, or
+        replaced with the replace option."""
+        path = os.path.join(self.directory, 'session0.nwb')
+        self.assertEqual(cli.process_file(path, self.options)['status'], 'done')
+        record = cli.process_file(path, self.options)
+        self.assertEqual(record['status'], 'done')
+        self.assertListEqual(record['csds'], [])
+        self.assertListEqual(record['skipped'], ['CSD_flash', 'CSD_tone'])
+
+        record = cli.process_file(path, dict(self.options, replace=True, window=(-0.02, 0.02)))
+        self.assertEqual(record['status'], 'done')
+        self.assertListEqual(record['csds'], ['CSD_flash', 'CSD_tone'])
+        self.assertListEqual(record['skipped'], [])
+        with NWBHDF5IO(path, mode='r', load_namespaces=True) as nwb_io:
+            self.assertEqual(nwb_io.read().processing['ecephys']['CSD_tone'].data.shape, (41, 6))
+
+    def test_failure(self):
+        """Test that a file that fails is reported and retried on the next run."""
+        options = dict(self.options, event_column='missing')
+        records = cli.batch(self.pattern, options, jobs=1, log=self.log, stream=io.StringIO())
+        self.assertEqual(records[0]['status'], 'failed')
+        self.assertSetEqual(cli.read_done(self.log), set())
+        self.assertEqual(len(cli.batch(self.pattern, self.options, jobs=1, log=self.log, stream=io.StringIO())), 3)
+
+    def test_main(self):
+        """Test the command line with a pool of worker processes, resuming from a log with a cut-off line."""
+        done = os.path.abspath(os.path.join(self.directory, 'session0.nwb'))
+        with open(self.log, 'w') as file:
+            file.write(json.dumps({'path': done, 'status': 'done'}) + '\n{"path": ')
+        status = cli.main(['batch', self.pattern, '--window', '-0.05', '0.1', '--spacing', '20e-6', '--jobs', '2',
+                           '--log', self.log])
+        self.assertEqual(status, 0)
+        self.assertEqual(len(cli.read_done(self.log)), 3)
+        with NWBHDF5IO(os.path.join(self.directory, 'session2.nwb'), mode='r', load_namespaces=True) as nwb_io:
+            self.assertEqual(nwb_io.read().processing['ecephys']['CSD'].num_trials, 4)
+        with NWBHDF5IO(done, mode='r', load_namespaces=True) as nwb_io:
+            self.assertNotIn('CSD', nwb_io.read().processing['ecephys'].data_interfaces)
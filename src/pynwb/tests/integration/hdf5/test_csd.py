@@ -1,9 +1,24 @@
 import datetime
+import unittest
+
 import numpy as np
+from hdmf.common import DynamicTableRegion
 from pynwb import NWBHDF5IO, NWBFile
 from pynwb.testing import TestCase, remove_test_file, NWBH5IOMixin
 
-from ndx_csd import CSD
+from ndx_csd import CSD, CSDSet
+from ndx_csd.append import extend_time, merge_trials
+from ndx_csd.iterators import BlockIterator
+from ndx_csd.pyramid import add_pyramid
+from ndx_csd.summary import FIELDS, add_summary, summarize
+
+from ...utils import make_csd
+
+try:
+    import dask.array as da
+    HAVE_DASK = True
+except ImportError:
+    HAVE_DASK = False
 
 
 class TestCSDRoundtrip(TestCase):
@@ -94,3 +109,696 @@ class TestCSDRoundtripPyNWB(NWBH5IOMixin, TestCase):
     def getContainer(self, nwbfile):
         """Get the test CSD to the given NWBFile."""
         return nwbfile.processing['ecephys']['CSD']
+
+
+class TestCSDScatteredRoundtrip(NWBH5IOMixin, TestCase):
+    """Roundtrip test for a CSD of scattered sites using pynwb.testing infrastructure."""
+
+    def setUpContainer(self):
+        """ Return the test CSD to read/write """
+        return CSD(
+            name='CSD',
+            description='CSD of staggered probe',
+            num_trials=np.uint(50),
+            data=np.random.rand(101, 64).astype(np.float32),
+            time_from_event=np.linspace(-1, 1, num=101, dtype=np.float32),
+            event_description='Stimulus onset',
+            rel_electrode_coordinates=np.random.rand(64, 2).astype(np.float32) * 0.001,
+            electrodes_reference_frame='(0, 0) is the bottom left corner of the probe, +x is right, +y is superior'
+        )
+
+    def addContainer(self, nwbfile):
+        """ Add the test CSD to the given NWBFile """
+        nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(self.container)
+
+    def getContainer(self, nwbfile):
+        """ Return the test CSD from the given NWBFile """
+        return nwbfile.processing['ecephys']['CSD']
+
+    def test_site_index(self):
+        """Test that the spatial index is built from the coordinates read from the file."""
+        self.read_container = self.roundtripContainer()
+        coordinates = self.container.rel_electrode_coordinates
+        _, indices = self.read_container.site_index.nearest(coordinates[10], k=3)
+        self.assertEqual(indices[0], 10)
+        np.testing.assert_array_equal(indices, self.container.site_index.nearest(coordinates[10], k=3)[1])
+
+
+class TestCSDVarianceRoundtrip(NWBH5IOMixin, TestCase):
+    """Roundtrip test for a CSD with its variance and number of trials per cell using pynwb.testing infrastructure."""
+
+    def setUpContainer(self):
+        """ Return the test CSD to read/write """
+        n_per_cell = np.full((101, 32), 50, dtype=np.uint32)
+        n_per_cell[:, 0] = 49
+        return CSD(
+            name='CSD',
+            description='CSD of linear probe',
+            num_trials=np.uint(50),
+            data=np.random.rand(101, 32).astype(np.float32),
+            time_from_event=np.linspace(-1, 1, num=101, dtype=np.float32),
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.002, num=32, dtype=np.float32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            data_variance=np.random.rand(101, 32).astype(np.float32),
+            n_per_cell=n_per_cell
+        )
+
+    def addContainer(self, nwbfile):
+        """ Add the test CSD to the given NWBFile """
+        nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(self.container)
+
+    def getContainer(self, nwbfile):
+        """ Return the test CSD from the given NWBFile """
+        return nwbfile.processing['ecephys']['CSD']
+
+
+class TestCSDBandRoundtrip(NWBH5IOMixin, TestCase):
+    """Roundtrip test for a band-limited CSD using pynwb.testing infrastructure."""
+
+    def setUpContainer(self):
+        """ Return the test CSD to read/write """
+        return CSD(
+            name='CSD',
+            description='Gamma-band CSD of linear probe',
+            num_trials=np.uint(50),
+            data=np.random.rand(101, 32).astype(np.float32),
+            time_from_event=np.linspace(-1, 1, num=101, dtype=np.float32),
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.002, num=32, dtype=np.float32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            frequency_band=(30., 80.)
+        )
+
+    def addContainer(self, nwbfile):
+        """ Add the test CSD to the given NWBFile """
+        nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(self.container)
+
+    def getContainer(self, nwbfile):
+        """ Return the test CSD from the given NWBFile """
+        return nwbfile.processing['ecephys']['CSD']
+
+
+class TestCSDQuantizedRoundtrip(NWBH5IOMixin, TestCase):
+    """Roundtrip test for a CSD with quantized data using pynwb.testing infrastructure."""
+
+    def setUpContainer(self):
+        """ Return the test CSD to read/write """
+        return CSD(
+            name='CSD',
+            description='CSD of linear probe',
+            num_trials=np.uint(50),
+            data=np.random.randn(101, 32).astype(np.float32),
+            time_from_event=np.linspace(-1, 1, num=101, dtype=np.float32),
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.002, num=32, dtype=np.float32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            quantize='int16'
+        )
+
+    def addContainer(self, nwbfile):
+        """ Add the test CSD to the given NWBFile """
+        nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(self.container)
+
+    def getContainer(self, nwbfile):
+        """ Return the test CSD from the given NWBFile """
+        return nwbfile.processing['ecephys']['CSD']
+
+    def test_scaled_data(self):
+        """Test that quantized data is stored as int16 with its conversion and offset, and dequantized when read."""
+        read_csd = self.roundtripContainer()
+        self.assertEqual(read_csd.data.dtype, np.int16)
+        self.assertEqual(read_csd.data.attrs['conversion'], self.container.data_conversion)
+        self.assertEqual(read_csd.data.attrs['offset'], self.container.data_offset)
+        np.testing.assert_array_equal(read_csd.scaled_data[10:20], self.container.scaled_data[10:20])
+        np.testing.assert_array_equal(read_csd.sel(time=slice(-0.5, 0.5)).data,
+                                      self.container.sel(time=slice(-0.5, 0.5)).data)
+
+
+class TestCSDWriteProfiles(TestCase):
+    """Test that write profiles set the chunking and compression of the datasets in the file."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = 'test_profiles.nwb'
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def roundtrip(self, write_profile, data):
+        csd = CSD(
+            name='csd',
+            description='CSD of electrode array',
+            num_trials=np.uint(50),
+            data=data,
+            time_from_event=np.linspace(-1, 1, num=data.shape[0], dtype=np.float32),
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.002, num=data.shape[1], dtype=np.float32),
+            rel_electrode_locations_y=np.linspace(0, 0.002, num=data.shape[2], dtype=np.float32),
+            electrodes_reference_frame='(0, 0) is most inferior, most left electrode of array',
+            write_profile=write_profile
+        )
+        ecephys_module = self.nwbfile.create_processing_module(
+            name='ecephys',
+            description='processed ecephys data'
+        )
+        ecephys_module.add(csd)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        io = NWBHDF5IO(self.path, mode='r', load_namespaces=True)
+        self.addCleanup(io.close)
+        read_csd = io.read().processing['ecephys']['csd']
+        np.testing.assert_array_equal(read_csd.data[:], data)
+        return read_csd
+
+    def test_time_slice(self):
+        read_csd = self.roundtrip('time-slice', np.random.rand(2000, 16, 16).astype(np.float32))
+        self.assertEqual(read_csd.data.chunks, (1024, 16, 16))
+        self.assertEqual(read_csd.data.compression, 'gzip')
+        self.assertTrue(read_csd.data.shuffle)
+        self.assertEqual(read_csd.time_from_event.compression, 'gzip')
+        self.assertEqual(read_csd.rel_electrode_locations_y.chunks, (16, ))
+
+    def test_channel_trace(self):
+        read_csd = self.roundtrip('channel-trace', np.random.rand(2000, 16, 16).astype(np.float32))
+        self.assertEqual(read_csd.data.chunks, (2000, 8, 16))
+
+    def test_archive(self):
+        read_csd = self.roundtrip('archive', np.random.rand(2000, 16, 16).astype(np.float32))
+        self.assertEqual(read_csd.data.compression_opts, 9)
+
+
+class TestCSDSelection(TestCase):
+    """Test label-based selection on a CSD read from a file."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = 'test_selection.nwb'
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_sel(self):
+        num_times = 20001
+        data = np.random.rand(num_times, 32).astype(np.float32)
+        time_from_event = np.linspace(-1, 1, num=num_times, dtype=np.float32)
+        csd = CSD(
+            name='csd',
+            description='CSD of linear probe',
+            num_trials=np.uint(50),
+            data=data,
+            time_from_event=time_from_event,
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.0031, num=32, dtype=np.float32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior'
+        )
+        self.nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(csd)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_csd = io.read().processing['ecephys']['csd']
+            view = read_csd.sel(time=slice(-0.025, 0.025), x=slice(0.001, 0.002))
+            window = slice(np.searchsorted(time_from_event, np.float32(-0.025)),
+                           np.searchsorted(time_from_event, np.float32(0.025), 'right'))
+            np.testing.assert_array_equal(view.data, data[window, 10:21])
+            np.testing.assert_array_equal(view.time_from_event, time_from_event[window])
+            self.assertIsInstance(view.data, np.ndarray)
+
+    def test_as_memmap(self):
+        """Test that contiguous data is memory-mapped, and that selections are views of the map."""
+        data = np.random.rand(1001, 32).astype(np.float32)
+        for name, write_profile in (('contiguous', None), ('chunked', 'time-slice')):
+            csd = CSD(
+                name=name,
+                description='CSD of linear probe',
+                num_trials=np.uint(50),
+                data=data,
+                time_from_event=np.linspace(-1, 1, num=1001, dtype=np.float32),
+                event_description='Stimulus onset',
+                electrodes_reference_frame='0 is bottom of probe, +x is superior',
+                write_profile=write_profile
+            )
+            self.nwbfile.add_acquisition(csd)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_nwbfile = io.read()
+            contiguous, chunked = read_nwbfile.acquisition['contiguous'], read_nwbfile.acquisition['chunked']
+            mapped = contiguous.as_memmap()
+            self.assertIsInstance(mapped, np.memmap)
+            np.testing.assert_array_equal(mapped, data)
+            view = contiguous.isel(time=slice(100, 200))
+            self.assertFalse(view.data.flags.owndata)
+            np.testing.assert_array_equal(view.data, data[100:200])
+            self.assertIs(chunked.as_memmap(), chunked.data)
+            with self.assertRaisesWith(ValueError, "cannot memory-map dataset '/acquisition/chunked/data' because it "
+                                                   "is chunked"):
+                chunked.as_memmap(fallback=False)
+            np.testing.assert_array_equal(chunked.isel(time=slice(100, 200)).data, data[100:200])
+        np.testing.assert_array_equal(mapped[:10], data[:10])
+
+
+class TestCSDPyramid(TestCase):
+    """Test the multi-resolution pyramid of a CSD written to and read from a file."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = 'test_pyramid.nwb'
+        self.data = np.random.rand(50000, 16).astype(np.float32)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_roundtrip(self):
+        """Test that a pyramid built at construction is written, and read back with its attributes."""
+        csd = make_csd(self.data, 'csd', pyramid_factor=8, write_profile='time-slice')
+        self.nwbfile.add_acquisition(csd)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_csd = io.read().acquisition['csd']
+            self.assertEqual(read_csd.pyramid_factor, 8)
+            np.testing.assert_array_equal(read_csd.pyramid_level_offsets, csd.pyramid_level_offsets)
+            overview, expected = read_csd.overview(2000), csd.overview(2000)
+            self.assertEqual(overview.bin_size, 8)
+            np.testing.assert_array_equal(overview.max, expected.max)
+            np.testing.assert_array_equal(overview.time_from_event, expected.time_from_event)
+
+    def test_add_pyramid(self):
+        """Test that a pyramid can be added to a CSD that was written without one."""
+        self.nwbfile.add_acquisition(make_csd(self.data, 'csd'))
+        self.nwbfile.add_acquisition(make_csd(self.data, 'reference', pyramid_factor=8))
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='a', load_namespaces=True) as io:
+            read_csd = io.read().acquisition['csd']
+            self.assertIsNone(read_csd.data_pyramid)
+            self.assertEqual(read_csd.overview(100).bin_size, 1)
+            add_pyramid(read_csd.data)
+            with self.assertRaisesWith(ValueError, "CSD '/acquisition/csd' already has a data_pyramid"):
+                add_pyramid(read_csd.data)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            acquisition = io.read().acquisition
+            read_csd, reference = acquisition['csd'], acquisition['reference']
+            np.testing.assert_array_equal(read_csd.pyramid_level_offsets, reference.pyramid_level_offsets)
+            np.testing.assert_array_equal(read_csd.data_pyramid[:], reference.data_pyramid[:])
+            self.assertEqual(read_csd.overview(100).bin_size, 64)
+
+    def test_add_pyramid_quantized(self):
+        """Test that the pyramid added to a CSD with quantized data is in volts/meters^2, not in quantized units."""
+        self.nwbfile.add_acquisition(make_csd(self.data, 'csd', quantize='int16'))
+        self.nwbfile.add_acquisition(make_csd(self.data, 'reference', pyramid_factor=8))
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='a', load_namespaces=True) as io:
+            add_pyramid(io.read().acquisition['csd'].data)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            acquisition = io.read().acquisition
+            read_csd, reference = acquisition['csd'], acquisition['reference']
+            self.assertEqual(read_csd.data.dtype, np.int16)
+            # the error of int16 quantization is at most 1/65534 of the range of data
+            np.testing.assert_allclose(read_csd.data_pyramid[:], reference.data_pyramid[:], atol=1 / 65534)
+
+
+class TestCSDSummary(TestCase):
+    """Test the per-electrode summary of a CSD written to and read from a file."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = 'test_summary.nwb'
+        self.data = np.random.randn(1000, 16).astype(np.float32)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_roundtrip(self):
+        """Test that the summary is computed at construction on request, written, and read without reading data."""
+        csd = make_csd(self.data, 'csd', quantize='int16', summarize=True)
+        np.testing.assert_allclose(csd.data_min, self.data.min(axis=0), rtol=1e-6)
+        self.nwbfile.add_acquisition(csd)
+        self.nwbfile.add_acquisition(make_csd(self.data, 'unsummarized'))
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            acquisition = io.read().acquisition
+            read_csd = acquisition['csd']
+            self.assertEqual(read_csd.data_min.attrs['unit'], 'volts/meters^2')
+            for read_values, values in zip(read_csd.data_summary, csd.data_summary):
+                np.testing.assert_array_equal(read_values, values)
+            # a CSD that was written without a summary is not summarized when it is read, only on first use
+            unsummarized = acquisition['unsummarized']
+            self.assertIsNone(unsummarized.data_min)
+            np.testing.assert_allclose(unsummarized.data_summary.max, self.data.max(axis=0))
+
+    def test_add_summary(self):
+        """Test that a summary can be added to a CSD that was written without one."""
+        self.nwbfile.add_acquisition(make_csd(self.data, 'csd'))
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='a', load_namespaces=True) as io:
+            add_summary(io.read().acquisition['csd'].data)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_csd = io.read().acquisition['csd']
+            np.testing.assert_allclose(read_csd.data_mean[:], self.data.mean(axis=0), rtol=1e-5, atol=1e-7)
+
+
+@unittest.skipIf(not HAVE_DASK, 'dask is not installed')
+class TestCSDDask(TestCase):
+    """Test that dask data is written chunk by chunk and read back as a dask array."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = 'test_dask.nwb'
+        self.data = np.random.randn(1000, 16)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_roundtrip(self):
+        csd = CSD(
+            name='csd',
+            description='CSD of linear probe',
+            num_trials=np.uint(50),
+            data=da.from_array(self.data, chunks=(100, 16)),
+            time_from_event=np.linspace(-1, 1, num=len(self.data), dtype=np.float32),
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.0015, num=16, dtype=np.float32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            dtype_conversion='stream'
+        )
+        self.nwbfile.add_acquisition(csd)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_csd = io.read().acquisition['csd']
+            self.assertTupleEqual(read_csd.data.chunks, (100, 16))
+            self.assertEqual(read_csd.data.dtype, np.float32)
+            array = read_csd.to_dask()
+            # the chunks of the dask array are whole chunks on disk
+            self.assertTrue(all(size % 100 == 0 for size in array.chunks[0][:-1]))
+            np.testing.assert_array_equal(array.compute(), self.data.astype(np.float32))
+
+
+class TestCSDAppend(TestCase):
+    """Test that trials and time points are appended to a CSD in a file."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = 'test_append.nwb'
+        self.data = np.random.randn(100, 16).astype(np.float32)
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def write(self, **kwargs):
+        self.nwbfile.add_acquisition(CSD(
+            name='csd',
+            description='CSD of linear probe',
+            num_trials=np.uint(30),
+            data=self.data,
+            time_from_event=np.arange(100, dtype=np.float32) / 1000,
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.0015, num=16, dtype=np.float32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            **kwargs
+        ))
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+    def test_append(self):
+        """Test that the time axis grows, that new trials are merged into the mean, and that the summary follows."""
+        self.data[3, 2] = -10.  # the peak of electrode 2 stays in the old time points
+        self.write(resizable=True, summarize=True)
+        later = np.random.randn(20, 16).astype(np.float32)
+        later[5, 4] = 10.
+        new_mean = np.random.randn(120, 16).astype(np.float32)
+        with NWBHDF5IO(self.path, mode='a', load_namespaces=True) as io:
+            read_csd = io.read().acquisition['csd']
+            self.assertEqual(extend_time(read_csd.data, later, np.arange(100, 120) / 1000, block_bytes=16 * 8 * 7),
+                             120)
+            summary = summarize(read_csd.data[:], read_csd.time_from_event[:])
+            np.testing.assert_allclose(read_csd.data_mean[:], summary.mean, rtol=1e-5, atol=1e-6)
+            np.testing.assert_array_equal(read_csd.data_min[:], summary.min)
+            np.testing.assert_array_equal(read_csd.data_peak_time[:], summary.peak_time)
+            self.assertAlmostEqual(read_csd.data_peak_time[2], 0.003)
+            self.assertAlmostEqual(read_csd.data_peak_time[4], 0.105)
+            self.assertEqual(merge_trials(read_csd, new_mean, 10, block_bytes=16 * 8 * 7), 40)
+            self.assertEqual(read_csd.num_trials, 40)
+
+        expected = (np.concatenate([self.data, later]) * 30. + new_mean * 10.) / 40.
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_csd = io.read().acquisition['csd']
+            self.assertEqual(read_csd.num_trials, 40)
+            np.testing.assert_allclose(read_csd.data[:], expected, rtol=1e-5, atol=1e-6)
+            np.testing.assert_allclose(read_csd.time_from_event[:], np.arange(120) / 1000, rtol=1e-6)
+            summary = summarize(read_csd.data[:], read_csd.time_from_event[:])
+            for field, statistic in zip(FIELDS, summary):
+                np.testing.assert_allclose(getattr(read_csd, field)[:], statistic, rtol=1e-5, atol=1e-6)
+
+    def test_not_resizable(self):
+        """Test that the time axis of a CSD written without resizable=True cannot grow."""
+        self.write()
+        with NWBHDF5IO(self.path, mode='a', load_namespaces=True) as io:
+            data = io.read().acquisition['csd'].data
+            with self.assertRaisesWith(ValueError, "data of CSD '/acquisition/csd' cannot grow along the time axis: "
+                                                   "write the CSD with resizable=True"):
+                extend_time(data, self.data[:1], [1.])
+
+    def test_dependent(self):
+        """Test that a CSD whose other datasets depend on data is refused."""
+        self.write(resizable=True, quantize='int16', pyramid_factor=4)
+        with NWBHDF5IO(self.path, mode='a', load_namespaces=True) as io:
+            data = io.read().acquisition['csd'].data
+            with self.assertRaisesWith(ValueError, "cannot merge trials into CSD '/acquisition/csd', which has "
+                                                   "quantized data, data_pyramid"):
+                merge_trials(data, self.data, 10)
+
+
+class TestCSDTrials(TestCase):
+    """Test per-trial data linked to the trials table, written to and read from a file."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = 'test_trials.nwb'
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_trial_mean(self):
+        """Test that the average of the trials selected by a column of the trials table is read from the file."""
+        self.nwbfile.add_trial_column(name='correct', description='whether the response was correct')
+        correct = np.random.rand(60) < 0.7
+        for i in range(60):
+            self.nwbfile.add_trial(start_time=float(i), stop_time=i + 0.5, correct=bool(correct[i]))
+        trial_data = np.random.rand(60, 101, 16).astype(np.float32)
+        csd = CSD(
+            name='csd',
+            description='CSD of linear probe',
+            num_trials=np.uint(60),
+            data=trial_data.mean(axis=0),
+            time_from_event=np.linspace(-1, 1, num=101, dtype=np.float32),
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.0015, num=16, dtype=np.float32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            trial_data=trial_data,
+            trials=DynamicTableRegion(name='trials', data=list(range(60)), description='trials of trial_data',
+                                      table=self.nwbfile.trials)
+        )
+        self.nwbfile.add_acquisition(csd)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            read_nwbfile = io.read()
+            read_csd = read_nwbfile.acquisition['csd']
+            self.assertEqual(read_csd.trial_data.chunks, (1, 101, 16))
+            self.assertEqual(read_csd.trial_block_size, 16)
+            self.assertIs(read_csd.trials.table, read_nwbfile.trials)
+            mask = np.asarray(read_csd.trials[:]['correct'], dtype=bool)
+            np.testing.assert_array_equal(mask, correct)
+            mean = read_csd.trial_mean(mask)
+            self.assertEqual(mean.num_trials, correct.sum())
+            np.testing.assert_allclose(mean.data, trial_data[correct].mean(axis=0), rtol=1e-5)
+
+
+class TestCSDStreaming(TestCase):
+    """Test writing CSD data block by block from a data chunk iterator."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = 'test_streaming.nwb'
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def write_read(self, data, num_times, **kwargs):
+        csd = CSD(
+            name='csd',
+            description='CSD of 3D electrode array',
+            num_trials=np.uint(50),
+            data=data,
+            time_from_event=np.linspace(-1, 1, num=num_times, dtype=np.float32),
+            event_description='Stimulus onset',
+            electrodes_reference_frame='(0, 0, 0) is the most inferior, most left, most posterior electrode',
+            **kwargs
+        )
+        self.nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(csd)
+        with NWBHDF5IO(self.path, mode='w') as io:
+            io.write(self.nwbfile)
+        with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+            return io.read().processing['ecephys']['csd'].data[:]
+
+    def test_time_blocks(self):
+        """Test streaming blocks of time points into a dataset of unlimited length."""
+        blocks = [np.random.rand(n, 32).astype(np.float32) for n in (100, 50, 151)]
+        data = self.write_read(BlockIterator(iter(blocks), maxshape=(None, 32)), 301, write_profile='time-slice')
+        np.testing.assert_array_equal(data, np.concatenate(blocks))
+
+    def test_depth_blocks(self):
+        """Test streaming depth slices of a 3D CSD."""
+        blocks = [np.random.rand(101, 8, 6, 1).astype(np.float32) for _ in range(4)]
+        data = self.write_read(BlockIterator(iter(blocks), maxshape=(101, 8, 6, 4), axis=3), 101)
+        np.testing.assert_array_equal(data, np.concatenate(blocks, axis=3))
+
+
+class TestCSDDtypeConversion(TestCase):
+    """Test that float64 data is written as float32 with the 'inplace' and 'stream' dtype conversions."""
+
+    def setUp(self):
+        self.path = 'test_dtype_conversion.nwb'
+
+    def tearDown(self):
+        remove_test_file(self.path)
+
+    def test_conversions(self):
+        for dtype_conversion in ('inplace', 'stream'):
+            with self.subTest(dtype_conversion=dtype_conversion):
+                data = np.random.rand(1001, 16, 8)
+                expected = data.astype(np.float32)
+                nwbfile = NWBFile(
+                    session_description='session_description',
+                    identifier='identifier',
+                    session_start_time=datetime.datetime.now(datetime.timezone.utc)
+                )
+                csd = CSD(
+                    name='csd',
+                    description='CSD of 2D electrode array',
+                    num_trials=np.uint(50),
+                    data=data,
+                    time_from_event=np.linspace(-1, 1, num=1001),
+                    event_description='Stimulus onset',
+                    electrodes_reference_frame='(0, 0) is the most inferior, most left electrode',
+                    dtype_conversion=dtype_conversion
+                )
+                nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(csd)
+                with NWBHDF5IO(self.path, mode='w') as io:
+                    io.write(nwbfile)
+                with NWBHDF5IO(self.path, mode='r', load_namespaces=True) as io:
+                    read_csd = io.read().processing['ecephys']['csd']
+                    self.assertEqual(read_csd.data.dtype, np.float32)
+                    np.testing.assert_array_equal(read_csd.data[:], expected)
+
+
+class TestCSDSetRoundtrip(NWBH5IOMixin, TestCase):
+    """Roundtrip test for CSDSet using pynwb.testing infrastructure."""
+
+    def setUpContainer(self):
+        """ Return the test CSDSet to read/write """
+        return CSDSet(
+            name='csd_set',
+            description='CSD of linear probe',
+            num_trials=np.array([10, 20, 30, 40], dtype=np.uint32),
+            data=np.random.rand(4, 101, 32).astype(np.float32),
+            time_from_event=np.linspace(-1, 1, num=101, dtype=np.float32),
+            event_description=['grating %d deg' % angle for angle in range(0, 180, 45)],
+            rel_electrode_locations_x=np.linspace(0, 0.002, num=32, dtype=np.float32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            data_variance=np.random.rand(4, 101, 32).astype(np.float32)
+        )
+
+    def addContainer(self, nwbfile):
+        """ Add the test CSDSet to the given NWBFile """
+        nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(self.container)
+
+    def getContainer(self, nwbfile):
+        """ Return the test CSDSet from the given NWBFile """
+        return nwbfile.processing['ecephys']['csd_set']
+
+    def test_get_csd(self):
+        """Test that the CSD of a condition can be read from the file by index and by event description."""
+        self.read_container = self.roundtripContainer()
+        csd = self.read_container['grating 90 deg']
+        self.assertEqual(csd.num_trials, 30)
+        np.testing.assert_array_equal(csd.data, self.container.data[2])
+        np.testing.assert_array_equal(csd.rel_electrode_locations_x, self.container.rel_electrode_locations_x)
+        self.assertEqual([c.event_description for c in self.read_container], self.container.event_description)
+
+
+class TestCSDSetSitesRoundtrip(NWBH5IOMixin, TestCase):
+    """Roundtrip test for a CSDSet of sites off a grid, filtered to a frequency band."""
+
+    def setUpContainer(self):
+        """ Return the test CSDSet to read/write """
+        return CSDSet(
+            name='csd_set',
+            description='Gamma band CSD of staggered probe',
+            num_trials=np.array([10, 20], dtype=np.uint32),
+            data=np.random.rand(2, 101, 16).astype(np.float32),
+            time_from_event=np.linspace(-1, 1, num=101, dtype=np.float32),
+            event_description=['flash', 'tone'],
+            rel_electrode_coordinates=np.random.rand(16, 2).astype(np.float32) * 1e-3,
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            frequency_band=(30., 80.)
+        )
+
+    def addContainer(self, nwbfile):
+        """ Add the test CSDSet to the given NWBFile """
+        nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(self.container)
+
+    def getContainer(self, nwbfile):
+        """ Return the test CSDSet from the given NWBFile """
+        return nwbfile.processing['ecephys']['csd_set']
@@ -0,0 +1,63 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from pynwb import NWBFile
+from pynwb.testing import TestCase
+
+from ndx_csd.iterators import ArrayChunkIterator
+
+from ...utils import make_csd
+
+try:
+    from hdmf_zarr import NWBZarrIO
+    HAVE_ZARR = True
+except ImportError:
+    HAVE_ZARR = False
+
+
+@unittest.skipIf(not HAVE_ZARR, 'hdmf-zarr is not installed')
+class TestCSDZarrRoundtrip(TestCase):
+    """Roundtrip tests for CSD with the Zarr backend on a local directory store."""
+
+    def setUp(self):
+        self.nwbfile = NWBFile(
+            session_description='session_description',
+            identifier='identifier',
+            session_start_time=datetime.datetime.now(datetime.timezone.utc)
+        )
+        self.path = tempfile.mkdtemp(suffix='.nwb.zarr')
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def roundtrip(self, csd, **write_kwargs):
+        self.nwbfile.create_processing_module(name='ecephys', description='processed ecephys data').add(csd)
+        with NWBZarrIO(self.path, mode='w') as io:
+            io.write(self.nwbfile, **write_kwargs)
+        io = NWBZarrIO(self.path, mode='r')
+        self.addCleanup(io.close)
+        return io.read().processing['ecephys']['csd']
+
+    def test_roundtrip(self):
+        csd = make_csd(np.random.rand(101, 32).astype(np.float32))
+        read_csd = self.roundtrip(csd)
+        self.assertContainerEqual(csd, read_csd, ignore_hdmf_attrs=True)
+
+    def test_write_profile(self):
+        """Test that the Zarr write profile sets the chunks and compressor of the stored arrays."""
+        data = np.random.rand(2000, 16, 16).astype(np.float32)
+        read_csd = self.roundtrip(make_csd(data, write_profile='time-slice', write_backend='zarr'))
+        np.testing.assert_array_equal(read_csd.data[:], data)
+        self.assertEqual(read_csd.data.chunks, (1024, 16, 16))
+        self.assertEqual(read_csd.data.compressor.cname, 'zstd')
+
+    def test_parallel_write(self):
+        """Test that the chunks of a 4D volume can be encoded by several worker processes."""
+        data = np.random.rand(64, 12, 10, 8).astype(np.float32)
+        csd = make_csd(data, write_profile='channel-trace', write_backend='zarr')
+        self.assertIsInstance(csd.data.data, ArrayChunkIterator)
+        read_csd = self.roundtrip(csd, number_of_jobs=2, multiprocessing_context='spawn')
+        np.testing.assert_array_equal(read_csd.data[:], data)
@@ -0,0 +1,148 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd import CSDAccumulator
+from ndx_csd.kcsd import KernelCSD
+
+
+class TestCSDAccumulator(TestCase):
+
+    def setUp(self):
+        self.rate = 1000.
+        self.spacing = 20e-6
+        self.lfp = np.random.rand(3000, 6)
+        self.onsets = np.array([100, 740, 1000, 1999, 2900])
+        self.time_from_event = np.arange(-50, 101) / self.rate
+
+    def expected_mean(self, onsets):
+        return np.mean([self.lfp[onset - 50:onset + 101] for onset in onsets], axis=0)
+
+    def test_add_epochs(self):
+        """Test that the running mean of epochs added one at a time and in batches matches the mean of all epochs."""
+        epochs = np.random.rand(10, 20, 4, 3)
+        accumulator = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20))
+        accumulator.add_epoch(epochs[0])
+        accumulator.add_epochs(epochs[1:4])
+        accumulator.add_epochs(epochs[4:])
+        self.assertEqual(accumulator.num_trials, 10)
+        np.testing.assert_allclose(accumulator.mean, epochs.mean(axis=0))
+
+        csd = accumulator.to_csd(event_description='Stimulus onset',
+                                 electrodes_reference_frame='(0, 0) is the corner of the array',
+                                 rel_electrode_locations_x=np.arange(4.),
+                                 rel_electrode_locations_y=np.arange(3.))
+        self.assertEqual(csd.num_trials, 10)
+        self.assertEqual(csd.data.dtype, np.float32)
+        np.testing.assert_allclose(csd.data, epochs.mean(axis=0), rtol=1e-6)
+        np.testing.assert_array_equal(csd.rel_electrode_locations_y, np.arange(3.))
+
+    def test_mismatched_epochs(self):
+        """Test that epochs with a different shape than earlier epochs are rejected."""
+        accumulator = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20))
+        accumulator.add_epoch(np.random.rand(20, 4))
+        with self.assertRaisesWith(ValueError, 'epochs of shape (20, 5) do not match previously added epochs of '
+                                               'shape (20, 4)'):
+            accumulator.add_epoch(np.random.rand(20, 5))
+        with self.assertRaisesWith(ValueError, 'epochs must have shape (num_epochs, 20, ...), got (1, 21, 4)'):
+            accumulator.add_epoch(np.random.rand(21, 4))
+
+    def test_to_csd_empty(self):
+        """Test that a CSD cannot be emitted before any epochs are added."""
+        accumulator = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20))
+        with self.assertRaisesWith(ValueError, 'no epochs have been added to the CSDAccumulator'):
+            accumulator.to_csd(event_description='Stimulus onset')
+
+    def test_add_lfp_chunks(self):
+        """Test that epochs spanning chunk boundaries are extracted from consecutive chunks of raw LFP."""
+        accumulator = CSDAccumulator(time_from_event=self.time_from_event, spacing=self.spacing, rate=self.rate)
+        event_times = self.onsets / self.rate
+        accumulator.add_lfp(data=self.lfp[:700], event_times=event_times[:3])
+        self.assertEqual(accumulator.num_trials, 1)
+        accumulator.add_lfp(data=self.lfp[700:1020])
+        accumulator.add_lfp(data=self.lfp[1020:2000], event_times=event_times[3:])
+        accumulator.add_lfp(data=self.lfp[2000:])
+        self.assertEqual(accumulator.num_trials, 4)  # the last event extends beyond the recording
+        np.testing.assert_allclose(accumulator.mean, self.expected_mean(self.onsets[:4]))
+
+        csd = accumulator.to_csd(event_description='Stimulus onset')
+        mean = self.expected_mean(self.onsets[:4])
+        np.testing.assert_allclose(csd.data, -np.diff(mean, n=2, axis=1) / self.spacing ** 2, rtol=1e-5)
+        np.testing.assert_allclose(csd.rel_electrode_locations_x, self.spacing * np.arange(1, 5), rtol=1e-6)
+        self.assertTrue(csd.actual_electrodes)
+
+    def test_add_lfp_late_event(self):
+        """Test that events whose epoch starts before the retained LFP are dropped with a warning."""
+        accumulator = CSDAccumulator(time_from_event=self.time_from_event, rate=self.rate, channels=[0, 2])
+        accumulator.add_lfp(data=self.lfp[:1000])
+        with self.assertWarnsWith(UserWarning, '1 events were dropped because their epoch starts before the retained '
+                                               'LFP'):
+            accumulator.add_lfp(data=self.lfp[1000:2000], event_times=[0.1, 1.8])
+        self.assertEqual(accumulator.num_trials, 1)
+        np.testing.assert_allclose(accumulator.mean, self.expected_mean([1800])[:, [0, 2]])
+
+    def test_variance(self):
+        """Test that the variance of the CSD of the epochs is accumulated in the same pass as the mean."""
+        epochs = np.random.rand(30, 20, 6)
+        accumulator = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20), spacing=self.spacing, variance=True)
+        accumulator.add_epochs(epochs[:7])
+        accumulator.add_epochs(epochs[7:])
+        csd = accumulator.to_csd(event_description='Stimulus onset')
+        epoch_csds = -np.diff(epochs, n=2, axis=2) / self.spacing ** 2
+        np.testing.assert_allclose(csd.data_variance, epoch_csds.var(axis=0, ddof=1), rtol=1e-5)
+        self.assertIsNone(csd.n_per_cell)
+        np.testing.assert_allclose(csd.data_sem, epoch_csds.std(axis=0, ddof=1) / np.sqrt(30), rtol=1e-5)
+
+    def test_variance_nan(self):
+        """Test that with variance, data is the mean of the values that are not NaN, as counted by n_per_cell."""
+        epochs = np.random.rand(10, 20, 4)
+        epochs[3, 5, 2] = np.nan
+        epochs[:, 6, 1] = np.nan
+        accumulator = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20), variance=True)
+        accumulator.add_epochs(epochs)
+        csd = accumulator.to_csd(event_description='Stimulus onset')
+        self.assertEqual(csd.num_trials, 10)
+        self.assertEqual(csd.n_per_cell[5, 2], 9)
+        self.assertEqual(csd.n_per_cell[6, 1], 0)
+        expected = epochs.mean(axis=0)
+        expected[5, 2] = np.delete(epochs[:, 5, 2], 3).mean()
+        np.testing.assert_allclose(csd.data, expected, rtol=1e-6)
+        np.testing.assert_allclose(csd.data_variance[5, 2], np.nanvar(epochs[:, 5, 2], ddof=1), rtol=1e-5)
+
+    def test_variance_selected_regularization(self):
+        """Test that with variance, a kCSD regularization is selected once, on the first batch, for batches of
+        different amplitude."""
+        x, y = np.meshgrid(np.arange(4) * 100e-6, np.arange(2) * 100e-6, indexing='ij')
+        positions = np.stack([x.ravel(), y.ravel()], axis=1)
+        # a smooth field, which needs little regularization, then noise ten times as large, which needs more
+        smooth = np.sin(np.linspace(0, 2 * np.pi, 20))[:, np.newaxis] * np.arange(8)
+        batches = [np.tile(smooth, (5, 1, 1)), smooth + 10 * np.random.randn(5, 20, 8)]
+        accumulator = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20), variance=True,
+                                     estimator=KernelCSD(electrode_positions=positions))
+        for batch in batches:
+            accumulator.add_epochs(batch)
+        csd = accumulator.to_csd(event_description='Stimulus onset')
+
+        regularization = KernelCSD(electrode_positions=positions).select_regularization(batches[0].reshape(-1, 8))
+        fixed = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20), variance=True,
+                               estimator=KernelCSD(electrode_positions=positions, regularization=regularization))
+        for batch in batches:
+            fixed.add_epochs(batch)
+        expected = fixed.to_csd(event_description='Stimulus onset')
+        np.testing.assert_allclose(csd.data, expected.data, rtol=1e-5)
+        np.testing.assert_allclose(csd.data_variance, expected.data_variance, rtol=1e-5)
+        self.assertEqual(csd.description, expected.description)
+
+    def test_merge(self):
+        """Test that accumulators fed disjoint epochs, e.g., in different processes, merge into one."""
+        epochs = np.random.rand(30, 20, 4)
+        first = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20), variance=True)
+        second = CSDAccumulator(time_from_event=np.linspace(-1, 1, 20), variance=True)
+        first.add_epochs(epochs[:12])
+        second.add_epochs(epochs[12:])
+        first.merge(second)
+        self.assertEqual(first.num_trials, 30)
+        np.testing.assert_allclose(first.mean, epochs.mean(axis=0))
+        np.testing.assert_allclose(first.moments.variance(), epochs.var(axis=0, ddof=1))
+        with self.assertRaisesWith(ValueError, "cannot merge CSDAccumulators that differ in whether they accumulate "
+                                               "variance"):
+            first.merge(CSDAccumulator(time_from_event=np.linspace(-1, 1, 20)))
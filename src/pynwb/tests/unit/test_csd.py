@@ -1,7 +1,16 @@
+import datetime
 import numpy as np
+from hdmf.data_utils import DataChunkIterator
+from pynwb import NWBFile
+from pynwb.ecephys import ElectricalSeries
 from pynwb.testing import TestCase
 
-from ndx_csd import CSD
+from ndx_csd import CSD, spectral
+from ndx_csd.icsd import StepiCSD
+from ndx_csd.iterators import BlockIterator
+from ndx_csd.kcsd import KernelCSD
+from ndx_csd.pyramid import build_pyramid
+from ndx_csd.quantize import quantize
 
 
 class TestCSDConstructor(TestCase):
@@ -29,7 +38,7 @@ class TestCSDConstructor(TestCase):
         self.assertEqual(csd.name, 'csd')
         self.assertEqual(csd.description, 'CSD of linear probe')
         self.assertEqual(csd.num_trials, 50)
-        self.assertEqual(type(csd.num_trials), np.uint)
+        self.assertEqual(type(csd.num_trials), np.uint32)
         np.testing.assert_array_equal(csd.data, data)
         self.assertEqual(csd.data_unit, 'volts/meters^2')
         np.testing.assert_array_equal(csd.time_from_event, time_from_event)
@@ -69,7 +78,7 @@ class TestCSDConstructor(TestCase):
         self.assertEqual(csd.name, 'csd')
         self.assertEqual(csd.description, 'CSD of electrode array')
         self.assertEqual(csd.num_trials, 50)
-        self.assertEqual(type(csd.num_trials), np.uint)
+        self.assertEqual(type(csd.num_trials), np.uint32)
         np.testing.assert_array_equal(csd.data, data)
         self.assertEqual(csd.data_unit, 'volts/meters^2')
         np.testing.assert_array_equal(csd.time_from_event, time_from_event)
@@ -113,7 +122,7 @@ class TestCSDConstructor(TestCase):
         self.assertEqual(csd.name, 'csd')
         self.assertEqual(csd.description, 'CSD of 3D electrode array')
         self.assertEqual(csd.num_trials, 50)
-        self.assertEqual(type(csd.num_trials), np.uint)
+        self.assertEqual(type(csd.num_trials), np.uint32)
         np.testing.assert_array_equal(csd.data, data)
         self.assertEqual(csd.data_unit, 'volts/meters^2')
         np.testing.assert_array_equal(csd.time_from_event, time_from_event)
@@ -127,3 +136,429 @@ class TestCSDConstructor(TestCase):
         self.assertEqual(csd.electrodes_reference_frame, ('(0, 0, 0) is most inferior, most left, most posterior '
                                                           'electrode of array, +x is superior, +y is right, +z is '
                                                           'anterior'))
+
+    def test_constructor_iterator(self):
+        """Test that data can be given as a data chunk iterator, whose maxshape is validated."""
+        blocks = (np.random.rand(10, 8, 4, 3) for _ in range(5))
+        data = BlockIterator(blocks, maxshape=(None, 8, 4, 3))
+        csd = CSD(name='csd', description='description', num_trials=np.uint(50), data=data,
+                  time_from_event=np.linspace(-1, 1, num=50), event_description='Stimulus onset',
+                  rel_electrode_locations_x=np.linspace(0, 0.002, num=8), electrodes_reference_frame='frame')
+        self.assertIs(csd.data, data)
+
+        data = DataChunkIterator(data=iter([np.zeros((8, 4, 3, 2))] * 5), maxshape=(5, 8, 4, 3, 2),
+                                 dtype=np.dtype('float32'))
+        with self.assertRaisesRegex(ValueError, "incorrect shape for data"):
+            CSD(name='csd', description='description', num_trials=np.uint(50), data=data,
+                time_from_event=np.linspace(-1, 1, num=5), event_description='Stimulus onset',
+                electrodes_reference_frame='frame')
+
+    def test_constructor_mismatched_lengths(self):
+        """Test that time_from_event and the electrode locations must match the (max)shape of data."""
+        data = DataChunkIterator(data=iter([np.zeros(8)] * 5), maxshape=(5, 8), dtype=np.dtype('float32'))
+        with self.assertRaisesWith(ValueError, "time_from_event of CSD 'csd' has 4 elements but data has 5 time "
+                                               "points"):
+            CSD(name='csd', description='description', num_trials=np.uint(50), data=data,
+                time_from_event=np.linspace(-1, 1, num=4), event_description='Stimulus onset',
+                electrodes_reference_frame='frame')
+        with self.assertRaisesWith(ValueError, "rel_electrode_locations_x of CSD 'csd' has 7 elements but data has "
+                                               "8 electrodes along x"):
+            CSD(name='csd', description='description', num_trials=np.uint(50), data=np.zeros((5, 8)),
+                time_from_event=np.linspace(-1, 1, num=5), event_description='Stimulus onset',
+                rel_electrode_locations_x=np.linspace(0, 0.002, num=7), electrodes_reference_frame='frame')
+
+    def test_constructor_scattered(self):
+        """Test that scattered sites are given as a coordinate table, with data of shape (num_times, num_sites)."""
+        coordinates = np.random.rand(20, 2) * 0.001
+        csd = CSD(name='csd', description='description', num_trials=np.uint(50), data=np.random.rand(5, 20),
+                  time_from_event=np.linspace(-1, 1, num=5), event_description='Stimulus onset',
+                  rel_electrode_coordinates=coordinates, electrodes_reference_frame='frame')
+        np.testing.assert_array_equal(csd.rel_electrode_coordinates, coordinates)
+        distances = np.linalg.norm(coordinates - coordinates[3], axis=1)
+        np.testing.assert_array_equal(csd.site_index.within(coordinates[3], 0.0003),
+                                      np.flatnonzero(distances <= 0.0003))
+        self.assertIs(csd.site_index, csd.site_index)
+
+        window = csd.isel(x=slice(5, 10))
+        np.testing.assert_array_equal(window.rel_electrode_coordinates, coordinates[5:10])
+        np.testing.assert_array_equal(window.data, csd.data[:, 5:10])
+
+        with self.assertRaisesWith(ValueError, "CSD 'csd' cannot have both rel_electrode_coordinates and "
+                                               "rel_electrode_locations_x/y/z"):
+            CSD(name='csd', description='description', num_trials=np.uint(50), data=np.random.rand(5, 20),
+                time_from_event=np.linspace(-1, 1, num=5), event_description='Stimulus onset',
+                rel_electrode_locations_x=np.arange(20), rel_electrode_coordinates=coordinates,
+                electrodes_reference_frame='frame')
+        with self.assertRaisesWith(ValueError, "data of CSD 'csd' has 3 dimensions, but must have shape (num_times, "
+                                               "num_sites) when rel_electrode_coordinates is given"):
+            CSD(name='csd', description='description', num_trials=np.uint(50), data=np.random.rand(5, 20, 2),
+                time_from_event=np.linspace(-1, 1, num=5), event_description='Stimulus onset',
+                rel_electrode_coordinates=coordinates, electrodes_reference_frame='frame')
+        with self.assertRaisesWith(ValueError, "rel_electrode_coordinates of CSD 'csd' has 20 sites but data has 21 "
+                                               "sites"):
+            CSD(name='csd', description='description', num_trials=np.uint(50), data=np.random.rand(5, 21),
+                time_from_event=np.linspace(-1, 1, num=5), event_description='Stimulus onset',
+                rel_electrode_coordinates=coordinates, electrodes_reference_frame='frame')
+        grid = CSD(name='grid', description='description', num_trials=np.uint(50), data=np.random.rand(5, 20),
+                   time_from_event=np.linspace(-1, 1, num=5), event_description='Stimulus onset',
+                   electrodes_reference_frame='frame')
+        with self.assertRaisesWith(ValueError, "CSD 'grid' has no rel_electrode_coordinates: its sites lie on a grid"):
+            grid.site_index
+
+    def test_resample(self):
+        """Test that resampling interpolates each axis to the new coordinates and marks the electrodes virtual."""
+        x, y = np.linspace(0, 0.002, num=9), np.linspace(0, 0.001, num=5)
+        data = np.random.rand(20, 9, 5).astype(np.float32)
+        csd = CSD(name='csd', description='description', num_trials=np.uint(50), data=data,
+                  time_from_event=np.linspace(-1, 1, num=20), event_description='Stimulus onset',
+                  rel_electrode_locations_x=x, rel_electrode_locations_y=y, actual_electrodes=True,
+                  electrodes_reference_frame='frame')
+        new_x = np.linspace(0, 0.002, num=17)
+        resampled = csd.resample(x=new_x)
+        self.assertEqual(resampled.data.shape, (20, 17, 5))
+        self.assertFalse(resampled.actual_electrodes)
+        np.testing.assert_allclose(resampled.rel_electrode_locations_x, new_x)
+        np.testing.assert_array_equal(resampled.rel_electrode_locations_y, y)
+        np.testing.assert_allclose(resampled.data[:, ::2], data, rtol=1e-5)
+        np.testing.assert_allclose(resampled.data[4, 1, 2], data[4, :2, 2].mean(), rtol=1e-5)
+
+        resampled = csd.resample(x=new_x, y=np.linspace(0, 0.001, num=3), method='cubic')
+        self.assertEqual(resampled.data.shape, (20, 17, 3))
+        np.testing.assert_allclose(resampled.data[:, ::2], data[:, :, ::2], rtol=1e-5)
+
+        column = csd.isel(y=2)
+        resampled = column.resample(x=new_x, y=column.rel_electrode_locations_y)
+        self.assertEqual(resampled.data.shape, (20, 17, 1))
+        np.testing.assert_allclose(resampled.data[:, ::2], data[:, :, 2:3], rtol=1e-5)
+
+        with self.assertRaisesWith(ValueError, "cannot resample along z: the data of CSD 'csd' has 3 dimensions"):
+            csd.resample(z=[0])
+        grid = CSD(name='csd', description='description', num_trials=np.uint(50), data=np.random.rand(20, 9),
+                   time_from_event=np.linspace(-1, 1, num=20), event_description='Stimulus onset',
+                   electrodes_reference_frame='frame')
+        with self.assertRaisesWith(ValueError, "cannot resample along x: CSD 'csd' has no coordinates along that "
+                                               "axis"):
+            grid.resample(x=new_x)
+
+    def test_overview(self):
+        """Test that an overview reads the coarsest pyramid level with enough bins, or data if none has."""
+        data = np.random.rand(20000, 4).astype(np.float32)
+        time_from_event = np.linspace(-1, 1, num=20000, dtype=np.float32)
+        csd = CSD(name='csd', description='description', num_trials=np.uint(50), data=data,
+                  time_from_event=time_from_event, event_description='Stimulus onset',
+                  electrodes_reference_frame='frame', pyramid_factor=8)
+        np.testing.assert_array_equal(csd.pyramid_level_offsets, [0, 2500, 2813, 2853])
+        overview = csd.overview(1000)
+        self.assertEqual(overview.bin_size, 8)
+        self.assertEqual(len(overview.mean), 2500)
+        np.testing.assert_array_equal(overview.time_from_event, time_from_event[::8])
+        np.testing.assert_allclose(overview.max[10], data[80:88].max(axis=0))
+        np.testing.assert_allclose(overview.mean[10], data[80:88].mean(axis=0), rtol=1e-5)
+        overview = csd.overview(100, time=slice(-0.5, 0.5))
+        self.assertEqual(overview.bin_size, 64)
+        selected = np.flatnonzero((time_from_event >= -0.5) & (time_from_event <= 0.5))
+        self.assertEqual(len(overview.min), selected[-1] // 64 - selected[0] // 64 + 1)
+        first = selected[0] // 64 * 64
+        np.testing.assert_array_equal(overview.time_from_event, time_from_event[first::64][:len(overview.min)])
+        overview = csd.overview(5000, time=slice(0, 0.1))
+        self.assertEqual(overview.bin_size, 1)
+        np.testing.assert_array_equal(overview.mean, data[(time_from_event >= 0) & (time_from_event <= 0.1)])
+
+        with self.assertRaisesWith(ValueError, "cannot build the pyramid of CSD 'csd' from a data chunk iterator: add "
+                                               "it after writing with ndx_csd.pyramid.add_pyramid"):
+            CSD(name='csd', description='description', num_trials=np.uint(50),
+                data=DataChunkIterator(data=iter([np.zeros(8)] * 5), maxshape=(5, 8), dtype=np.dtype('float32')),
+                time_from_event=np.linspace(-1, 1, num=5), event_description='Stimulus onset',
+                electrodes_reference_frame='frame', pyramid_factor=8)
+
+    def test_trial_mean(self):
+        """Test that the average of a subset of trials is computed from the per-trial data and its block sums."""
+        trial_data = np.random.rand(40, 30, 8).astype(np.float32)
+        csd = CSD(name='csd', description='description', num_trials=np.uint(40), data=trial_data.mean(axis=0),
+                  time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                  rel_electrode_locations_x=np.linspace(0, 0.0014, num=8), electrodes_reference_frame='frame',
+                  trial_data=trial_data, trial_block_size=8)
+        self.assertEqual(csd.trial_block_sums.shape, (5, 30, 8))
+        self.assertEqual(csd.trial_data.io_settings['chunks'], (1, 30, 8))
+        mask = np.arange(40) % 3 != 0
+        mean = csd.trial_mean(mask)
+        self.assertEqual(mean.num_trials, mask.sum())
+        np.testing.assert_allclose(mean.data, trial_data[mask].mean(axis=0), rtol=1e-5)
+        np.testing.assert_array_equal(mean.rel_electrode_locations_x, csd.rel_electrode_locations_x)
+        np.testing.assert_allclose(csd.trial_mean(np.arange(40)).data, csd.data, rtol=1e-5)
+
+        with self.assertRaisesWith(ValueError, "cannot average an empty subset of the trials of CSD 'csd'"):
+            csd.trial_mean([])
+        with self.assertRaisesWith(ValueError, "trial_data of CSD 'csd' has 40 trials but num_trials is 50"):
+            CSD(name='csd', description='description', num_trials=np.uint(50), data=trial_data.mean(axis=0),
+                time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                electrodes_reference_frame='frame', trial_data=trial_data)
+        with self.assertRaisesWith(ValueError, "trial_data of CSD 'csd' has trials of shape (30, 8) but data has "
+                                               "shape (30, 7)"):
+            CSD(name='csd', description='description', num_trials=np.uint(40), data=np.zeros((30, 7)),
+                time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                electrodes_reference_frame='frame', trial_data=trial_data)
+
+    def test_find_sinks_sources(self):
+        """Test that the sinks and sources of a CSD are detected with its time and electrode coordinates."""
+        data = np.zeros((30, 8), dtype=np.float32)
+        data[5:9, 2:4] = -2
+        data[15, 6] = 3
+        csd = CSD(name='csd', description='description', num_trials=np.uint(10), data=data,
+                  time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                  rel_electrode_locations_x=np.linspace(0, 0.0014, num=8), electrodes_reference_frame='frame')
+        table = csd.find_sinks_sources(1.)
+        self.assertEqual(table['polarity'][:], ['sink', 'source'])
+        np.testing.assert_allclose(table['start_time'][:], csd.time_from_event[[5, 15]])
+        np.testing.assert_allclose(table['x_max'][:], csd.rel_electrode_locations_x[[3, 6]])
+        table = csd.find_sinks_sources(1., min_duration=0.1, name='sinks')
+        self.assertEqual(table.name, 'sinks')
+        self.assertEqual(table['polarity'][:], ['sink'])
+
+        with self.assertRaisesWith(ValueError, "threshold must be positive, not 0"):
+            csd.find_sinks_sources(0)
+
+    def test_quantize(self):
+        """Test that data is quantized with conversion and offset from its range, and dequantized when read."""
+        data = np.random.randn(30, 8).astype(np.float32)
+        csd = CSD(name='csd', description='description', num_trials=np.uint(10), data=data,
+                  time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                  rel_electrode_locations_x=np.linspace(0, 0.0014, num=8), electrodes_reference_frame='frame',
+                  quantize='int16', dtype_conversion='inplace')
+        self.assertEqual(csd.data.dtype, np.int16)
+        np.testing.assert_allclose(csd.data * csd.data_conversion + csd.data_offset, data,
+                                   atol=csd.data_conversion)
+        np.testing.assert_allclose(csd.scaled_data[:], data, atol=csd.data_conversion)
+        self.assertEqual(csd.conversion_bytes, 0)
+        window = csd.isel(time=slice(5, 10))
+        self.assertEqual(window.data.dtype, np.float32)
+        self.assertIsNone(window.data_conversion)
+        np.testing.assert_allclose(window.data, data[5:10], atol=csd.data_conversion)
+
+        stored = CSD(name='csd', description='description', num_trials=np.uint(10), data=csd.data,
+                     time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                     electrodes_reference_frame='frame', data_offset=2.)
+        self.assertEqual((stored.data_conversion, stored.data_offset), (1., 2.))
+        np.testing.assert_array_equal(stored.scaled_data[:], csd.data + 2.)
+        # the pyramid of quantized data is built from its values in volts/meters^2
+        long_data = np.random.randn(1000, 8).astype(np.float32)
+        quantized, conversion, offset = quantize(long_data, 'int16')
+        stored = CSD(name='csd', description='description', num_trials=np.uint(10), data=quantized,
+                     time_from_event=np.linspace(-1, 1, num=1000), event_description='Stimulus onset',
+                     electrodes_reference_frame='frame', data_conversion=float(conversion), data_offset=float(offset),
+                     pyramid_factor=8)
+        np.testing.assert_allclose(stored.data_pyramid, build_pyramid(long_data, 8)[0], atol=conversion)
+        self.assertIsNone(CSD(name='csd', description='description', num_trials=np.uint(10), data=data,
+                              time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                              electrodes_reference_frame='frame').data_conversion)
+
+        with self.assertRaisesWith(ValueError, "CSD 'csd' cannot quantize data that is already quantized with "
+                                               "data_conversion and data_offset"):
+            CSD(name='csd', description='description', num_trials=np.uint(10), data=data,
+                time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                electrodes_reference_frame='frame', quantize='int8', data_conversion=0.5)
+
+    def test_variance(self):
+        """Test that the variance and number of trials of each cell are validated, selected with data, and give the
+        standard error of the mean."""
+        data, variance = np.random.rand(30, 8), np.random.rand(30, 8)
+        n_per_cell = np.full((30, 8), 20, dtype=np.uint32)
+        n_per_cell[0] = 5
+        csd = CSD(name='csd', description='description', num_trials=np.uint(20), data=data,
+                  time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                  electrodes_reference_frame='frame', data_variance=variance, n_per_cell=n_per_cell)
+        np.testing.assert_allclose(csd.data_sem, np.sqrt(variance / n_per_cell))
+        window = csd.isel(time=slice(0, 10), x=slice(2, 4))
+        np.testing.assert_array_equal(window.data_variance, variance[:10, 2:4])
+        np.testing.assert_array_equal(window.n_per_cell, n_per_cell[:10, 2:4])
+        with self.assertRaisesWith(ValueError, "data_variance of CSD 'csd' has shape (30, 7) but data has shape "
+                                               "(30, 8)"):
+            CSD(name='csd', description='description', num_trials=np.uint(20), data=data,
+                time_from_event=np.linspace(-1, 1, num=30), event_description='Stimulus onset',
+                electrodes_reference_frame='frame', data_variance=variance[:, :7])
+
+
+def make_electrical_series(data, rate=1000., starting_time=0., conversion=1., timestamps=None):
+    """Create an ElectricalSeries for a linear probe with one electrode per column of data, sampled at ``rate`` or,
+    if given, at ``timestamps``."""
+    nwbfile = NWBFile(
+        session_description='session_description',
+        identifier='identifier',
+        session_start_time=datetime.datetime.now(datetime.timezone.utc)
+    )
+    device = nwbfile.create_device(name='probe')
+    group = nwbfile.create_electrode_group(name='shank', description='shank', location='brain', device=device)
+    for _ in range(data.shape[1]):
+        nwbfile.add_electrode(location='brain', group=group)
+    electrodes = nwbfile.create_electrode_table_region(region=list(range(data.shape[1])), description='all')
+    if timestamps is not None:
+        return ElectricalSeries(name='LFP', data=data, electrodes=electrodes, timestamps=timestamps,
+                                conversion=conversion)
+    return ElectricalSeries(name='LFP', data=data, electrodes=electrodes, rate=rate, starting_time=starting_time,
+                            conversion=conversion)
+
+
+class TestCSDFromLFP(TestCase):
+
+    def setUp(self):
+        self.rate = 1000.
+        self.spacing = 20e-6
+        self.lfp = np.random.rand(5000, 8)
+        self.electrical_series = make_electrical_series(self.lfp, rate=self.rate)
+        self.event_times = np.array([0.5, 1.2, 2.25, 4.0])
+        self.window = (-0.05, 0.1)
+
+    def expected_data(self, event_times, lfp=None):
+        lfp = self.lfp if lfp is None else lfp
+        epochs = [lfp[int(round(t * self.rate)) - 50:int(round(t * self.rate)) + 101] for t in event_times]
+        mean = np.mean(epochs, axis=0)
+        return -(mean[:, 2:] - 2 * mean[:, 1:-1] + mean[:, :-2]) / self.spacing ** 2
+
+    def test_from_lfp(self):
+        """Test that from_lfp averages epochs and takes the negative second spatial derivative."""
+        csd = CSD.from_lfp(
+            electrical_series=self.electrical_series,
+            event_times=self.event_times,
+            window=self.window,
+            spacing=self.spacing,
+            event_description='Stimulus onset'
+        )
+
+        self.assertEqual(csd.name, 'CSD')
+        self.assertEqual(csd.num_trials, 4)
+        self.assertEqual(csd.data.shape, (151, 6))
+        np.testing.assert_allclose(csd.data, self.expected_data(self.event_times), rtol=1e-5)
+        np.testing.assert_allclose(csd.time_from_event, np.arange(-50, 101) / self.rate, atol=1e-7)
+        np.testing.assert_allclose(csd.rel_electrode_locations_x, self.spacing * np.arange(1, 7), rtol=1e-6)
+        self.assertEqual(csd.event_description, 'Stimulus onset')
+        self.assertTrue(csd.actual_electrodes)
+
+    def test_from_lfp_batches(self):
+        """Test that the result does not depend on the batch size."""
+        kwargs = dict(electrical_series=self.electrical_series, event_times=self.event_times, window=self.window,
+                      spacing=self.spacing, event_description='Stimulus onset')
+        np.testing.assert_allclose(CSD.from_lfp(batch_size=1, **kwargs).data, CSD.from_lfp(**kwargs).data)
+
+    def test_from_lfp_channels_and_conversion(self):
+        """Test that the channel selection and the conversion factor of the ElectricalSeries are applied."""
+        electrical_series = make_electrical_series(self.lfp, rate=self.rate, conversion=1e-6)
+        channels = [6, 4, 2, 0]
+        csd = CSD.from_lfp(
+            electrical_series=electrical_series,
+            event_times=self.event_times,
+            window=self.window,
+            spacing=self.spacing,
+            event_description='Stimulus onset',
+            channels=channels
+        )
+        expected = self.expected_data(self.event_times, lfp=self.lfp[:, channels] * 1e-6)
+        np.testing.assert_allclose(csd.data, expected, rtol=1e-5)
+
+    def test_from_lfp_drops_out_of_range_events(self):
+        """Test that events whose window extends beyond the recording are dropped with a warning."""
+        with self.assertWarnsWith(UserWarning, '2 of 4 events were dropped because their epoch extends beyond the '
+                                               'recording'):
+            csd = CSD.from_lfp(
+                electrical_series=self.electrical_series,
+                event_times=[0.01, 1.2, 2.25, 4.95],
+                window=self.window,
+                spacing=self.spacing,
+                event_description='Stimulus onset'
+            )
+        self.assertEqual(csd.num_trials, 2)
+        np.testing.assert_allclose(csd.data, self.expected_data([1.2, 2.25]), rtol=1e-5)
+
+    def test_from_lfp_drops_events_outside_timestamps(self):
+        """Test that events outside the timestamps of an ElectricalSeries are dropped rather than moved to its first
+        or last sample."""
+        electrical_series = make_electrical_series(self.lfp, timestamps=10. + np.arange(5000) / self.rate)
+        # the window of an event moved to the first sample would fit in the recording
+        with self.assertWarnsWith(UserWarning, '2 of 4 events were dropped because their epoch extends beyond the '
+                                               'recording'):
+            csd = CSD.from_lfp(
+                electrical_series=electrical_series,
+                event_times=[5., 11.2, 12.25, 20.],
+                window=(0., 0.1),
+                spacing=self.spacing,
+                event_description='Stimulus onset'
+            )
+        self.assertEqual(csd.num_trials, 2)
+        mean = (self.lfp[1200:1301] + self.lfp[2250:2351]) / 2
+        np.testing.assert_allclose(csd.data, -np.diff(mean, n=2, axis=1) / self.spacing ** 2, rtol=1e-5)
+
+    def test_from_lfp_estimator(self):
+        """Test that an estimator is applied to the trial-averaged LFP instead of the second spatial derivative."""
+        estimator = StepiCSD(electrode_positions=self.spacing * np.arange(1, 9))
+        csd = CSD.from_lfp(
+            electrical_series=self.electrical_series,
+            event_times=self.event_times,
+            window=self.window,
+            event_description='Stimulus onset',
+            estimator=estimator
+        )
+        mean = np.mean([self.lfp[int(round(t * self.rate)) - 50:int(round(t * self.rate)) + 101]
+                        for t in self.event_times], axis=0)
+        np.testing.assert_allclose(csd.data, estimator.estimate(mean), rtol=1e-5)
+        np.testing.assert_allclose(csd.rel_electrode_locations_x, estimator.locations, rtol=1e-6)
+        self.assertEqual(csd.description, estimator.description)
+
+    def test_from_lfp_band(self):
+        """Test that a band-limited CSD equals the average of the band-pass filtered CSD of each trial."""
+        csd = CSD.from_lfp(electrical_series=self.electrical_series, event_times=self.event_times, window=self.window,
+                           spacing=self.spacing, event_description='Stimulus onset', band=(30, 80))
+        kernel = spectral.band_kernel((30, 80), self.rate).real
+        margin = len(kernel) // 2
+        trials = []
+        for t in self.event_times:
+            onset = int(round(t * self.rate))
+            epoch = self.lfp[onset - 50 - margin:onset + 101 + margin]
+            epoch_csd = -(epoch[:, 2:] - 2 * epoch[:, 1:-1] + epoch[:, :-2]) / self.spacing ** 2
+            trials.append(np.stack([np.convolve(trace, kernel, mode='valid') for trace in epoch_csd.T], axis=1))
+        np.testing.assert_allclose(csd.data, np.mean(trials, axis=0), rtol=1e-4, atol=1e-3 * np.abs(csd.data).max())
+        np.testing.assert_array_equal(csd.frequency_band, [30, 80])
+        self.assertTrue(csd.description.endswith('Band-pass filtered to 30-80 Hz.'))
+
+        with self.assertRaisesWith(ValueError, "the frequency band must satisfy 0 < low < high < 500 Hz (the Nyquist "
+                                               "frequency), got (30, 600)"):
+            CSD.from_lfp(electrical_series=self.electrical_series, event_times=self.event_times, window=self.window,
+                         spacing=self.spacing, event_description='Stimulus onset', band=(30, 600))
+
+    def test_time_frequency(self):
+        """Test that the amplitude envelope of each band is averaged over trials."""
+        times = np.arange(10000) / self.rate
+        # a quadratic depth profile has a constant second spatial derivative
+        lfp = np.sin(2 * np.pi * 50 * times)[:, np.newaxis] * np.arange(8) ** 2 * 1e-6
+        electrical_series = make_electrical_series(lfp, rate=self.rate)
+        kwargs = dict(electrical_series=electrical_series, event_times=[3., 5., 7.], window=self.window,
+                      bands=[(40, 60), (5, 15)], spacing=self.spacing, event_description='Stimulus onset')
+        gamma, low = CSD.time_frequency(**kwargs)
+        self.assertEqual((gamma.name, low.name), ('CSD_40-60Hz', 'CSD_5-15Hz'))
+        self.assertEqual(gamma.data.shape, (151, 6))
+        self.assertEqual(gamma.num_trials, 3)
+        np.testing.assert_allclose(gamma.data, 2e-6 / self.spacing ** 2, rtol=0.01)
+        self.assertLess(np.abs(low.data).max(), 0.01 * 2e-6 / self.spacing ** 2)
+        np.testing.assert_array_equal(low.frequency_band, [5, 15])
+        batched = CSD.time_frequency(batch_size=1, **kwargs)
+        np.testing.assert_allclose(batched[0].data, gamma.data, rtol=1e-5)
+
+    def test_time_frequency_selected_regularization(self):
+        """Test that a kCSD regularization is selected once, on the first batch, for epochs of different amplitude."""
+        lfp = self.lfp * np.logspace(-3, 0, len(self.lfp))[:, np.newaxis]
+        x, y = np.meshgrid(np.arange(4) * 100e-6, np.arange(2) * 100e-6, indexing='ij')
+        positions = np.stack([x.ravel(), y.ravel()], axis=1)
+        kwargs = dict(electrical_series=make_electrical_series(lfp, rate=self.rate), event_times=[1.2, 2.25, 4.0],
+                      window=self.window, bands=[(40, 60)], event_description='Stimulus onset', batch_size=1)
+        csd, = CSD.time_frequency(estimator=KernelCSD(electrode_positions=positions), **kwargs)
+
+        margin = spectral.num_taps((40, 60), self.rate) // 2
+        first = lfp[1200 - 50 - margin:1200 + 101 + margin]
+        regularization = KernelCSD(electrode_positions=positions).select_regularization(first)
+        expected, = CSD.time_frequency(estimator=KernelCSD(electrode_positions=positions,
+                                                           regularization=regularization), **kwargs)
+        np.testing.assert_allclose(csd.data, expected.data, rtol=1e-5)
+        self.assertEqual(csd.description, expected.description)
+
+    def test_from_lfp_no_spacing(self):
+        with self.assertRaisesWith(ValueError, 'either spacing or estimator must be provided'):
+            CSD.from_lfp(electrical_series=self.electrical_series, event_times=self.event_times, window=self.window,
+                         event_description='Stimulus onset')
@@ -0,0 +1,114 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd import CSD, CSDSet
+
+from ..utils import make_csd
+
+
+class TestCSDSet(TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(3, 11, 8)
+        self.csd_set = CSDSet(
+            name='csd_set',
+            description='CSD of linear probe',
+            num_trials=np.array([10, 20, 30], dtype=np.uint32),
+            data=self.data,
+            time_from_event=np.linspace(-1, 1, num=11),
+            event_description=['grating 0 deg', 'grating 45 deg', 'grating 90 deg'],
+            rel_electrode_locations_x=np.linspace(0, 0.002, num=8),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior'
+        )
+
+    def test_constructor(self):
+        self.assertEqual(self.csd_set.num_conditions, 3)
+        self.assertEqual(len(self.csd_set), 3)
+        self.assertEqual(self.csd_set.data_unit, 'volts/meters^2')
+        self.assertIsNone(self.csd_set.rel_electrode_locations_y)
+
+    def test_constructor_mismatched_conditions(self):
+        with self.assertRaisesWith(ValueError, "num_trials of CSDSet 'csd_set' has 2 elements but data has 3 "
+                                               "conditions"):
+            CSDSet(name='csd_set', description='description', num_trials=[1, 2], data=self.data,
+                   time_from_event=np.linspace(-1, 1, num=11), event_description=['a', 'b', 'c'],
+                   electrodes_reference_frame='frame')
+
+    def test_get_csd(self):
+        csd = self.csd_set[1]
+        self.assertIsInstance(csd, CSD)
+        self.assertEqual(csd.name, 'csd_set_1')
+        self.assertEqual(csd.num_trials, 20)
+        self.assertEqual(csd.event_description, 'grating 45 deg')
+        np.testing.assert_array_equal(csd.data, self.data[1])
+        np.testing.assert_array_equal(self.csd_set['grating 90 deg'].data, self.data[2])
+        np.testing.assert_array_equal(self.csd_set[-1].data, self.data[2])
+
+    def test_get_csd_errors(self):
+        with self.assertRaisesWith(IndexError, "index 3 is out of bounds for CSDSet 'csd_set' with 3 conditions"):
+            self.csd_set[3]
+        with self.assertRaises(KeyError):
+            self.csd_set['grating 180 deg']
+
+    def test_iter(self):
+        csds = list(self.csd_set)
+        self.assertEqual([csd.event_description for csd in csds], list(self.csd_set.event_description))
+        np.testing.assert_array_equal(np.stack([csd.data for csd in csds]), self.data)
+
+    def test_from_csds(self):
+        csds = [make_csd(np.random.rand(11, 8), 'csd%d' % i, 10 * (i + 1), 'condition %d' % i) for i in range(3)]
+        csd_set = CSDSet.from_csds(csds)
+        self.assertEqual(csd_set.name, 'CSDSet')
+        np.testing.assert_array_equal(csd_set.num_trials, [10, 20, 30])
+        for i, csd in enumerate(csds):
+            np.testing.assert_array_equal(csd_set[i].data, csd.data)
+            self.assertEqual(csd_set[i].event_description, csd.event_description)
+
+    def test_from_csds_variance(self):
+        """Test that the variance of each condition is stacked, with n_per_cell if any condition has one."""
+        csds = [make_csd(np.random.rand(11, 8), 'csd%d' % i, 10 * (i + 1), 'condition %d' % i) for i in range(3)]
+        for csd in csds:
+            csd.data_variance = np.random.rand(11, 8)
+        csds[1].n_per_cell = np.full((11, 8), 19, dtype=np.uint32)
+        csd_set = CSDSet.from_csds(csds)
+        self.assertEqual(csd_set.data_variance.shape, (3, 11, 8))
+        np.testing.assert_array_equal(csd_set.n_per_cell[:, 0, 0], [10, 19, 30])
+        for i, csd in enumerate(csd_set):
+            np.testing.assert_array_equal(csd.data_variance, csds[i].data_variance)
+            np.testing.assert_array_equal(csd.n_per_cell, csd_set.n_per_cell[i])
+        self.assertIsNone(CSDSet.from_csds(csds[:2] + [make_csd(np.random.rand(11, 8), 'csd', 1, 'a')]).data_variance)
+
+    def test_from_csds_mismatched_times(self):
+        csds = [make_csd(np.random.rand(11, 8), 'csd0', 1, 'a'), make_csd(np.random.rand(11, 8), 'csd1', 1, 'b')]
+        csds[1].time_from_event[:] += 1
+        with self.assertRaisesWith(ValueError, "CSD 'csd1' does not share the time_from_event of CSD 'csd0'"):
+            CSDSet.from_csds(csds)
+
+    def test_from_csds_mismatched_electrodes(self):
+        """Test that CSDs with different electrodes or frequency bands are not stacked."""
+        data = np.random.rand(11, 8)
+        csds = [make_csd(data, 'csd0', 1, 'a'), make_csd(data, 'csd1', 1, 'b', actual_electrodes=True)]
+        csds[1].rel_electrode_locations_x[0] = -1.
+        with self.assertRaisesWith(ValueError, "CSD 'csd1' does not share the rel_electrode_locations_x, "
+                                               "actual_electrodes of CSD 'csd0'"):
+            CSDSet.from_csds(csds)
+        banded = make_csd(data, 'banded', 1, 'c', frequency_band=(30., 80.))
+        with self.assertRaisesWith(ValueError, "CSD 'banded' does not share the frequency_band of CSD 'csd0'"):
+            CSDSet.from_csds([csds[0], banded])
+
+    def test_from_csds_shared_fields(self):
+        """Test that the frequency band and site coordinates are carried into the set, and quantized data is stacked
+        in volts/meters^2."""
+        coordinates = np.random.rand(8, 2)
+        data = [np.random.rand(11, 8) for _ in range(2)]
+        csds = [CSD(name='csd%d' % i, description='CSD of staggered probe', num_trials=np.uint(5), data=data[i],
+                    time_from_event=np.linspace(-1, 1, num=11), event_description='condition %d' % i,
+                    rel_electrode_coordinates=coordinates, electrodes_reference_frame='frame',
+                    frequency_band=(30., 80.), quantize='int16' if i else None) for i in range(2)]
+        csd_set = CSDSet.from_csds(csds)
+        np.testing.assert_array_equal(csd_set.frequency_band, [30., 80.])
+        np.testing.assert_array_equal(csd_set.rel_electrode_coordinates, coordinates)
+        np.testing.assert_allclose(csd_set.data[1], data[1], atol=csds[1].data_conversion)
+        csd = csd_set[1]
+        np.testing.assert_array_equal(csd.frequency_band, [30., 80.])
+        np.testing.assert_array_equal(csd.rel_electrode_coordinates, coordinates)
@@ -0,0 +1,99 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd import CSD
+from ndx_csd import dtypes
+from ndx_csd.iterators import ArrayChunkIterator
+
+from ..utils import make_csd
+
+
+class TestDowncastInplace(TestCase):
+
+    def test_downcast(self):
+        """Test that float64 data is converted in its own buffer, over several chunks."""
+        array = np.random.rand(1000, 7)
+        expected = array.astype(np.float32)
+        result = dtypes.downcast_inplace(array, chunk_bytes=800)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertTupleEqual(result.shape, (1000, 7))
+        self.assertTrue(np.shares_memory(result, array))
+        np.testing.assert_array_equal(result, expected)
+
+    def test_downcast_int32(self):
+        array = np.arange(100, dtype=np.int32).reshape(10, 10)
+        np.testing.assert_array_equal(dtypes.downcast_inplace(array), np.arange(100, dtype=np.float32).reshape(10, 10))
+
+    def test_not_contiguous(self):
+        with self.assertRaisesWith(ValueError, "cannot downcast ndarray in place: it must be a C-contiguous, "
+                                               "writeable numpy array of real numbers with at least 4 bytes per "
+                                               "element"):
+            dtypes.downcast_inplace(np.random.rand(10, 10).T)
+
+
+class TestCSDDtypeConversion(TestCase):
+
+    def test_float32_no_copy(self):
+        data = np.random.rand(101, 32).astype(np.float32)
+        csd = CSD(name='csd', description='description', num_trials=np.uint(50), data=data,
+                  time_from_event=np.linspace(-1, 1, num=101, dtype=np.float32), event_description='Stimulus onset',
+                  electrodes_reference_frame='frame', dtype_conversion='error')
+        self.assertIs(csd.data, data)
+        self.assertEqual(csd.conversion_bytes, 0)
+
+    def test_conversion_bytes(self):
+        """Test that the memory needed to convert the datasets when writing is reported."""
+        self.assertEqual(make_csd(np.zeros((101, 32), dtype=np.int16)).conversion_bytes, 101 * 32 * 4)
+        self.assertEqual(make_csd(np.zeros((101, 32), dtype=np.int64)).conversion_bytes, 101 * 32 * 8)
+        self.assertEqual(make_csd(np.zeros((101, 32))).conversion_bytes, 0)
+        self.assertEqual(dtypes.excess_bytes(np.zeros((101, 32))), 101 * 32 * 4)
+
+    def test_inplace(self):
+        data = np.random.rand(101, 32)
+        expected = data.astype(np.float32)
+        csd = make_csd(data, dtype_conversion='inplace')
+        self.assertTrue(np.shares_memory(csd.data, data))
+        np.testing.assert_array_equal(csd.data, expected)
+        self.assertEqual(csd.time_from_event.dtype, np.float32)
+        self.assertEqual(csd.conversion_bytes, 0)
+
+    def test_stream(self):
+        data = np.random.rand(101, 32)
+        csd = make_csd(data, dtype_conversion='stream')
+        self.assertIsInstance(csd.data, ArrayChunkIterator)
+        self.assertEqual(csd.data.dtype, np.float32)
+        self.assertIs(csd.data.array, data)
+        self.assertEqual(csd.conversion_bytes, 0)
+
+    def test_stream_slicing(self):
+        """Test that a CSD whose data is converted while writing can still be sliced, reading float32 values."""
+        data = np.random.rand(101, 32)
+        csd = make_csd(data, dtype_conversion='stream')
+        np.testing.assert_array_equal(csd.data[10:20, 3], data[10:20, 3].astype(np.float32))
+        view = csd.isel(time=slice(10, 20))
+        self.assertEqual(view.data.dtype, np.float32)
+        np.testing.assert_array_equal(view.data, data[10:20].astype(np.float32))
+        self.assertTupleEqual(csd.sel(time=slice(0, 0.5)).data.shape, (26, 32))
+        self.assertTupleEqual(csd.overview(20).min.shape[1:], (32, ))
+        expected = make_csd(data).find_sinks_sources(threshold=0.5)
+        self.assertEqual(len(csd.find_sinks_sources(threshold=0.5)), len(expected))
+
+    def test_error(self):
+        with self.assertRaisesWith(TypeError, "data of CSD 'csd' has dtype float64, but the spec requires float32"):
+            make_csd(np.random.rand(101, 32), dtype_conversion='error')
+
+    def test_unknown(self):
+        with self.assertRaisesWith(ValueError, "unknown dtype conversion 'copy', must be one of ['inplace', 'stream', "
+                                               "'error']"):
+            make_csd(np.random.rand(101, 32), dtype_conversion='copy')
+
+    def test_warning(self):
+        data = np.random.rand(101, 32)
+        original, dtypes.WARN_BYTES = dtypes.WARN_BYTES, 1000
+        try:
+            with self.assertWarnsRegex(UserWarning, "CSD 'csd' has float64 data, which will be written as float64"):
+                make_csd(data)
+            with self.assertWarnsRegex(UserWarning, "CSD 'csd' is not float32 and will be converted when written"):
+                make_csd(data.astype(np.int32))
+        finally:
+            dtypes.WARN_BYTES = original
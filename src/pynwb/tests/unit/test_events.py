@@ -0,0 +1,71 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.events import event_table, find_regions
+
+
+class TestEvents(TestCase):
+
+    def setUp(self):
+        # a sink over electrodes 2-4 from time point 10 to 39 with its peak at (20, 3), and a short source
+        self.data = np.zeros((100, 10))
+        self.data[10:40, 2:5] = -3
+        self.data[20, 3] = -5
+        self.data[60:62, 7] = 2
+        self.times = np.arange(100) / 1000.
+        self.locations = [np.arange(10) * 1e-4, None, None]
+
+    def test_event_table(self):
+        table = event_table(self.data, self.times, self.locations, threshold=1.)
+        self.assertEqual(table.name, 'sinks_sources')
+        self.assertEqual(table['polarity'][:], ['sink', 'source'])
+        np.testing.assert_allclose(table['start_time'][:], [0.010, 0.060])
+        np.testing.assert_allclose(table['stop_time'][:], [0.039, 0.061])
+        np.testing.assert_allclose(table['peak_time'][:], [0.020, 0.060])
+        np.testing.assert_allclose(table['peak_amplitude'][:], [-5, 2])
+        np.testing.assert_allclose(table['x_min'][:], [0.0002, 0.0007])
+        np.testing.assert_allclose(table['x_max'][:], [0.0004, 0.0007])
+        np.testing.assert_allclose(table['peak_x'][:], [0.0003, 0.0007])
+        self.assertEqual(table['num_cells'][:], [90, 2])
+
+    def test_blocks(self):
+        """Test that regions that span several blocks of time points are joined into one event."""
+        whole = event_table(self.data, self.times, self.locations, threshold=1.).to_dataframe()
+        for block_bytes in (8, 240, 800):
+            blocked = event_table(self.data, self.times, self.locations, threshold=1., block_bytes=block_bytes)
+            self.assertTrue(blocked.to_dataframe().equals(whole))
+
+    def test_blocks_join(self):
+        """Test that a region that is connected only through a later block is one event."""
+        data = np.zeros((6, 3))
+        data[:, 0] = 1
+        data[:, 2] = 1
+        data[5, :] = 1
+        regions = find_regions(data, 0.5, block_bytes=24)
+        self.assertEqual(len(regions['source']['size']), 1)
+        self.assertEqual(regions['source']['size'][0], 13)
+        self.assertEqual(len(regions['sink']['size']), 0)
+
+    def test_filters(self):
+        table = event_table(self.data, self.times, self.locations, threshold=1., min_duration=0.005)
+        self.assertEqual(table['polarity'][:], ['sink'])
+        table = event_table(self.data, self.times, self.locations, threshold=1., min_extent=1e-4)
+        self.assertEqual(table['polarity'][:], ['sink'])
+        table = event_table(self.data, self.times, self.locations, threshold=4.)
+        np.testing.assert_allclose(table['peak_amplitude'][:], [-5])
+        self.assertEqual(len(event_table(self.data, self.times, self.locations, threshold=10.)), 0)
+
+    def test_grid(self):
+        """Test that regions of 3D data are connected along both spatial axes, and that axes without coordinates
+        are measured in electrodes."""
+        data = np.zeros((20, 6, 5))
+        data[5:8, 1:4, 2] = -1
+        data[7, 3, 2:5] = -1
+        data[12, 5, 0] = 1
+        table = event_table(data, np.arange(20) / 1000., [np.arange(6) * 1e-4, None, None], threshold=0.5)
+        self.assertEqual(table['polarity'][:], ['sink', 'source'])
+        self.assertEqual(table['num_cells'][:], [11, 1])
+        np.testing.assert_allclose(table['y_min'][:], [2, 0])
+        np.testing.assert_allclose(table['y_max'][:], [4, 0])
+        np.testing.assert_allclose(table['peak_y'][:], [2, 0])
+        self.assertNotIn('z_min', table.colnames)
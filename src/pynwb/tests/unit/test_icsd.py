@@ -0,0 +1,110 @@
+import os
+import tempfile
+
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.cache import OperatorCache
+from ndx_csd.icsd import DeltaiCSD, StepiCSD, SplineiCSD
+
+
+def disk_potential(z, source_z, radius):
+    return np.sqrt((z - source_z) ** 2 + radius ** 2) - np.abs(z - source_z)
+
+
+class TestInverseCSD(TestCase):
+
+    def setUp(self):
+        self.positions = np.arange(1, 17) * 100e-6
+        self.conductivity = 0.3
+        self.diameter = 500e-6
+        self.cache = OperatorCache()
+
+    def test_delta_roundtrip(self):
+        """Test that the delta iCSD inverts its forward model and returns CSD divided by conductivity."""
+        estimator = DeltaiCSD(electrode_positions=self.positions, cache=self.cache)
+        csd = np.random.rand(5, 16)
+        lfp = csd @ estimator._forward_matrix().T
+        np.testing.assert_allclose(estimator.estimate(lfp), csd / self.conductivity, rtol=1e-6)
+
+    def test_step_forward_matrix(self):
+        """Test that the closed-form step forward matrix matches numerical integration over each cylinder."""
+        estimator = StepiCSD(electrode_positions=self.positions, top_conductivity=0.0, cache=self.cache)
+        radius = self.diameter / 2
+        forward = np.empty((16, 16))
+        for i, center in enumerate(self.positions):
+            source_z = np.linspace(center - 50e-6, center + 50e-6, 20001)
+            for j, z in enumerate(self.positions):
+                integrand = disk_potential(z, source_z, radius) + disk_potential(z, -source_z, radius)
+                forward[j, i] = np.trapezoid(integrand, source_z) / (2 * self.conductivity)
+        np.testing.assert_allclose(estimator._forward_matrix(), forward, rtol=1e-6)
+
+    def test_spline(self):
+        """Test that the spline iCSD recovers a CSD that follows its source model."""
+        estimator = SplineiCSD(electrode_positions=self.positions, num_steps=4, cache=self.cache)
+        self.assertEqual(len(estimator.locations), 15 * 4 + 1)
+        self.assertFalse(estimator.actual_electrodes)
+
+        values = np.sin(np.linspace(0, np.pi, 16))
+        spline = estimator._basis()
+        source_z = np.linspace(self.positions[0], self.positions[-1], 200001)
+        source_csd = spline(source_z) @ values
+        lfp = np.array([np.trapezoid(source_csd * disk_potential(z, source_z, self.diameter / 2), source_z)
+                        for z in self.positions]) / (2 * self.conductivity)
+        expected = spline(estimator.locations) @ values / self.conductivity
+        np.testing.assert_allclose(estimator.estimate(lfp[np.newaxis])[0], expected, rtol=1e-4, atol=1e-6)
+
+    def test_to_csd(self):
+        """Test that to_csd fills in the locations and description of the estimator."""
+        estimator = StepiCSD(electrode_positions=self.positions, cache=self.cache)
+        csd = estimator.to_csd(lfp=np.random.rand(20, 16), time_from_event=np.linspace(-0.1, 0.1, 20),
+                               num_trials=np.uint(10), event_description='Stimulus onset')
+        self.assertEqual(csd.data.shape, (20, 16))
+        self.assertEqual(csd.num_trials, 10)
+        np.testing.assert_allclose(csd.rel_electrode_locations_x, self.positions, rtol=1e-6)
+        self.assertTrue(csd.actual_electrodes)
+        self.assertEqual(csd.description, 'Step iCSD (Pettersen et al., 2006) with conductivity 0.3 S/m, top '
+                                          'conductivity 0.3 S/m and source diameter 0.0005 m, divided by the '
+                                          'conductivity.')
+
+    def test_estimate_wrong_shape(self):
+        estimator = DeltaiCSD(electrode_positions=self.positions, cache=self.cache)
+        with self.assertRaisesWith(ValueError, 'lfp must have shape (num_times, 16), got (10, 15)'):
+            estimator.estimate(np.zeros((10, 15)))
+
+    def test_unsorted_positions(self):
+        with self.assertRaisesWith(ValueError, 'electrode_positions must contain at least 2 strictly increasing '
+                                               'values'):
+            DeltaiCSD(electrode_positions=self.positions[::-1])
+
+
+class TestOperatorCache(TestCase):
+
+    def setUp(self):
+        self.positions = np.arange(1, 9) * 100e-6
+
+    def test_reuse(self):
+        """Test that estimators with the same geometry share the cached operator."""
+        cache = OperatorCache()
+        operator = StepiCSD(electrode_positions=self.positions, cache=cache).operator
+        self.assertIs(StepiCSD(electrode_positions=self.positions.copy(), cache=cache).operator, operator)
+        self.assertIsNot(StepiCSD(electrode_positions=self.positions, diameter=1e-3, cache=cache).operator, operator)
+        self.assertIsNot(DeltaiCSD(electrode_positions=self.positions, cache=cache).operator, operator)
+        self.assertEqual(len(cache), 3)
+        self.assertFalse(operator.flags.writeable)
+
+    def test_lru_eviction(self):
+        cache = OperatorCache(maxsize=2)
+        calls = []
+        for key in ['a', 'b', 'a', 'c', 'a', 'b']:
+            cache.get(key, lambda: calls.append(key) or np.zeros(1))
+        self.assertEqual(calls, ['a', 'b', 'c', 'b'])
+
+    def test_disk(self):
+        """Test that operators are persisted to and loaded from the cache directory."""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            operator = DeltaiCSD(electrode_positions=self.positions, cache=OperatorCache(cache_dir=cache_dir)).operator
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            estimator = DeltaiCSD(electrode_positions=self.positions, cache=OperatorCache(cache_dir=cache_dir))
+            estimator._forward_matrix = None  # the operator must come from disk
+            np.testing.assert_array_equal(estimator.operator, operator)
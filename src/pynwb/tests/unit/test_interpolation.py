@@ -0,0 +1,82 @@
+import numpy as np
+from pynwb.testing import TestCase
+from scipy.interpolate import CubicSpline
+
+from ndx_csd.cache import OperatorCache
+from ndx_csd.interpolation import apply_weight_matrix, cached_weight_matrix, weight_matrix
+
+
+class TestWeightMatrix(TestCase):
+
+    def setUp(self):
+        self.source = np.sort(np.random.default_rng(0).uniform(0, 0.002, size=24))
+        self.target = np.linspace(self.source[0], self.source[-1], num=50)
+        self.values = np.random.default_rng(1).standard_normal(24)
+
+    def test_linear(self):
+        """Test that linear weights reproduce numpy.interp, with at most two weights per target."""
+        matrix = weight_matrix(self.source, self.target, 'linear')
+        self.assertEqual(matrix.shape, (50, 24))
+        self.assertLessEqual(np.diff(matrix.indptr).max(), 2)
+        np.testing.assert_allclose(matrix @ self.values, np.interp(self.target, self.source, self.values))
+
+    def test_cubic(self):
+        """Test that cubic weights are exact for cubic polynomials, with at most four weights per target."""
+        matrix = weight_matrix(self.source * 1000, self.target * 1000, 'cubic')
+        self.assertLessEqual(np.diff(matrix.indptr).max(), 4)
+
+        def cubic(x):
+            return 2 * x ** 3 - x ** 2 + 3 * x - 1
+        np.testing.assert_allclose(matrix @ cubic(self.source * 1000), cubic(self.target * 1000), rtol=1e-9)
+
+    def test_spline(self):
+        """Test that spline weights reproduce scipy's not-a-knot CubicSpline."""
+        matrix = weight_matrix(self.source, self.target, 'spline')
+        np.testing.assert_allclose(matrix @ self.values, CubicSpline(self.source, self.values)(self.target),
+                                   atol=1e-10)
+
+    def test_unsorted_source(self):
+        """Test that the columns follow the order of the source locations."""
+        order = np.random.default_rng(2).permutation(24)
+        for method in ('linear', 'cubic', 'spline'):
+            np.testing.assert_allclose(weight_matrix(self.source[order], self.target, method) @ self.values[order],
+                                       weight_matrix(self.source, self.target, method) @ self.values, atol=1e-10)
+
+    def test_invalid(self):
+        with self.assertRaisesWith(ValueError, "cannot extrapolate: the target locations span [-0.001, 0.001] but "
+                                               "the source locations span [0, 0.003]"):
+            weight_matrix([0, 0.001, 0.002, 0.003], [-0.001, 0.001])
+        with self.assertRaisesWith(ValueError, "unknown interpolation method 'nearest', must be one of ['linear', "
+                                               "'cubic', 'spline']"):
+            weight_matrix(self.source, self.target, 'nearest')
+        with self.assertRaisesWith(ValueError, "cubic interpolation needs at least 4 source locations, not 3"):
+            weight_matrix([0, 1, 2], [0.5], 'cubic')
+
+    def test_single_source(self):
+        """Test that a single source location is copied to targets at that location, and that other targets are
+        rejected."""
+        np.testing.assert_array_equal(weight_matrix([0.001], [0.001, 0.001]).toarray(), [[1.], [1.]])
+        with self.assertRaisesWith(ValueError, "cannot extrapolate: the target locations span [0.002, 0.002] but the "
+                                               "source locations span [0.001, 0.001]"):
+            weight_matrix([0.001], [0.002])
+        with self.assertRaisesWith(ValueError, "spline interpolation needs at least 2 source locations, not 1"):
+            weight_matrix([0.001], [0.001], 'spline')
+
+    def test_cached(self):
+        """Test that the weight matrix of a pair of geometries is computed once."""
+        cache = OperatorCache()
+        first = cached_weight_matrix(self.source, self.target, 'linear', cache)
+        second = cached_weight_matrix(self.source, self.target, 'linear', cache)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual((first != second).nnz, 0)
+        cached_weight_matrix(self.source, self.target, 'cubic', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_apply(self):
+        """Test that the weights are applied along one axis of data, for all time points at once."""
+        data = np.random.rand(30, 24, 5).astype(np.float32)
+        matrix = weight_matrix(self.source, self.target)
+        result = apply_weight_matrix(data, matrix, axis=1)
+        self.assertEqual(result.shape, (30, 50, 5))
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_allclose(result[7, :, 3], np.interp(self.target, self.source, data[7, :, 3]), rtol=1e-5)
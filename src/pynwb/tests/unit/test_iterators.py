@@ -0,0 +1,53 @@
+import pickle
+
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.iterators import ArrayChunkIterator, BlockIterator, aligned_buffer_shape
+
+
+class TestArrayChunkIterator(TestCase):
+
+    def test_aligned_buffer_shape(self):
+        self.assertTupleEqual(aligned_buffer_shape((1000, 16, 16), (10, 16, 16), 4, buffer_bytes=40960), (40, 16, 16))
+        self.assertTupleEqual(aligned_buffer_shape((30, 16, 16), (10, 16, 16), 4, buffer_bytes=40960), (30, 16, 16))
+        self.assertTupleEqual(aligned_buffer_shape((30, 16, 16), (10, 16, 16), 4, buffer_bytes=1), (10, 16, 16))
+
+    def test_iterate(self):
+        data = np.random.rand(25, 4, 3)
+        iterator = ArrayChunkIterator(data, chunk_shape=(10, 4, 3), buffer_shape=(10, 4, 3), dtype=np.float32)
+        self.assertEqual(iterator.dtype, np.float32)
+        self.assertTupleEqual(iterator.maxshape, (25, 4, 3))
+        out = np.zeros((25, 4, 3), dtype=np.float32)
+        for chunk in iterator:
+            out[chunk.selection] = chunk.data
+        np.testing.assert_array_equal(out, data.astype(np.float32))
+
+    def test_pickle(self):
+        data = np.arange(60.).reshape(5, 4, 3)
+        iterator = pickle.loads(pickle.dumps(ArrayChunkIterator(data, chunk_shape=(2, 4, 3), buffer_shape=(2, 4, 3))))
+        self.assertTupleEqual(iterator.chunk_shape, (2, 4, 3))
+        np.testing.assert_array_equal(next(iterator).data, data[:2])
+
+
+class TestBlockIterator(TestCase):
+
+    def test_iterate(self):
+        """Test that blocks of different thicknesses are placed one after the other along the axis."""
+        blocks = [np.random.rand(4, 3, 2), np.random.rand(4, 3, 5), np.random.rand(4, 3, 1)]
+        iterator = BlockIterator(iter(blocks), maxshape=(4, 3, None), axis=2)
+        self.assertTupleEqual(iterator.recommended_data_shape(), (4, 3, 2))
+        self.assertEqual(iterator.dtype, np.float32)
+        chunks = list(iterator)
+        self.assertEqual([chunk.selection[2] for chunk in chunks], [slice(0, 2), slice(2, 7), slice(7, 8)])
+        np.testing.assert_array_equal(np.concatenate([chunk.data for chunk in chunks], axis=2),
+                                      np.concatenate(blocks, axis=2).astype(np.float32))
+
+    def test_bad_blocks(self):
+        iterator = BlockIterator(iter([np.zeros((2, 3)), np.zeros((2, 4))]), maxshape=(None, 3))
+        next(iterator)
+        with self.assertRaisesWith(ValueError, "block 1 has shape (2, 4), which does not fit in a dataset of maxshape "
+                                               "(None, 3) along axis 0"):
+            next(iterator)
+        with self.assertRaisesWith(ValueError, "block 0 extends to 6 along axis 0, beyond the maxshape (5, 3)"):
+            BlockIterator(iter([np.zeros((6, 3))]), maxshape=(5, 3))
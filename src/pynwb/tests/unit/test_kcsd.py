@@ -0,0 +1,104 @@
+import numpy as np
+from pynwb.testing import TestCase
+from scipy.integrate import dblquad
+from scipy.spatial.distance import cdist
+
+from ndx_csd.cache import OperatorCache
+from ndx_csd.kcsd import KernelCSD, _gaussian_potential_2d
+
+
+class TestKernelCSD(TestCase):
+
+    def setUp(self):
+        self.spacing = 400e-6
+        x, y = np.meshgrid(np.arange(6) * self.spacing, np.arange(5) * self.spacing, indexing='ij')
+        self.positions_2d = np.stack([x.ravel(), y.ravel()], axis=1)
+        x, y, z = np.meshgrid(*[np.arange(4) * self.spacing] * 3, indexing='ij')
+        self.positions_3d = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+        self.cache = OperatorCache()
+
+    def recover_basis_combination(self, positions):
+        """Check that a CSD made of the basis sources centered on the electrodes is recovered with little
+        regularization."""
+        estimator = KernelCSD(electrode_positions=positions, regularization=1e-20, cache=self.cache)
+        weights = np.random.rand(3, len(positions))
+        potentials = estimator._basis_potential(cdist(positions, estimator.grid_points))
+        lfp = weights @ potentials.T
+        basis = np.exp(-cdist(estimator.grid_points, estimator.grid_points, 'sqeuclidean')
+                       / (2 * estimator.source_width ** 2))
+        expected = (weights @ basis.T).reshape((3, ) + estimator.grid_shape)
+        np.testing.assert_allclose(estimator.estimate(lfp), expected, rtol=1e-3)
+
+    def test_2d(self):
+        self.recover_basis_combination(self.positions_2d)
+
+    def test_3d(self):
+        self.recover_basis_combination(self.positions_3d)
+
+    def test_2d_potential(self):
+        """Test the potential of a 2D Gaussian source against direct numerical integration."""
+        for distance in (0., 0.5, 2., 10.):
+            expected = dblquad(lambda y, x: (np.arcsinh(0.7 / (2 * np.hypot(x - distance, y) + 1e-300))
+                                             * np.exp(-(x ** 2 + y ** 2) / 2) / (2 * np.pi)),
+                               -8, 8, -8, 8, epsabs=1e-10)[0]
+            self.assertAlmostEqual(_gaussian_potential_2d([distance], 1., 0.7)[0], expected, places=5)
+
+    def test_defaults(self):
+        estimator = KernelCSD(electrode_positions=self.positions_2d, cache=self.cache)
+        self.assertAlmostEqual(estimator.source_width, self.spacing)
+        self.assertEqual(estimator.grid_shape, (6, 5))
+        kwargs = estimator.location_kwargs()
+        np.testing.assert_allclose(kwargs['rel_electrode_locations_x'], np.arange(6) * self.spacing, rtol=1e-6)
+        np.testing.assert_allclose(kwargs['rel_electrode_locations_y'], np.arange(5) * self.spacing, rtol=1e-6)
+        self.assertNotIn('rel_electrode_locations_z', kwargs)
+        self.assertFalse(kwargs['actual_electrodes'])
+
+    def test_regularization_path(self):
+        """Test the closed-form leave-one-out errors against refitting without each electrode."""
+        estimator = KernelCSD(electrode_positions=self.positions_2d, cache=self.cache)
+        lfp = np.random.rand(4, len(self.positions_2d))
+        kernel = estimator.kernels['eigenvectors'] @ np.diag(estimator.kernels['eigenvalues']) \
+            @ estimator.kernels['eigenvectors'].T
+        lambdas = estimator.default_lambdas()[[5, 15, 25]]
+        errors = []
+        for regularization in lambdas:
+            squared_residuals = []
+            for i in range(len(kernel)):
+                keep = np.arange(len(kernel)) != i
+                coefficients = np.linalg.solve(kernel[np.ix_(keep, keep)] + regularization * np.eye(len(kernel) - 1),
+                                               lfp[:, keep].T)
+                squared_residuals.append((lfp[:, i] - kernel[i, keep] @ coefficients) ** 2)
+            errors.append(np.mean(squared_residuals))
+        np.testing.assert_allclose(estimator.regularization_path(lfp, lambdas), errors, rtol=1e-6)
+
+    def test_selected_regularization(self):
+        """Test that the regularization with the lowest cross-validation error is used, reusing the cached kernels."""
+        estimator = KernelCSD(electrode_positions=self.positions_2d, cache=self.cache)
+        lfp = np.random.rand(4, len(self.positions_2d))
+        csd = estimator.estimate(lfp)
+        lambdas = estimator.default_lambdas()
+        self.assertEqual(estimator.selected_regularization,
+                         lambdas[np.argmin(estimator.regularization_path(lfp, lambdas))])
+        fixed = KernelCSD(electrode_positions=self.positions_2d, regularization=estimator.selected_regularization,
+                          cache=self.cache)
+        np.testing.assert_allclose(fixed.estimate(lfp), csd)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_fit(self):
+        """Test that fit fixes the regularization selected on all of the LFP, so that blocks are estimated with it."""
+        estimator = KernelCSD(electrode_positions=self.positions_2d, cache=self.cache)
+        lfp = np.random.rand(6, len(self.positions_2d))
+        fitted = estimator.fit(lfp)
+        self.assertIsNone(estimator.regularization)
+        np.testing.assert_allclose(np.concatenate([fitted.estimate(lfp[:3]), fitted.estimate(lfp[3:])]),
+                                   estimator.estimate(lfp))
+        self.assertEqual(fitted.selected_regularization, estimator.selected_regularization)
+        self.assertIs(fitted.fit(lfp), fitted)
+
+    def test_to_csd(self):
+        estimator = KernelCSD(electrode_positions=self.positions_3d, z=np.linspace(0, 1e-3, 7), cache=self.cache)
+        csd = estimator.to_csd(lfp=np.random.rand(10, 64), time_from_event=np.linspace(-0.1, 0.1, 10),
+                               num_trials=np.uint(5), event_description='Stimulus onset')
+        self.assertEqual(csd.data.shape, (10, 4, 4, 7))
+        self.assertEqual(len(csd.rel_electrode_locations_z), 7)
+        self.assertFalse(csd.actual_electrodes)
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.memmap import mapped_or_dataset, memmap_dataset, memmap_problem
+
+
+class TestMemmap(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test_memmap.h5')
+        self.data = np.random.rand(100, 16).astype(np.float32)
+        with h5py.File(self.path, 'w', userblock_size=512) as f:
+            f.create_dataset('contiguous', data=self.data)
+            f.create_dataset('big_endian', data=self.data.astype('>f8'))
+            f.create_dataset('chunked', data=self.data, chunks=(10, 16))
+            f.create_dataset('compressed', data=self.data, compression='gzip')
+        self.file = h5py.File(self.path, 'r')
+
+    def tearDown(self):
+        self.file.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_memmap(self):
+        mapped = memmap_dataset(self.file['contiguous'])
+        self.assertIsInstance(mapped, np.memmap)
+        self.assertFalse(mapped.flags.writeable)
+        np.testing.assert_array_equal(mapped, self.data)
+        np.testing.assert_array_equal(memmap_dataset(self.file['big_endian']), self.data.astype(np.float64))
+
+    def test_problems(self):
+        self.assertIsNone(memmap_problem(self.file['contiguous']))
+        self.assertEqual(memmap_problem(self.file['chunked']), 'it is chunked')
+        self.assertEqual(memmap_problem(self.data), 'it is not an HDF5 dataset')
+        with self.assertRaisesWith(ValueError, "cannot memory-map dataset '/compressed' because it is chunked"):
+            memmap_dataset(self.file['compressed'])
+
+    def test_fallback(self):
+        self.assertIsInstance(mapped_or_dataset(self.file['contiguous']), np.memmap)
+        chunked = self.file['chunked']
+        self.assertIs(mapped_or_dataset(chunked), chunked)
+        self.assertIs(mapped_or_dataset(self.data), self.data)
@@ -0,0 +1,51 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.moments import Moments
+
+
+class TestMoments(TestCase):
+
+    def setUp(self):
+        self.trials = np.random.default_rng(0).standard_normal((50, 20, 3))
+
+    def test_batches(self):
+        """Test that moments accumulated in batches match the mean and variance of all trials."""
+        moments = Moments()
+        for batch in np.split(self.trials, [1, 17, 40]):
+            moments.add(batch)
+        np.testing.assert_array_equal(moments.count, np.full((20, 3), 50))
+        np.testing.assert_allclose(moments.mean, self.trials.mean(axis=0))
+        np.testing.assert_allclose(moments.variance(), self.trials.var(axis=0, ddof=1))
+
+    def test_merge(self):
+        """Test that merging the moments of disjoint trials gives the moments of all trials."""
+        first, second = Moments(), Moments()
+        first.add(self.trials[:30])
+        second.add(self.trials[30:])
+        first.merge(second)
+        first.merge(Moments())
+        np.testing.assert_allclose(first.variance(), self.trials.var(axis=0, ddof=1))
+        with self.assertRaisesWith(ValueError, "moments of shape (20, 4) cannot be merged into moments of shape "
+                                               "(20, 3)"):
+            first.add(np.zeros((2, 20, 4)))
+
+    def test_stability(self):
+        """Test that a small variance is accurate when the mean is large."""
+        trials = 1e8 + self.trials
+        moments = Moments()
+        for batch in np.array_split(trials, 7):
+            moments.add(batch)
+        np.testing.assert_allclose(moments.variance(), self.trials.var(axis=0, ddof=1), rtol=1e-6)
+
+    def test_nan(self):
+        """Test that NaN values are skipped, so that the number of trials differs between cells."""
+        trials = self.trials.copy()
+        trials[:10, 0, 0] = np.nan
+        trials[:49, 1, 0] = np.nan
+        moments = Moments()
+        moments.add(trials[:25])
+        moments.add(trials[25:])
+        self.assertEqual(moments.count[0, 0], 40)
+        np.testing.assert_allclose(moments.variance()[0, 0], np.nanvar(trials[:, 0, 0], ddof=1))
+        self.assertTrue(np.isnan(moments.variance()[1, 0]))
@@ -0,0 +1,87 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from pynwb.testing import TestCase
+
+from ndx_csd import namespace
+
+
+class TestNamespaceCache(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_cache_path_depends_on_spec(self):
+        spec_dir = os.path.join(self.tmpdir, 'spec')
+        shutil.copytree(os.path.dirname(namespace.NAMESPACE_PATH), spec_dir)
+        namespace_path = os.path.join(spec_dir, os.path.basename(namespace.NAMESPACE_PATH))
+        path = namespace.cache_path(namespace_path, self.tmpdir)
+        self.assertEqual(path, namespace.cache_path(namespace.NAMESPACE_PATH, self.tmpdir))
+        with open(os.path.join(spec_dir, 'ndx-csd.extensions.yaml'), 'a') as f:
+            f.write('\n')
+        self.assertNotEqual(namespace.cache_path(namespace_path, self.tmpdir), path)
+
+    def test_caching_reader(self):
+        """Test that the reader returns documents it parsed earlier without reading the files again."""
+        spec_dir = os.path.dirname(namespace.NAMESPACE_PATH)
+        reader = namespace.CachingSpecReader(spec_dir)
+        namespaces = reader.read_namespace(namespace.NAMESPACE_PATH)
+        specs = reader.read_spec('ndx-csd.extensions.yaml')
+        replay = namespace.CachingSpecReader(os.path.join(self.tmpdir, 'missing'), reader.documents)
+        self.assertEqual(replay.read_namespace(os.path.join(self.tmpdir, 'ndx-csd.namespace.yaml')), namespaces)
+        self.assertEqual(replay.read_spec('ndx-csd.extensions.yaml'), specs)
+
+    def import_ndx_csd(self, code='ndx_csd.CSD', **variables):
+        """Import ndx_csd in a new process, with the home directory in tmpdir and the environment ``variables``, run
+        ``code`` and return what it prints."""
+        env = {key: value for key, value in os.environ.items() if not key.startswith('NDX_CSD_')}
+        env.update(variables, HOME=self.tmpdir)
+        env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(namespace.__file__))] + sys.path)
+        return subprocess.run([sys.executable, '-c', 'import ndx_csd; ' + code], env=env, check=True,
+                              stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+    def test_import_writes_cache(self):
+        """Test that the cache is written only to a directory given with NDX_CSD_CACHE_DIR, and that stale entries
+        are removed."""
+        self.import_ndx_csd()
+        # pynwb may cache its own type map in the home directory, but there is no ndx-csd cache
+        written = [name for _, _, names in os.walk(self.tmpdir) for name in names]
+        self.assertFalse([name for name in written if name.startswith(namespace.CACHE_PREFIX)])
+        cache = os.path.join(self.tmpdir, 'cache')
+        stale = os.path.join(cache, namespace.CACHE_PREFIX + '0.json')
+        os.makedirs(cache)
+        with open(stale, 'w') as f:
+            f.write('{}')
+        for _ in range(2):
+            self.import_ndx_csd(NDX_CSD_CACHE_DIR=cache)
+        self.assertEqual(os.listdir(cache), [os.path.basename(namespace.cache_path(directory=cache))])
+
+    def test_operator_cache_dir(self):
+        """Test that the shared operator cache is persisted in the directory given with NDX_CSD_CACHE_DIR."""
+        code = 'from ndx_csd.cache import operator_cache; print(operator_cache.cache_dir)'
+        self.assertEqual(self.import_ndx_csd(code).strip(), 'None')
+        self.assertEqual(self.import_ndx_csd(code, NDX_CSD_CACHE_DIR=self.tmpdir).strip(), self.tmpdir)
+        self.assertEqual(self.import_ndx_csd(code, NDX_CSD_CACHE_DIR=self.tmpdir, NDX_CSD_NO_CACHE_DIR='1').strip(),
+                         'None')
+
+    def test_import_skips_slow_scipy_modules(self):
+        """Test that importing ndx_csd does not import the scipy modules that only some functions use, which take
+        longer to import than the rest of ndx_csd."""
+        modules = ['scipy.fft', 'scipy.signal', 'scipy.interpolate', 'scipy.spatial', 'scipy.special', 'scipy.ndimage',
+                   'scipy.sparse.csgraph']
+        code = 'import sys; print(" ".join(sorted(set(sys.modules) & set(%r))))' % modules
+        self.assertEqual(self.import_ndx_csd(code).strip(), '')
+
+    def test_invalid_cache(self):
+        """Test that a cache file that is not valid JSON documents is ignored."""
+        path = os.path.join(self.tmpdir, 'namespace.json')
+        for content in (b'\x80\x04cos\nsystem\n.', b'[1, 2]', b'{"spec:x": '):
+            with open(path, 'wb') as f:
+                f.write(content)
+            self.assertIsNone(namespace._read_cache(path))
@@ -0,0 +1,122 @@
+import unittest
+
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd import CSD, compute, parallel
+from ndx_csd.icsd import StepiCSD
+from ndx_csd.kcsd import KernelCSD
+
+from ..utils import make_csd
+from .test_csd import make_electrical_series
+
+try:
+    import dask.array as da
+    HAVE_DASK = True
+except ImportError:
+    HAVE_DASK = False
+
+
+class TestDaskArrayType(TestCase):
+
+    def test_instance_check(self):
+        """Test that only dask arrays are instances of DaskArray."""
+        self.assertNotIsInstance(np.zeros(3), parallel.DaskArray)
+        self.assertFalse(parallel.is_dask_array([1, 2]))
+        if HAVE_DASK:
+            self.assertIsInstance(da.zeros(3), parallel.DaskArray)
+
+
+@unittest.skipIf(not HAVE_DASK, 'dask is not installed')
+class TestParallel(TestCase):
+
+    def setUp(self):
+        self.values = np.random.rand(1000, 12)
+        self.array = da.from_array(self.values, chunks=(100, 12))
+
+    def test_chunk_iterator(self):
+        """Test that the iterator has the chunks of the array, buffers of whole chunks, and yields all of it."""
+        iterator = parallel.chunk_iterator(self.array, dtype=np.float32, num_workers=3)
+        self.assertTupleEqual(iterator.chunk_shape, (100, 12))
+        self.assertEqual(iterator.buffer_shape[0] % 100, 0)
+        self.assertEqual(iterator.dtype, np.float32)
+        out = np.zeros(self.values.shape, dtype=np.float32)
+        for chunk in iterator:
+            out[chunk.selection] = chunk.data
+        np.testing.assert_array_equal(out, self.values.astype(np.float32))
+
+    def test_epoch_sum(self):
+        """Test that the epochs of a dask array are summed like those of a numpy array."""
+        onsets, offsets = np.array([50, 310, 777]), np.arange(-20, 41)
+        np.testing.assert_allclose(compute.epoch_sum(self.array, onsets, offsets, [3, 1]),
+                                   compute.epoch_sum(self.values, onsets, offsets, [3, 1]))
+        np.testing.assert_allclose(compute.read_epochs(self.array, onsets, offsets),
+                                   compute.read_epochs(self.values, onsets, offsets))
+
+    def test_map_time_blocks(self):
+        """Test that a function is applied lazily, block by block, with the shape of its result."""
+        def estimate(values):
+            return np.repeat(values[..., np.newaxis], 2, axis=2) * 2
+
+        result = parallel.map_time_blocks(estimate, self.values, block_bytes=12 * 2 * 8 * 64)
+        self.assertTrue(parallel.is_dask_array(result))
+        self.assertTupleEqual(result.chunks[0][:2], (64, 64))
+        np.testing.assert_array_equal(result.compute(), estimate(self.values))
+
+    def test_to_dask(self):
+        """Test that to_dask dequantizes lazily."""
+        quantized = np.arange(24, dtype=np.int16).reshape(6, 4)
+        np.testing.assert_allclose(parallel.to_dask(quantized, 0.5, 1.).compute(), quantized * 0.5 + 1.)
+        self.assertIs(parallel.to_dask(self.array), self.array)
+
+    def test_csd(self):
+        """Test that a CSD with dask data keeps it lazy until it is written, converting it to float32 on request."""
+        csd = make_csd(self.array, dtype_conversion='stream')
+        self.assertEqual(csd.data.dtype, np.float32)
+        self.assertIsNone(csd.data_min)
+        np.testing.assert_array_equal(csd.to_dask().compute(), self.values.astype(np.float32))
+        with self.assertRaisesWith(TypeError, "data of CSD 'csd' has dtype float64, but the spec requires float32"):
+            make_csd(self.array, dtype_conversion='error')
+        with self.assertRaisesWith(ValueError, "CSD 'csd' cannot quantize data from a data chunk iterator, since "
+                                               "finding its range takes a separate pass"):
+            make_csd(self.array, quantize='int16')
+
+
+@unittest.skipIf(not HAVE_DASK, 'dask is not installed')
+class TestFromLFPDask(TestCase):
+
+    def setUp(self):
+        self.spacing = 20e-6
+        self.lfp = np.random.rand(5000, 8)
+        self.kwargs = dict(electrical_series=make_electrical_series(self.lfp), event_times=[0.5, 1.2, 2.25, 4.0],
+                           window=(-0.05, 0.1), event_description='Stimulus onset')
+
+    def test_from_lfp(self):
+        """Test that the epochs are summed with dask to the same CSD."""
+        csd = CSD.from_lfp(spacing=self.spacing, use_dask=True, **self.kwargs)
+        np.testing.assert_allclose(csd.data, CSD.from_lfp(spacing=self.spacing, **self.kwargs).data, rtol=1e-6)
+
+    def test_from_lfp_estimator(self):
+        """Test that an estimator is applied lazily and computed when the data is read."""
+        estimator = StepiCSD(electrode_positions=self.spacing * np.arange(1, 9))
+        csd = CSD.from_lfp(estimator=estimator, use_dask=True, **self.kwargs)
+        self.assertIsNone(csd.data_min)
+        expected = CSD.from_lfp(estimator=estimator, **self.kwargs).data
+        np.testing.assert_allclose(csd.to_dask().compute(), expected, rtol=1e-5)
+
+    def test_from_lfp_selected_regularization(self):
+        """Test that a kCSD regularization is selected once, on the whole average, and is the one described."""
+        x, y = np.meshgrid(np.arange(4) * 100e-6, np.arange(2) * 100e-6, indexing='ij')
+        kwargs = dict(self.kwargs, estimator=KernelCSD(electrode_positions=np.stack([x.ravel(), y.ravel()], axis=1)))
+        lazy = CSD.from_lfp(use_dask=True, **kwargs)
+        eager = CSD.from_lfp(**kwargs)
+        self.assertEqual(lazy.description, eager.description)
+        np.testing.assert_allclose(lazy.to_dask().compute(), eager.data, rtol=1e-4,
+                                   atol=1e-6 * np.abs(eager.data).max())
+
+    def test_time_frequency(self):
+        """Test that the epochs of each batch are read with dask to the same envelopes."""
+        kwargs = dict(bands=[(40, 60)], spacing=self.spacing, batch_size=2, **self.kwargs)
+        kwargs['event_times'] = [1.2, 2.25, 4.0]
+        np.testing.assert_allclose(CSD.time_frequency(use_dask=True, **kwargs)[0].data,
+                                   CSD.time_frequency(**kwargs)[0].data, rtol=1e-6)
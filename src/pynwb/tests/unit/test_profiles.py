@@ -0,0 +1,96 @@
+import numpy as np
+from pynwb import H5DataIO
+from pynwb.testing import TestCase
+
+from ndx_csd import CSD
+from ndx_csd.profiles import chunk_shape, wrap_dataset
+
+
+class TestChunkShape(TestCase):
+
+    def test_time_slice(self):
+        """Test that time-slice chunks hold all electrodes of as many time points as fit."""
+        self.assertEqual(chunk_shape((100000, 384), 4, 'time-slice'), (682, 384))
+        self.assertEqual(chunk_shape((10000, 64, 64, 64), 4, 'time-slice'), (1, 64, 64, 64))
+        self.assertEqual(chunk_shape((10000, 128, 128, 128), 4, 'time-slice'), (1, 16, 128, 128))
+
+    def test_channel_trace(self):
+        """Test that channel-trace chunks hold as many time points of as few electrodes as fit."""
+        self.assertEqual(chunk_shape((10 ** 6, 384), 4, 'channel-trace'), (262144, 1))
+        self.assertEqual(chunk_shape((1000, 100, 20), 4, 'channel-trace'), (1000, 13, 20))
+
+    def test_balanced(self):
+        self.assertEqual(chunk_shape((10 ** 6, 384), 4, 'balanced'), (489, 384))
+        self.assertEqual(chunk_shape((101, 32), 8, 'balanced'), (101, 32))
+
+    def test_unknown_size(self):
+        """Test that dimensions of unknown size are chunked as if unbounded."""
+        self.assertEqual(chunk_shape((None, 384), 4, 'channel-trace'), (262144, 1))
+
+    def test_unknown_layout(self):
+        with self.assertRaisesWith(ValueError, "unknown chunk layout 'spiral'"):
+            chunk_shape((10, 10), 4, 'spiral')
+
+
+class TestWrapDataset(TestCase):
+
+    def test_wrap(self):
+        wrapped = wrap_dataset(np.zeros((1000, 32), dtype=np.float32), 'archive')
+        self.assertIsInstance(wrapped, H5DataIO)
+        self.assertEqual(wrapped.io_settings, {'chunks': (1000, 32), 'compression': 'gzip', 'compression_opts': 9,
+                                               'shuffle': True})
+
+    def test_resizable(self):
+        """Test that resizable datasets can grow along the first axis, with or without a profile."""
+        wrapped = wrap_dataset(np.zeros((1000, 32), dtype=np.float32), None, resizable=True)
+        self.assertEqual(wrapped.io_settings, {'chunks': (1000, 32), 'maxshape': (None, 32)})
+        wrapped = wrap_dataset(np.zeros((1000, 32), dtype=np.float32), 'archive', resizable=True)
+        self.assertEqual(wrapped.io_settings['maxshape'], (None, 32))
+        self.assertEqual(wrapped.io_settings['compression'], 'gzip')
+        data = np.zeros(10)
+        self.assertIs(wrap_dataset(data, None), data)
+
+    def test_already_wrapped(self):
+        data = H5DataIO(data=np.zeros((10, 4)), compression='gzip', compression_opts=1)
+        self.assertIs(wrap_dataset(data, 'archive'), data)
+        self.assertIsNone(wrap_dataset(None, 'archive'))
+
+    def test_unknown_profile(self):
+        with self.assertRaisesWith(ValueError, "unknown write profile 'fast', must be one of ['archive', "
+                                               "'channel-trace', 'time-slice']"):
+            wrap_dataset(np.zeros(10), 'fast')
+
+    def test_constructor(self):
+        """Test that the write profile passed to the CSD constructor wraps all of its datasets."""
+        csd = CSD(
+            name='csd',
+            description='CSD of linear probe',
+            num_trials=np.uint(50),
+            data=np.random.rand(101, 32),
+            time_from_event=np.linspace(-1, 1, num=101),
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.002, num=32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            write_profile='channel-trace'
+        )
+        for dataset in (csd.data, csd.time_from_event, csd.rel_electrode_locations_x):
+            self.assertIsInstance(dataset, H5DataIO)
+        self.assertEqual(csd.data.io_settings['chunks'], (101, 32))
+        self.assertIsNone(csd.rel_electrode_locations_y)
+
+    def test_constructor_resizable(self):
+        """Test that only data and time_from_event are resizable."""
+        csd = CSD(
+            name='csd',
+            description='CSD of linear probe',
+            num_trials=np.uint(50),
+            data=np.random.rand(101, 32),
+            time_from_event=np.linspace(-1, 1, num=101),
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=np.linspace(0, 0.002, num=32),
+            electrodes_reference_frame='0 is bottom of probe, +x is superior',
+            resizable=True
+        )
+        self.assertEqual(csd.data.io_settings['maxshape'], (None, 32))
+        self.assertEqual(csd.time_from_event.io_settings['maxshape'], (None, ))
+        self.assertIsInstance(csd.rel_electrode_locations_x, np.ndarray)
@@ -0,0 +1,49 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.pyramid import build_pyramid, choose_level, iter_levels, level_lengths, level_offsets
+
+
+def reduce_bins(data, bin_size):
+    """Return the minimum, maximum and mean of each bin of ``bin_size`` time points, computed directly."""
+    bins = [data[start:start + bin_size] for start in range(0, len(data), bin_size)]
+    return (np.array([b.min(axis=0) for b in bins]), np.array([b.max(axis=0) for b in bins]),
+            np.array([b.mean(axis=0) for b in bins]))
+
+
+class TestPyramid(TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(5003, 6, 2).astype(np.float32)
+
+    def test_levels(self):
+        """Test that levels are added until one has at most min_level_samples bins."""
+        self.assertEqual(level_lengths(5003, factor=4, min_level_samples=64), [1251, 313, 79, 20])
+        self.assertEqual(level_lengths(100, factor=4, min_level_samples=256), [])
+        np.testing.assert_array_equal(level_offsets(5003, factor=4, min_level_samples=64), [0, 1251, 1564, 1643, 1663])
+
+    def test_build(self):
+        """Test that each level holds the minimum, maximum and mean of its bins, including a partial last bin."""
+        pyramid, offsets = build_pyramid(self.data, factor=4, min_level_samples=64)
+        self.assertEqual(pyramid.shape, (1663, 3, 6, 2))
+        for level in range(1, 5):
+            expected = reduce_bins(self.data.astype(np.float64), 4 ** level)
+            stats = pyramid[offsets[level - 1]:offsets[level]]
+            for i in range(3):
+                np.testing.assert_allclose(stats[:, i], expected[i], rtol=1e-5)
+
+    def test_blocks(self):
+        """Test that building the pyramid from small blocks of data gives the same pyramid."""
+        pyramid, offsets = build_pyramid(self.data, factor=4, min_level_samples=64)
+        blocks = list(iter_levels(self.data, factor=4, min_level_samples=64, block_bytes=1))
+        self.assertEqual(len({first_bin for level, first_bin, stats in blocks if level == 1}), 20)
+        for level, first_bin, stats in blocks:
+            begin = offsets[level - 1] + first_bin
+            np.testing.assert_allclose(pyramid[begin:begin + len(stats)], stats, rtol=1e-6)
+
+    def test_choose_level(self):
+        """Test that the coarsest level with enough bins in the window is chosen."""
+        self.assertEqual(choose_level(0, 5003, 300, num_levels=4, factor=4), 2)
+        self.assertEqual(choose_level(0, 5003, 20, num_levels=4, factor=4), 4)
+        self.assertEqual(choose_level(1000, 1100, 20, num_levels=4, factor=4), 1)
+        self.assertEqual(choose_level(1000, 1100, 200, num_levels=4, factor=4), 0)
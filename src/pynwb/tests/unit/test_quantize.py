@@ -0,0 +1,64 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.quantize import Dequantized, quantization, quantize
+
+
+class RecordingArray:
+    """An array that records the keys it is read with."""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.keys = []
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, key):
+        self.keys.append(key)
+        return self.array[key]
+
+
+class TestQuantize(TestCase):
+
+    def test_quantize(self):
+        """Test that quantized data reproduces the data within half a quantization step, using the full range."""
+        data = np.random.randn(200, 16) * 50 + 10
+        for dtype in ('int16', 'int8'):
+            quantized, conversion, offset = quantize(data, dtype, block_bytes=16 * 8 * 7)
+            self.assertEqual(quantized.dtype, np.dtype(dtype))
+            self.assertIsInstance(conversion, np.float32)
+            self.assertIsInstance(offset, np.float32)
+            qmax = np.iinfo(dtype).max
+            self.assertEqual(np.abs(quantized).max(), qmax)
+            restored = quantized * np.float64(conversion) + np.float64(offset)
+            self.assertLessEqual(np.abs(restored - data).max(), conversion * 0.5 * (1 + 1e-5))
+
+    def test_quantization_constant(self):
+        conversion, offset = quantization(np.full((10, 4), 3.), 'int16')
+        self.assertEqual((conversion, offset), (1., 3.))
+        quantized, _, _ = quantize(np.full((10, 4), 3.), 'int16')
+        np.testing.assert_array_equal(quantized, 0)
+
+    def test_errors(self):
+        data = np.zeros((10, 4))
+        data[3, 2] = np.nan
+        with self.assertRaisesWith(ValueError, "cannot quantize data with NaN or infinite values"):
+            quantization(data, 'int16')
+        with self.assertRaisesWith(ValueError, "cannot quantize to 'uint8', must be one of ['int16', 'int8']"):
+            quantization(np.zeros((10, 4)), 'uint8')
+
+    def test_dequantized(self):
+        """Test that a slice of a Dequantized view reads and converts only that slice."""
+        stored = RecordingArray(np.arange(40, dtype=np.int16).reshape(10, 4))
+        view = Dequantized(stored, 0.5, -1.)
+        self.assertEqual(view.shape, (10, 4))
+        self.assertEqual(len(view), 10)
+        self.assertEqual(view.dtype, np.float32)
+        values = view[2:4, 1]
+        self.assertEqual(stored.keys, [(slice(2, 4), 1)])
+        self.assertEqual(values.dtype, np.float32)
+        np.testing.assert_array_equal(values, [4.5 - 1, 6.5 - 1])
+        np.testing.assert_array_equal(np.asarray(view), stored.array * 0.5 - 1)
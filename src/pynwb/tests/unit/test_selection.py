@@ -0,0 +1,111 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd import CSD
+from ndx_csd.selection import index_slice, label_slice, nearest_index
+
+
+class Sequence:
+    """A sequence without numpy support, like an h5py.Dataset, that records which elements are read."""
+
+    def __init__(self, values):
+        self.values = values
+        self.reads = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.values[index]
+
+
+class TestSelectionHelpers(TestCase):
+
+    def test_label_slice(self):
+        values = np.arange(10) * 0.5
+        self.assertEqual(label_slice(values, 1., 2.), slice(2, 5))
+        self.assertEqual(label_slice(values, 2., 1.), slice(2, 5))
+        self.assertEqual(label_slice(values, 0.9, 2.1), slice(2, 5))
+        self.assertEqual(label_slice(values, None, 1.), slice(0, 3))
+        self.assertEqual(label_slice(values, 4., None), slice(8, 10))
+        self.assertEqual(label_slice(values, 10., 11.), slice(10, 10))
+
+    def test_label_slice_descending(self):
+        values = np.arange(10)[::-1] * 0.5
+        self.assertEqual(label_slice(values, 1., 2.), slice(5, 8))
+        self.assertEqual(label_slice(Sequence(values), 1., 2.), slice(5, 8))
+
+    def test_binary_search(self):
+        """Test that only O(log n) elements of sequences without numpy support are read."""
+        values = Sequence(np.arange(10 ** 6) * 1e-3)
+        self.assertEqual(label_slice(values, 10., 20.), slice(10000, 20001))
+        self.assertLessEqual(len(values.reads), 2 * 21)
+
+    def test_nearest_index(self):
+        values = np.arange(10) * 0.5
+        self.assertEqual(nearest_index(values, 1.2), 2)
+        self.assertEqual(nearest_index(values, 1.3), 3)
+        self.assertEqual(nearest_index(values, -5.), 0)
+        self.assertEqual(nearest_index(values, 50.), 9)
+        self.assertEqual(nearest_index(values[::-1], 1.2), 7)
+        self.assertEqual(nearest_index(Sequence(values), 1.3), 3)
+
+    def test_index_slice(self):
+        self.assertEqual(index_slice(None, 10), slice(0, 10))
+        self.assertEqual(index_slice(3, 10), slice(3, 4))
+        self.assertEqual(index_slice(-1, 10), slice(9, 10))
+        self.assertEqual(index_slice(slice(-3, None), 10), slice(7, 10, 1))
+        with self.assertRaisesWith(IndexError, 'index 10 is out of bounds for axis of length 10'):
+            index_slice(10, 10)
+        with self.assertRaisesWith(ValueError, 'slices with a negative step are not supported, got step -1'):
+            index_slice(slice(None, None, -1), 10)
+
+
+class TestCSDSelection(TestCase):
+
+    def setUp(self):
+        self.data = np.random.rand(101, 10, 3)
+        self.time_from_event = np.linspace(-1, 1, num=101)
+        self.x = np.linspace(0, 0.002, num=10)
+        self.y = np.linspace(0.01, 0, num=3)
+        self.csd = CSD(
+            name='csd',
+            description='CSD of electrode array',
+            num_trials=np.uint(50),
+            data=self.data,
+            time_from_event=self.time_from_event,
+            event_description='Stimulus onset',
+            rel_electrode_locations_x=self.x,
+            rel_electrode_locations_y=self.y,
+            actual_electrodes=True,
+            electrodes_reference_frame='(0, 0) is most inferior, most left electrode of array'
+        )
+
+    def test_isel(self):
+        view = self.csd.isel(time=slice(10, 20), y=1)
+        np.testing.assert_array_equal(view.data, self.data[10:20, :, 1:2])
+        np.testing.assert_array_equal(view.time_from_event, self.time_from_event[10:20])
+        np.testing.assert_array_equal(view.rel_electrode_locations_x, self.x)
+        np.testing.assert_array_equal(view.rel_electrode_locations_y, self.y[1:2])
+        self.assertEqual(view.name, 'csd')
+        self.assertEqual(view.num_trials, 50)
+        self.assertTrue(view.actual_electrodes)
+        with self.assertRaisesWith(ValueError, 'slices with a negative step are not supported, got step -1'):
+            self.csd.isel(time=slice(None, None, -1))
+
+    def test_sel(self):
+        view = self.csd.sel(time=slice(-0.05, 0.05), x=slice(0.0005, 0.001), y=0.0049)
+        np.testing.assert_array_equal(view.data, self.data[48:53, 3:5, 1:2])
+        np.testing.assert_array_equal(view.time_from_event, self.time_from_event[48:53])
+        np.testing.assert_array_equal(view.rel_electrode_locations_x, self.x[3:5])
+        np.testing.assert_array_equal(view.rel_electrode_locations_y, [0.005])
+
+    def test_sel_missing_axis(self):
+        with self.assertRaisesWith(ValueError, "cannot select along z: the data of CSD 'csd' has 3 dimensions"):
+            self.csd.sel(z=0.)
+        csd = CSD(name='csd', description='CSD', num_trials=np.uint(5), data=self.data[:, :, 0],
+                  time_from_event=self.time_from_event, event_description='Stimulus onset',
+                  electrodes_reference_frame='0 is bottom of probe')
+        with self.assertRaisesWith(ValueError, "cannot select along x: CSD 'csd' has no coordinates along that axis"):
+            csd.sel(x=0.)
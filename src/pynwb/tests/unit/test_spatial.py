@@ -0,0 +1,46 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.spatial import SiteIndex
+
+
+class TestSiteIndex(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.coordinates = rng.uniform(0, 0.001, size=(5000, 3))
+        self.index = SiteIndex(self.coordinates)
+        self.point = np.array([0.0005, 0.0004, 0.0006])
+
+    def test_nearest(self):
+        """Test that the nearest sites are those with the smallest distances, nearest first."""
+        distances = np.linalg.norm(self.coordinates - self.point, axis=1)
+        found_distances, indices = self.index.nearest(self.point, k=5)
+        np.testing.assert_array_equal(indices, np.argsort(distances)[:5])
+        np.testing.assert_allclose(found_distances, np.sort(distances)[:5])
+        self.assertEqual(self.index.nearest(self.point)[1].tolist(), [np.argmin(distances)])
+
+    def test_within(self):
+        """Test that a radius query returns every site within the radius."""
+        distances = np.linalg.norm(self.coordinates - self.point, axis=1)
+        np.testing.assert_array_equal(self.index.within(self.point, 0.0002), np.flatnonzero(distances <= 0.0002))
+
+    def test_in_box(self):
+        """Test that a bounding-box query returns every site in the box, including sites on its faces."""
+        lower, upper = np.array([0.0001, 0.0002, 0.0003]), np.array([0.0004, 0.0009, 0.0005])
+        expected = np.flatnonzero(np.all((self.coordinates >= lower) & (self.coordinates <= upper), axis=1))
+        np.testing.assert_array_equal(self.index.in_box(lower, upper), expected)
+
+        grid = np.stack(np.meshgrid(np.arange(4) * 0.25, np.arange(3) * 0.25, indexing='ij'), axis=-1).reshape(-1, 2)
+        index = SiteIndex(grid)
+        np.testing.assert_array_equal(index.in_box([0.25, 0.25], [0.75, 0.25]), [4, 7, 10])
+        with self.assertRaisesWith(ValueError, "the lower corner [0.75 0.25] of the box is above its upper "
+                                               "corner [0.25 0.25]"):
+            index.in_box([0.75, 0.25], [0.25, 0.25])
+
+    def test_invalid(self):
+        with self.assertRaisesWith(ValueError, "site coordinates must have shape (num_sites, ndim) with ndim 1, 2 or "
+                                               "3, not (10, 4)"):
+            SiteIndex(np.zeros((10, 4)))
+        with self.assertRaisesWith(ValueError, "point [0. 0.] has 2 coordinates but the sites have 3"):
+            self.index.within([0, 0], 1)
@@ -0,0 +1,50 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.spectral import band_kernel, band_kernels, num_taps, overlap_save
+
+
+class TestSpectral(TestCase):
+
+    def test_overlap_save(self):
+        """Test that overlap-save equals a direct 'valid' convolution for any FFT length and axis."""
+        values = np.random.rand(3, 1000, 4)
+        kernel = np.random.rand(31)
+        expected = np.apply_along_axis(np.convolve, 1, values, kernel, mode='valid')
+        for fft_length in (31, 64, 1000, None):
+            result = overlap_save(values, kernel, axis=1, fft_length=fft_length)
+            self.assertEqual(result.shape, (3, 970, 4))
+            np.testing.assert_allclose(result, expected)
+
+    def test_overlap_save_kernels(self):
+        """Test that a stack of complex kernels gives one result per kernel along a new first axis."""
+        values = np.random.rand(500, 2)
+        kernels = np.random.rand(3, 21) + 1j * np.random.rand(3, 21)
+        result = overlap_save(values, kernels)
+        self.assertEqual(result.shape, (3, 480, 2))
+        np.testing.assert_allclose(result[2, :, 1], np.convolve(values[:, 1], kernels[2], mode='valid'))
+
+        with self.assertRaisesWith(ValueError, "cannot filter 20 samples with a kernel of 21 taps"):
+            overlap_save(values[:20], kernels)
+
+    def test_band_kernel(self):
+        """Test that the real part of a kernel passes its band and the kernel gives the amplitude envelope."""
+        rate = 1000.
+        times = np.arange(4000) / rate
+        kernel = band_kernel((30, 80), rate)
+        self.assertEqual(len(kernel), num_taps((30, 80), rate))
+        self.assertEqual(len(kernel) % 2, 1)
+        margin = len(kernel) // 2
+        inside, outside = np.sin(2 * np.pi * 50 * times), np.sin(2 * np.pi * 10 * times)
+        np.testing.assert_allclose(overlap_save(inside, kernel.real), inside[margin:-margin], atol=0.01)
+        np.testing.assert_allclose(overlap_save(outside, kernel.real), 0, atol=0.01)
+        np.testing.assert_allclose(np.abs(overlap_save(inside, kernel)), 1, atol=0.01)
+
+    def test_band_kernels(self):
+        """Test that kernels of different lengths are centered in a common length."""
+        kernels = band_kernels([(30, 80), (4, 8)], 1000.)
+        self.assertEqual(kernels.shape, (2, num_taps((4, 8), 1000.)))
+        short = band_kernel((30, 80), 1000.)
+        start = (kernels.shape[1] - len(short)) // 2
+        np.testing.assert_allclose(kernels[0, start:start + len(short)], short)
+        self.assertEqual(np.count_nonzero(kernels[0]), len(short))
@@ -0,0 +1,66 @@
+import os
+
+import h5py
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.iterators import ArrayChunkIterator
+from ndx_csd.summary import add_summary, summarize
+
+from ..utils import make_csd
+
+
+class TestSummary(TestCase):
+
+    def setUp(self):
+        self.data = np.random.randn(50, 6, 2)
+        self.times = np.linspace(-0.1, 0.4, num=50)
+
+    def test_summarize(self):
+        """Test that the statistics do not depend on the block size."""
+        for block_bytes in (8, 6 * 2 * 8 * 7, 2 ** 26):
+            summary = summarize(self.data, self.times, block_bytes=block_bytes)
+            np.testing.assert_allclose(summary.min, self.data.min(axis=0), rtol=1e-6)
+            np.testing.assert_allclose(summary.max, self.data.max(axis=0), rtol=1e-6)
+            np.testing.assert_allclose(summary.mean, self.data.mean(axis=0), rtol=1e-5, atol=1e-7)
+            np.testing.assert_allclose(summary.peak_time, self.times[np.abs(self.data).argmax(axis=0)], rtol=1e-6)
+            self.assertEqual(summary.min.dtype, np.float32)
+
+    def test_summarize_ties_and_nan(self):
+        """Test that ties go to the first time point and NaN values are ignored."""
+        data = np.zeros((10, 3))
+        data[[2, 7], 0] = [-1, 1]
+        data[:, 1] = np.nan
+        data[4, 2] = np.nan
+        summary = summarize(data, np.arange(10.), block_bytes=3 * 8 * 3)
+        self.assertEqual(summary.peak_time[0], 2.)
+        self.assertTrue(np.isnan(summary.min[1]) and np.isnan(summary.peak_time[1]))
+        self.assertEqual(summary.mean[2], 0.)
+
+    def test_summarize_iterator(self):
+        """Test that data from a data chunk iterator, which is read only when it is written, is not summarized, with a
+        warning."""
+        data = ArrayChunkIterator(self.data.astype(np.float32), chunk_shape=(10, 6, 2))
+        with self.assertWarnsWith(UserWarning, "CSD 'csd' has data from a data chunk iterator, which is only read when "
+                                               "it is written, so it is not summarized: add the summary after writing "
+                                               "with ndx_csd.summary.add_summary"):
+            csd = make_csd(data, summarize=True)
+        self.assertIsNone(csd.data_min)
+        self.assertIsNotNone(make_csd(self.data.astype(np.float32), summarize=True).data_min)
+
+    def test_add_summary(self):
+        path = 'test_summary.h5'
+        try:
+            with h5py.File(path, 'w') as f:
+                group = f.create_group('CSD')
+                group.create_dataset('time_from_event', data=self.times)
+                data = group.create_dataset('data', data=np.round(self.data * 100).astype(np.int16))
+                data.attrs['conversion'] = np.float32(0.01)
+                add_summary(data)
+                np.testing.assert_allclose(group['data_max'][:], data[:].max(axis=0) * 0.01, rtol=1e-6)
+                self.assertEqual(group['data_peak_time'].attrs['unit'], 'seconds')
+                with self.assertRaisesWith(ValueError, "CSD '/CSD' already has a summary"):
+                    add_summary(data)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
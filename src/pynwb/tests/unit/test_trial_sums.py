@@ -0,0 +1,61 @@
+import numpy as np
+from pynwb.testing import TestCase
+
+from ndx_csd.trial_sums import block_sums, subset_sum, trial_positions
+
+
+class RecordingArray:
+    """An array that records the number of trials read from it."""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.rows_read = 0
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, key):
+        values = self.array[key]
+        self.rows_read += len(values)
+        return values
+
+
+class TestTrialSums(TestCase):
+
+    def setUp(self):
+        self.trial_data = np.random.rand(100, 20, 4).astype(np.float32)
+        self.sums = block_sums(self.trial_data, block_size=16)
+
+    def test_block_sums(self):
+        self.assertEqual(self.sums.shape, (7, 20, 4))
+        np.testing.assert_allclose(self.sums[2], self.trial_data[32:48].sum(axis=0), rtol=1e-6)
+        np.testing.assert_allclose(self.sums[6], self.trial_data[96:].sum(axis=0), rtol=1e-6)
+
+    def test_subset_sum(self):
+        """Test that the sum of any subset of trials equals the sum of those trials."""
+        rng = np.random.default_rng(0)
+        for fraction in (0.1, 0.5, 0.9, 1.0):
+            positions = np.flatnonzero(rng.random(100) < fraction)
+            expected = self.trial_data[positions].sum(axis=0, dtype=np.float64)
+            np.testing.assert_allclose(subset_sum(self.trial_data, self.sums, 16, positions), expected, rtol=1e-6)
+            np.testing.assert_allclose(subset_sum(self.trial_data, None, None, positions), expected, rtol=1e-6)
+
+    def test_reads(self):
+        """Test that at most half of the trials of each block are read, and none of fully selected blocks."""
+        trial_data = RecordingArray(self.trial_data)
+        subset_sum(trial_data, self.sums, 16, np.arange(100))
+        self.assertEqual(trial_data.rows_read, 0)
+        subset_sum(trial_data, self.sums, 16, np.delete(np.arange(100), [3, 40, 41]))
+        self.assertEqual(trial_data.rows_read, 3)
+
+    def test_trial_positions(self):
+        mask = np.zeros(100, dtype=bool)
+        mask[[5, 7]] = True
+        np.testing.assert_array_equal(trial_positions(mask, 100), [5, 7])
+        np.testing.assert_array_equal(trial_positions([7, -1, 5, 7], 100), [5, 7, 99])
+        with self.assertRaisesWith(IndexError, "trial positions must be between -100 and 99"):
+            trial_positions([100], 100)
+        with self.assertRaisesWith(ValueError, "the boolean mask of trials has 3 elements but there are 100 trials"):
+            trial_positions([True, False, True], 100)
@@ -0,0 +1,24 @@
+"""Helpers shared by the unit and integration tests."""
+import numpy as np
+from hdmf.utils import get_data_shape
+
+from ndx_csd import CSD
+
+LOCATION_FIELDS = ('rel_electrode_locations_x', 'rel_electrode_locations_y', 'rel_electrode_locations_z')
+
+
+def make_csd(data, name='csd', num_trials=50, event_description='Stimulus onset', **kwargs):
+    """Return a CSD of ``data`` with evenly spaced times and electrode locations along each of its spatial axes."""
+    shape = get_data_shape(data)
+    locations = {field: np.linspace(0, 0.002, num=n) for field, n in zip(LOCATION_FIELDS, shape[1:])}
+    return CSD(
+        name=name,
+        description='CSD of electrode array',
+        num_trials=np.uint(num_trials),
+        data=data,
+        time_from_event=np.linspace(-1, 1, num=shape[0]),
+        event_description=event_description,
+        electrodes_reference_frame='(0, 0, 0) is the most inferior, most left, most posterior electrode',
+        **locations,
+        **kwargs
+    )
@@ -10,17 +10,21 @@ def main():
     ns_builder = NWBNamespaceBuilder(
         doc="""An NWB extension to add support for storing current source density analysis results""",
         name="""ndx-csd""",
-        version="""0.1.0""",
+        version="""0.2.0""",
         author=list(map(str.strip, """Ryan Ly""".split(','))),
         contact=list(map(str.strip, """rly@lbl.gov""".split(',')))
     )
 
     ns_builder.include_type('NWBDataInterface', namespace='core')
+    ns_builder.include_type('DynamicTableRegion', namespace='hdmf-common')
 
     data = NWBDatasetSpec(
         name='data',
-        doc='The average current source density aligned to a particular event, in volts/meters^2.',
-        dtype='float32',
+        doc=('The average current source density aligned to a particular event, in volts/meters^2. If '
+             'rel_electrode_coordinates is present, the second dimension is the sites in that dataset. data is '
+             'float32, or int16 or int8 quantized data, whose values in volts/meters^2 are data * conversion + '
+             'offset.'),
+        dtype='numeric',
         dims=(
             ('num_times', 'num_electrodes_x'),
             ('num_times', 'num_electrodes_x', 'num_electrodes_y'),
@@ -37,6 +41,20 @@ def main():
                 doc="Unit of measurement for data, which is fixed to 'volts/meters^2'.",
                 dtype='text',
                 value='volts/meters^2'
+            ),
+            NWBAttributeSpec(
+                name='conversion',
+                doc=('Scale of quantized data: its values in volts/meters^2 are data * conversion + offset. '
+                     'Defaults to 1.0 if offset is present.'),
+                dtype='float32',
+                required=False
+            ),
+            NWBAttributeSpec(
+                name='offset',
+                doc=('Offset of quantized data: its values in volts/meters^2 are data * conversion + offset. '
+                     'Defaults to 0.0 if conversion is present.'),
+                dtype='float32',
+                required=False
             )
         ]
     )
@@ -111,6 +129,259 @@ def main():
         attributes=[locs_unit],
     )
 
+    rel_electrode_coordinates = NWBDatasetSpec(
+        name='rel_electrode_coordinates',
+        doc=("Coordinates of each CSD site, relative to a 'reference_frame', in meters, for sites that do not lie on a "
+             "grid, e.g., of probes with staggered layouts or of 3D reconstructions. If present, data has shape "
+             "(num_times, num_sites) and rel_electrode_locations_x/y/z are absent."),
+        dtype='float32',
+        dims=(
+            ('num_sites', 'x'),
+            ('num_sites', 'x, y'),
+            ('num_sites', 'x, y, z')
+        ),
+        shape=(
+            (None, 1),
+            (None, 2),
+            (None, 3)
+        ),
+        quantity='?',
+        attributes=[locs_unit],
+    )
+
+    frequency_band = NWBAttributeSpec(
+        name='frequency_band',
+        doc='Lower and upper edge, in Hz, of the frequency band that the CSD was filtered to.',
+        dtype='float32',
+        dims=('low_high', ),
+        shape=(2, ),
+        required=False
+    )
+
+    data_pyramid = NWBDatasetSpec(
+        name='data_pyramid',
+        doc=('Multi-resolution pyramid of data along the time axis, for zoomed-out visualization. Level k holds the '
+             'minimum, maximum and mean of consecutive bins of decimation_factor^k time points, for k = 1, 2, .... '
+             'The levels are concatenated along the first dimension, and the statistics are along the second '
+             'dimension, in the order minimum, maximum, mean.'),
+        dtype='float32',
+        dims=(
+            ('num_pyramid_samples', 'min, max, mean', 'num_electrodes_x'),
+            ('num_pyramid_samples', 'min, max, mean', 'num_electrodes_x', 'num_electrodes_y'),
+            ('num_pyramid_samples', 'min, max, mean', 'num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+        ),
+        shape=(
+            (None, 3, None),
+            (None, 3, None, None),
+            (None, 3, None, None, None)
+        ),
+        quantity='?',
+        attributes=[
+            NWBAttributeSpec(
+                name='unit',
+                doc="Unit of measurement for data_pyramid, which is fixed to 'volts/meters^2'.",
+                dtype='text',
+                value='volts/meters^2'
+            ),
+            NWBAttributeSpec(
+                name='decimation_factor',
+                doc='Number of bins of each level that are combined into one bin of the next level.',
+                dtype='uint32'
+            ),
+            NWBAttributeSpec(
+                name='level_offsets',
+                doc=('Index of the first bin of each level along the first dimension, followed by the total number '
+                     'of bins.'),
+                dtype='uint64',
+                dims=('num_levels_plus_one', ),
+                shape=(None, )
+            ),
+        ]
+    )
+
+    data_variance = NWBDatasetSpec(
+        name='data_variance',
+        doc=('Sample variance, with one delta degree of freedom, of the current source density of the trials in each '
+             'cell of data, in (volts/meters^2)^2.'),
+        dtype='float32',
+        dims=(
+            ('num_times', 'num_electrodes_x'),
+            ('num_times', 'num_electrodes_x', 'num_electrodes_y'),
+            ('num_times', 'num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+        ),
+        shape=(
+            (None, None),
+            (None, None, None),
+            (None, None, None, None)
+        ),
+        quantity='?',
+        attributes=[
+            NWBAttributeSpec(
+                name='unit',
+                doc="Unit of measurement for data_variance, which is fixed to '(volts/meters^2)^2'.",
+                dtype='text',
+                value='(volts/meters^2)^2'
+            )
+        ]
+    )
+
+    n_per_cell = NWBDatasetSpec(
+        name='n_per_cell',
+        doc=('Number of trials in each cell of data and data_variance, if it differs between cells, e.g., because '
+             'of missing values. If absent, every cell has num_trials trials.'),
+        dtype='uint32',
+        dims=(
+            ('num_times', 'num_electrodes_x'),
+            ('num_times', 'num_electrodes_x', 'num_electrodes_y'),
+            ('num_times', 'num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+        ),
+        shape=(
+            (None, None),
+            (None, None, None),
+            (None, None, None, None)
+        ),
+        quantity='?'
+    )
+
+    spatial_dims = (
+        ('num_electrodes_x', ),
+        ('num_electrodes_x', 'num_electrodes_y'),
+        ('num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+    )
+    spatial_shape = (
+        (None, ),
+        (None, None),
+        (None, None, None)
+    )
+    peak_time = 'Time from event of the peak, i.e., the first time point with the largest absolute value,'
+    summary = []
+    for name, statistic, unit in (('data_min', 'Minimum', 'volts/meters^2'),
+                                  ('data_max', 'Maximum', 'volts/meters^2'),
+                                  ('data_mean', 'Mean', 'volts/meters^2'),
+                                  ('data_peak_time', peak_time, 'seconds')):
+        doc = '%s of data over time at each electrode, in %s, for quality control without reading data.'
+        statistic_spec = NWBDatasetSpec(
+            name=name,
+            doc=doc % (statistic, unit),
+            dtype='float32',
+            dims=spatial_dims,
+            shape=spatial_shape,
+            quantity='?',
+            attributes=[
+                NWBAttributeSpec(
+                    name='unit',
+                    doc="Unit of measurement for %s, which is fixed to '%s'." % (name, unit),
+                    dtype='text',
+                    value=unit
+                )
+            ]
+        )
+        summary.append(statistic_spec)
+
+    set_data_variance = NWBDatasetSpec(
+        name='data_variance',
+        doc=('Sample variance, with one delta degree of freedom, of the current source density of the trials in each '
+             'cell of data, for each condition, in (volts/meters^2)^2.'),
+        dtype='float32',
+        dims=(
+            ('num_conditions', 'num_times', 'num_electrodes_x'),
+            ('num_conditions', 'num_times', 'num_electrodes_x', 'num_electrodes_y'),
+            ('num_conditions', 'num_times', 'num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+        ),
+        shape=(
+            (None, None, None),
+            (None, None, None, None),
+            (None, None, None, None, None)
+        ),
+        quantity='?',
+        attributes=[
+            NWBAttributeSpec(
+                name='unit',
+                doc="Unit of measurement for data_variance, which is fixed to '(volts/meters^2)^2'.",
+                dtype='text',
+                value='(volts/meters^2)^2'
+            )
+        ]
+    )
+
+    set_n_per_cell = NWBDatasetSpec(
+        name='n_per_cell',
+        doc=('Number of trials in each cell of data and data_variance, for each condition, if it differs between '
+             'cells. If absent, every cell of a condition has the num_trials of that condition.'),
+        dtype='uint32',
+        dims=(
+            ('num_conditions', 'num_times', 'num_electrodes_x'),
+            ('num_conditions', 'num_times', 'num_electrodes_x', 'num_electrodes_y'),
+            ('num_conditions', 'num_times', 'num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+        ),
+        shape=(
+            (None, None, None),
+            (None, None, None, None),
+            (None, None, None, None, None)
+        ),
+        quantity='?'
+    )
+
+    trial_data = NWBDatasetSpec(
+        name='trial_data',
+        doc=('The current source density of each trial aligned to the event, in volts/meters^2, of which data is the '
+             'average. Each chunk holds time points and electrodes of a single trial.'),
+        dtype='float32',
+        dims=(
+            ('num_trials', 'num_times', 'num_electrodes_x'),
+            ('num_trials', 'num_times', 'num_electrodes_x', 'num_electrodes_y'),
+            ('num_trials', 'num_times', 'num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+        ),
+        shape=(
+            (None, None, None),
+            (None, None, None, None),
+            (None, None, None, None, None)
+        ),
+        quantity='?',
+        attributes=[
+            NWBAttributeSpec(
+                name='unit',
+                doc="Unit of measurement for trial_data, which is fixed to 'volts/meters^2'.",
+                dtype='text',
+                value='volts/meters^2'
+            )
+        ]
+    )
+
+    trial_block_sums = NWBDatasetSpec(
+        name='trial_block_sums',
+        doc=('Sums of trial_data over consecutive blocks of block_size trials, so that the average of a subset of '
+             'trials reads the sums of the blocks that are mostly in the subset instead of all their trials.'),
+        dtype='float64',
+        dims=(
+            ('num_blocks', 'num_times', 'num_electrodes_x'),
+            ('num_blocks', 'num_times', 'num_electrodes_x', 'num_electrodes_y'),
+            ('num_blocks', 'num_times', 'num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+        ),
+        shape=(
+            (None, None, None),
+            (None, None, None, None),
+            (None, None, None, None, None)
+        ),
+        quantity='?',
+        attributes=[
+            NWBAttributeSpec(
+                name='block_size',
+                doc='Number of trials summed in each block. The last block may have fewer.',
+                dtype='uint32'
+            )
+        ]
+    )
+
+    trials = NWBDatasetSpec(
+        name='trials',
+        neurodata_type_inc='DynamicTableRegion',
+        doc='The row of the trials table of each trial in trial_data.',
+        dims=('num_trials', ),
+        shape=(None, ),
+        quantity='?'
+    )
+
     csd = NWBGroupSpec(
         neurodata_type_def='CSD',
         neurodata_type_inc='NWBDataInterface',
@@ -124,7 +395,7 @@ def main():
             NWBAttributeSpec(
                 name='num_trials',
                 doc='Number of trials used to compute the average CSD.',
-                dtype='uint8'
+                dtype='uint32'
             ),
             NWBAttributeSpec(
                 name='actual_electrodes',
@@ -141,12 +412,108 @@ def main():
                      "value should also describe what a positive value in each dimension represents, e.g., +x is "
                      "superior."),
                 dtype='text'
+            ),
+            frequency_band
+        ],
+        datasets=[data, time, rel_electrode_locations_x, rel_electrode_locations_y, rel_electrode_locations_z,
+                  rel_electrode_coordinates, data_pyramid, trial_data, trial_block_sums, trials, data_variance,
+                  n_per_cell] + summary
+    )
+
+    set_data = NWBDatasetSpec(
+        name='data',
+        doc=('The average current source density of each condition, aligned to the event of that condition, in '
+             'volts/meters^2. If rel_electrode_coordinates is present, the third dimension is the sites in that '
+             'dataset.'),
+        dtype='float32',
+        dims=(
+            ('num_conditions', 'num_times', 'num_electrodes_x'),
+            ('num_conditions', 'num_times', 'num_electrodes_x', 'num_electrodes_y'),
+            ('num_conditions', 'num_times', 'num_electrodes_x', 'num_electrodes_y', 'num_electrodes_z')
+        ),
+        shape=(
+            (None, None, None),
+            (None, None, None, None),
+            (None, None, None, None, None)
+        ),
+        attributes=[
+            NWBAttributeSpec(
+                name='unit',
+                doc="Unit of measurement for data, which is fixed to 'volts/meters^2'.",
+                dtype='text',
+                value='volts/meters^2'
             )
+        ]
+    )
+
+    set_time = NWBDatasetSpec(
+        name='time_from_event',
+        doc='Timestamps representing time from event onset, in seconds, shared by all conditions.',
+        dtype='float32',
+        dims=('num_times', ),
+        shape=(None, ),
+        attributes=[
+            NWBAttributeSpec(
+                name='unit',
+                doc="Unit of measurement for time_from_event, which is fixed to 'seconds'.",
+                dtype='text',
+                value='seconds'
+            )
+        ]
+    )
+
+    num_trials = NWBDatasetSpec(
+        name='num_trials',
+        doc='Number of trials used to compute the average CSD of each condition.',
+        dtype='uint32',
+        dims=('num_conditions', ),
+        shape=(None, ),
+    )
+
+    event_description = NWBDatasetSpec(
+        name='event_description',
+        doc=('Description of what a time value of 0 represents for each condition, i.e., what event the CSD of the '
+             'condition is aligned to.'),
+        dtype='text',
+        dims=('num_conditions', ),
+        shape=(None, ),
+    )
+
+    csd_set = NWBGroupSpec(
+        neurodata_type_def='CSDSet',
+        neurodata_type_inc='NWBDataInterface',
+        doc=('Results of a current source density (CSD) analysis for many conditions, e.g., stimuli, that share the '
+             'same time axis and electrode locations, stored in a single data array.'),
+        attributes=[
+            NWBAttributeSpec(
+                name='description',
+                doc='Description of the current source density analysis, including how it was computed.',
+                dtype='text'
+            ),
+            NWBAttributeSpec(
+                name='actual_electrodes',
+                doc=("Whether the electrode locations provided correspond to actual electrode locations as opposed to "
+                     "virtual electrode locations (where interpolation is used to compute the CSD at the virtual "
+                     "locations)."),
+                dtype='bool',
+                default_value=False
+            ),
+            NWBAttributeSpec(
+                name='electrodes_reference_frame',
+                doc=("Description of what an electrode location of 0 (or (0,0) or (0,0,0)) represents, e.g., most "
+                     "superior point of a linear probe, or most posterior and most left point of a 2D array. This "
+                     "value should also describe what a positive value in each dimension represents, e.g., +x is "
+                     "superior."),
+                dtype='text'
+            ),
+            frequency_band
         ],
-        datasets=[data, time, rel_electrode_locations_x, rel_electrode_locations_y, rel_electrode_locations_z]
+        datasets=[set_data, set_time, num_trials, event_description, rel_electrode_locations_x,
+                  rel_electrode_locations_y, rel_electrode_locations_z, rel_electrode_coordinates, set_data_variance,
+                  set_n_per_cell]
     )
 
-    new_data_types = [csd]
+    new_data_types = [csd, csd_set]
 
     # export the spec to yaml files in the spec folder
     output_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'spec'))